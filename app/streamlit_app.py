@@ -4,12 +4,20 @@ import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import streamlit as st
-from scripts.ingest_to_chromadb import ingest_to_chromadb
-from scripts.query_llm import query_llm
+from scripts.query_llm import stream_query_llm
+from scripts.resources import warmup_in_background
 
 st.set_page_config(page_title="Jazz Package Chatbot", layout="centered")
 st.title("Jazz Package Chatbot")
 
+@st.cache_resource(show_spinner=False)
+def load_resources():
+    # runs once per server process, not on every rerun; the model loads in
+    # the background so the page renders right away
+    return warmup_in_background()
+
+load_resources()
+
 st.sidebar.title("Options")
 option = st.sidebar.selectbox(
     "Select an action",
@@ -20,8 +28,13 @@ if option == "Ingest Packages":
     st.write("## Ingest or Update Jazz Packages")
     if st.button("Run Ingestion"):
         try:
-            ingest_to_chromadb()
-            st.success("Package data ingested and embeddings updated successfully!")
+            from scripts.ingest_pipeline import run_pipeline
+            # run_pipeline invalidates the collections it changed
+            stats = run_pipeline()
+            st.success(
+                "Package data ingested and embeddings updated successfully! "
+                f"(embeddings reused: {stats['reused']}, computed: {stats['computed']})"
+            )
         except Exception as e:
             st.error(f"Error during ingestion: {e}")
     st.info("This will (re)generate embeddings and update the ChromaDB vector store.")
@@ -47,9 +60,11 @@ elif option == "Chatbot":
 
     if send and user_input.strip():
         st.session_state.chat_history.append({'role': 'user', 'content': user_input})
-        with st.spinner("JazzBot is typing..."):
+        st.chat_message("user").write(user_input)
+        # render tokens as they arrive instead of waiting for the full answer
+        with st.chat_message("assistant"):
             try:
-                response = query_llm(user_input)
+                response = st.write_stream(stream_query_llm(user_input))
                 st.session_state.chat_history.append({'role': 'assistant', 'content': response})
             except Exception as e:
                 error_msg = f"Error during LLM query: {e}"
@@ -0,0 +1,131 @@
+# batch_encoder.py
+# Micro-batching scheduler for query embeddings: concurrent requests put
+# their query on a queue, one background thread collects them for a short
+# window (QUERY_BATCH_WINDOW_MS, up to QUERY_BATCH_SIZE queries), encodes them
+# in one model call and hands each caller its row. A query arriving at an idle
+# encoder is encoded right away, so single users do not wait for the window.
+# Batch sizes and queue waits are exported as histograms (instrumentation.py).
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from scripts.instrumentation import observe, record
+from scripts.resources import get_embedding_model
+
+_lock = threading.Lock()
+_encoder = None
+
+
+class BatchEncoder:
+    """
+    Model-like object whose encode() goes through the scheduler.
+
+    Args:
+        get_model (callable): Returns the embedding model (called from the scheduler thread)
+        max_batch (int): Most queries encoded in one call
+        window (float): Seconds to wait for more queries once the encoder is busy
+    """
+
+    def __init__(self, get_model, max_batch=32, window=0.005):
+        self.get_model = get_model
+        self.max_batch = max_batch
+        self.window = window
+        self.batches = 0
+        self.encoded = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._last_done = 0.0
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._thread_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="batch-encoder", daemon=True)
+                    self._thread.start()
+
+    def submit(self, text):
+        """Queue one text; returns a Future of its embedding"""
+        future = concurrent.futures.Future()
+        self._ensure_thread()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        """
+        Embed sentences like SentenceTransformer.encode. Lists that fill a
+        batch on their own skip the queue.
+        """
+        texts = [sentences] if isinstance(sentences, str) else list(sentences)
+        if len(texts) >= self.max_batch:
+            return self.get_model().encode(texts, batch_size=batch_size)
+        embeddings = np.stack([future.result() for future in [self.submit(text) for text in texts]])
+        return embeddings[0] if isinstance(sentences, str) else embeddings
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        first_enqueued = batch[0][2]
+        # idle encoder: take what is already queued, but do not wait
+        busy = first_enqueued - self._last_done < self.window
+        deadline = first_enqueued + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter() if busy else 0
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            start = time.perf_counter()
+            for _, _, enqueued in batch:
+                record("encode_queue_wait", start - enqueued)
+            observe("encode_batch_size", len(batch))
+            try:
+                embeddings = self.get_model().encode([text for text, _, _ in batch], batch_size=len(batch))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), embedding in zip(batch, embeddings):
+                    future.set_result(embedding)
+            self._last_done = time.perf_counter()
+            record("encode_batch", self._last_done - start, size=len(batch))
+            self.batches += 1
+            self.encoded += len(batch)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "encoded": self.encoded,
+            "mean_batch": self.encoded / self.batches if self.batches else 0.0,
+        }
+
+
+def query_batching_enabled():
+    return os.getenv("QUERY_BATCHING", "1") != "0"
+
+
+def get_batch_encoder():
+    """Return the shared BatchEncoder configured from the environment"""
+    global _encoder
+    if _encoder is None:
+        with _lock:
+            if _encoder is None:
+                _encoder = BatchEncoder(
+                    get_embedding_model,
+                    max_batch=int(os.getenv("QUERY_BATCH_SIZE", "32")),
+                    window=float(os.getenv("QUERY_BATCH_WINDOW_MS", "5")) / 1000,
+                )
+    return _encoder
+
+
+def get_query_encoder():
+    """Encoder for query embeddings: the batching scheduler, or the model itself with QUERY_BATCHING=0"""
+    return get_batch_encoder() if query_batching_enabled() else get_embedding_model()
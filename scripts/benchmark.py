@@ -0,0 +1,404 @@
+# benchmark.py
+# End-to-end latency benchmark for the RAG pipeline. Replays a query corpus
+# through query_llm against local stubs (mock LLM server, stub web search)
+# and reports per-stage p50/p95/p99 latency, throughput under concurrent
+# clients (threads, or asyncio tasks on aquery_llm with --async), import
+# (startup) time and cold vs warm start. Results are written as JSON so runs
+# can be compared across commits (--compare).
+#
+#   python scripts/benchmark.py --repeats 3 --clients 1,4,16
+#   python scripts/benchmark.py --async --clients 16 --no-cold
+#   python scripts/benchmark.py --startup-only
+import argparse
+import asyncio
+import compileall
+import concurrent.futures
+import contextlib
+import importlib
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.instrumentation import reset_samples, stage_samples
+
+DEFAULT_QUERIES = [
+    "weekly packages",
+    "give me 7 days packages details",
+    "monthly internet bundles under Rs 1000",
+    "packages with 5 GB data",
+    "daily call packages",
+    "what is the subscription code for weekly super plus",
+    "cheapest SMS bundle",
+    "latest jazz packages",
+    "unlimited night internet package",
+    "monthly packages with on-net minutes",
+]
+# modules that must not be loaded just by importing the query path
+HEAVY_MODULES = ("torch", "sentence_transformers", "chromadb", "ddgs", "httpx", "requests", "dotenv")
+
+
+def percentiles(values):
+    """count, mean and nearest-rank p50/p95/p99/max of durations, in milliseconds"""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered) * 1000,
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "max": ordered[-1] * 1000,
+    }
+
+
+def summarize(samples):
+    return {stage: percentiles(values) for stage, values in sorted(samples.items())}
+
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """Silence the pipeline's diagnostic prints"""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def load_queries(path=None):
+    if not path:
+        return list(DEFAULT_QUERIES)
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        return [line.strip() for line in f if line.strip()]
+
+
+def configure_stubs(args):
+    """Point the pipeline at the local stubs; returns the mock server (or None)"""
+    server = None
+    if not args.real_llm:
+        from scripts.mock_llm_server import serve_in_background
+        server, base_url = serve_in_background(latency=args.llm_latency, token_latency=args.token_latency)
+        os.environ["LLM_PROVIDER"] = "mock"
+        os.environ["LLM_BASE_URL"] = base_url
+    if not args.real_web:
+        os.environ["WEB_SEARCH_BACKEND"] = "stub"
+        os.environ["WEB_SEARCH_STUB_LATENCY"] = str(args.web_latency)
+    if not args.with_cache:
+        # measure the full pipeline, not cache hits
+        os.environ["RESPONSE_CACHE"] = "0"
+        if args.use_async:
+            # aquery_llm only searches speculatively with the web search cache on;
+            # a zero TTL keeps it on without ever serving a cached search
+            os.environ["WEB_SEARCH_CACHE"] = "1"
+            os.environ["WEB_SEARCH_CACHE_TTL"] = "0"
+            os.environ["WEB_SEARCH_CACHE_STALE_TTL"] = "0"
+            os.environ.pop("WEB_SEARCH_CACHE_PATH", None)
+        else:
+            os.environ["WEB_SEARCH_CACHE"] = "0"
+    return server
+
+
+def speculation_enabled(args):
+    """True if the --async throughput runs exercise the speculative web search"""
+    from scripts.web_search_cache import web_search_cache_enabled
+    return args.use_async and web_search_cache_enabled()
+
+
+def startup_probe():
+    """Run in a fresh process: time the import of the query path"""
+    start = time.perf_counter()
+    with quiet():
+        importlib.import_module("scripts.query_llm")
+    import_seconds = time.perf_counter() - start
+    print(json.dumps({
+        "import_ms": import_seconds * 1000,
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+    }))
+
+
+def run_startup(repeats=5):
+    """
+    Import time of scripts.query_llm over `repeats` fresh processes, after
+    precompiling the bytecode so the first run does not pay for it
+    """
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for directory in ("scripts", "app"):
+        compileall.compile_dir(os.path.join(project_root, directory), quiet=1)
+    imports, processes, heavy = [], [], set()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--startup-probe"],
+            capture_output=True, text=True, env=os.environ.copy()
+        )
+        processes.append(time.perf_counter() - start)
+        if completed.returncode != 0:
+            return {"error": completed.stderr.strip()[-2000:]}
+        probe = json.loads(completed.stdout.strip().splitlines()[-1])
+        imports.append(probe["import_ms"] / 1000)
+        heavy.update(probe["heavy_modules"])
+    return {"import": percentiles(imports), "process": percentiles(processes), "heavy_modules": sorted(heavy)}
+
+
+def cold_probe(query):
+    """Run in a fresh process: import, first query, second query"""
+    start = time.perf_counter()
+    with quiet():
+        from scripts.query_llm import query_llm
+    import_seconds = time.perf_counter() - start
+    with quiet():
+        start = time.perf_counter()
+        query_llm(query)
+        first_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        query_llm(query)
+        second_seconds = time.perf_counter() - start
+    print(json.dumps({
+        "import_ms": import_seconds * 1000,
+        "first_query_ms": first_seconds * 1000,
+        "warm_query_ms": second_seconds * 1000,
+        "stages": summarize(stage_samples()),
+    }))
+
+
+def run_cold_start(query):
+    """Cold vs warm start, measured in a subprocess that shares this process's stub settings"""
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--cold-probe", query],
+        capture_output=True, text=True, env=os.environ.copy()
+    )
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip()[-2000:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_warm(queries, repeats, verbose=False):
+    """Replay the corpus sequentially in this (warmed-up) process; per-stage percentiles"""
+    from scripts.query_llm import query_llm
+    reset_samples()
+    with quiet(not verbose):
+        for _ in range(repeats):
+            for query in queries:
+                query_llm(query)
+    return summarize(stage_samples())
+
+
+def run_concurrent(queries, clients, repeats, verbose=False):
+    """Throughput and end-to-end latency with `clients` concurrent callers"""
+    from scripts.query_llm import query_llm
+    work = [query for _ in range(repeats) for query in queries]
+    latencies = []
+    errors = 0
+
+    def call(query):
+        start = time.perf_counter()
+        answer = query_llm(query)
+        return time.perf_counter() - start, isinstance(answer, str) and answer.startswith("Error")
+
+    with quiet(not verbose):
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=clients) as executor:
+            for seconds, failed in executor.map(call, work):
+                latencies.append(seconds)
+                errors += failed
+        wall = time.perf_counter() - start
+    return {
+        "clients": clients,
+        "mode": "threads",
+        "requests": len(work),
+        "errors": errors,
+        "seconds": wall,
+        "throughput_rps": len(work) / wall if wall else 0.0,
+        "latency": percentiles(latencies),
+    }
+
+
+def run_concurrent_async(queries, clients, repeats, verbose=False):
+    """run_concurrent for aquery_llm: `clients` concurrent tasks on one event loop"""
+    from scripts.query_llm import aquery_llm
+    work = [query for _ in range(repeats) for query in queries]
+
+    async def run_all():
+        semaphore = asyncio.Semaphore(clients)
+
+        async def call(query):
+            async with semaphore:
+                start = time.perf_counter()
+                answer = await aquery_llm(query)
+                return time.perf_counter() - start, isinstance(answer, str) and answer.startswith("Error")
+
+        return await asyncio.gather(*(call(query) for query in work))
+
+    with quiet(not verbose):
+        start = time.perf_counter()
+        calls = asyncio.run(run_all())
+        wall = time.perf_counter() - start
+    return {
+        "clients": clients,
+        "mode": "async",
+        "requests": len(work),
+        "errors": sum(failed for _, failed in calls),
+        "seconds": wall,
+        "throughput_rps": len(work) / wall if wall else 0.0,
+        "latency": percentiles([seconds for seconds, _ in calls]),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(previous_path, current):
+    """Print the p50/p95 change of every stage against an earlier result file"""
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous_path} (commit {previous.get('commit')}):")
+    print(f"{'stage':<18}{'p50 ms':>12}{'change':>10}{'p95 ms':>12}{'change':>10}")
+    for stage, stats in current["warm"].items():
+        before = previous.get("warm", {}).get(stage)
+        if not before or not stats.get("count") or not before.get("count"):
+            continue
+        changes = [(stats[p] - before[p]) / before[p] * 100 if before[p] else 0.0 for p in ("p50", "p95")]
+        print(f"{stage:<18}{stats['p50']:>12.1f}{changes[0]:>+9.1f}%{stats['p95']:>12.1f}{changes[1]:>+9.1f}%")
+
+
+def print_startup(startup):
+    print(
+        f"Startup: import p50 {startup['import']['p50']:.0f} ms, process p50 {startup['process']['p50']:.0f} ms, "
+        f"heavy modules loaded: {', '.join(startup['heavy_modules']) or 'none'}"
+    )
+
+
+def print_report(result):
+    print(f"\nPer-stage latency (ms), {result['config']['repeats']} x {len(result['queries'])} queries:")
+    print(f"{'stage':<18}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for stage, stats in result["warm"].items():
+        if stats.get("count"):
+            print(f"{stage:<18}{stats['count']:>7}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}")
+    if any(run.get("mode") == "async" for run in result["throughput"]):
+        speculative = result["config"].get("speculative_web_search")
+        print(f"Speculative web search: {'on' if speculative else 'off (WEB_SEARCH_CACHE=0)'}")
+    for run in result["throughput"]:
+        print(
+            f"{run['clients']:>3} clients ({run.get('mode', 'threads')}): {run['throughput_rps']:.2f} req/s, "
+            f"p50 {run['latency'].get('p50', 0):.1f} ms, p95 {run['latency'].get('p95', 0):.1f} ms, "
+            f"errors {run['errors']}"
+        )
+    startup = result.get("startup")
+    if startup and "error" not in startup:
+        print_startup(startup)
+    cold = result.get("cold_start")
+    if cold and "error" not in cold:
+        print(
+            f"Cold start: import {cold['import_ms']:.0f} ms, first query {cold['first_query_ms']:.0f} ms, "
+            f"warm query {cold['warm_query_ms']:.0f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RAG pipeline against local stubs")
+    parser.add_argument("--queries", help="query corpus: .json list or one query per line")
+    parser.add_argument("--repeats", type=int, default=3, help="passes over the corpus")
+    parser.add_argument("--clients", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="mock LLM seconds to first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="mock LLM seconds per token")
+    parser.add_argument("--web-latency", type=float, default=0.3, help="stub web search seconds per site query")
+    parser.add_argument("--real-llm", action="store_true", help="call the configured LLM provider")
+    parser.add_argument("--real-web", action="store_true", help="run real DuckDuckGo searches")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="measure throughput with asyncio tasks on aquery_llm instead of threads")
+    parser.add_argument("--with-cache", action="store_true", help="keep the response and web search caches on")
+    parser.add_argument("--no-cold", action="store_true", help="skip the startup and cold start subprocesses")
+    parser.add_argument("--startup-only", action="store_true", help="only measure the import time of the query path")
+    parser.add_argument("--output", help="result JSON (default: data/benchmarks/<commit>_<time>.json)")
+    parser.add_argument("--compare", help="earlier result JSON to compare with")
+    parser.add_argument("--verbose", action="store_true", help="show the pipeline output")
+    parser.add_argument("--cold-probe", help=argparse.SUPPRESS)
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_probe:
+        cold_probe(args.cold_probe)
+        return
+    if args.startup_probe:
+        startup_probe()
+        return
+    if args.startup_only:
+        startup = run_startup(args.repeats)
+        if "error" in startup:
+            print(startup["error"])
+            sys.exit(1)
+        print_startup(startup)
+        return
+
+    queries = load_queries(args.queries)
+    server = configure_stubs(args)
+    try:
+        result = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "config": {
+                "repeats": args.repeats,
+                "llm": "real" if args.real_llm else {"latency": args.llm_latency, "token_latency": args.token_latency},
+                "web": "real" if args.real_web else {"latency": args.web_latency},
+                "caches": args.with_cache,
+                "speculative_web_search": speculation_enabled(args),
+                "retrieval_backend": os.getenv("RETRIEVAL_BACKEND", "chroma"),
+            },
+            "queries": queries,
+        }
+        if not args.no_cold:
+            print("Measuring startup...")
+            result["startup"] = run_startup(args.repeats)
+            print("Measuring cold start...")
+            result["cold_start"] = run_cold_start(queries[0])
+
+        from scripts.resources import warmup
+        with quiet(not args.verbose):
+            warmup()
+        print("Measuring per-stage latency...")
+        result["warm"] = run_warm(queries, args.repeats, args.verbose)
+        result["throughput"] = []
+        for clients in [int(c) for c in args.clients.split(",") if c.strip()]:
+            print(f"Measuring throughput with {clients} clients...")
+            run = run_concurrent_async if args.use_async else run_concurrent
+            result["throughput"].append(run(queries, clients, args.repeats, args.verbose))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "benchmarks",
+        f"{result['commit'] or 'run'}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    print_report(result)
+    if args.compare:
+        compare(args.compare, result)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
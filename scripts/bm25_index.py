@@ -0,0 +1,200 @@
+# bm25_index.py
+# In-process BM25 inverted index over the same texts ingestion renders, so exact
+# activation codes ("*159#"), prices ("Rs. 210") and package names rank well.
+# Built at ingestion time and persisted as data/bm25_index.json.
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from scripts.embedding_cache import document_ids
+from scripts.resources import get_project_root, register_invalidation_hook
+
+# activation codes, numbers (with decimals) and words
+TOKEN_PATTERN = re.compile(r"\*[\d*]+#|\d+(?:\.\d+)?|[a-z]+")
+
+_lock = threading.Lock()
+_index = None
+_index_loaded = False
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def get_bm25_path():
+    return os.path.join(get_project_root(), "data", "bm25_index.json")
+
+
+class BM25Index:
+    """Okapi BM25 over documents from several collections"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.documents = []
+        self.sources = []
+        self.doc_lengths = []
+        self.postings = {}
+        self._idf = {}
+        self._avg_length = 0.0
+
+    def add_collection(self, collection_name, texts):
+        """Index texts of a collection under the same IDs ChromaDB uses"""
+        for doc_id, text in zip(document_ids(collection_name, texts), texts):
+            doc = len(self.ids)
+            self.ids.append(doc_id)
+            self.documents.append(text)
+            self.sources.append(collection_name)
+            tokens = tokenize(text)
+            self.doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings.setdefault(term, []).append([doc, tf])
+        self._prepare()
+
+    def _prepare(self):
+        n = len(self.ids)
+        self._avg_length = sum(self.doc_lengths) / n if n else 0.0
+        self._idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    def search(self, query, n_results=10, collections=None):
+        """
+        Top-n documents per collection for a query.
+
+        Returns:
+            dict: collection name -> ChromaDB-shaped result for one query, with
+                  BM25 "scores" (higher is better) instead of distances
+        """
+        scores = Counter()
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc, tf in self.postings[term]:
+                norm = 1 - self.b + self.b * self.doc_lengths[doc] / (self._avg_length or 1.0)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+        per_collection = {}
+        for doc, score in scores.most_common():
+            name = self.sources[doc]
+            if collections is not None and name not in collections:
+                continue
+            hits = per_collection.setdefault(name, [])
+            if len(hits) < n_results:
+                hits.append((doc, score))
+
+        return {
+            name: {
+                "ids": [[self.ids[doc] for doc, _ in hits]],
+                "documents": [[self.documents[doc] for doc, _ in hits]],
+                "metadatas": [[{"text": self.documents[doc], "source": name} for doc, _ in hits]],
+                "scores": [[score for _, score in hits]],
+            }
+            for name, hits in per_collection.items()
+        }
+
+    def save(self, path):
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "documents": self.documents,
+            "sources": self.sources,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.ids = data["ids"]
+        index.documents = data["documents"]
+        index.sources = data["sources"]
+        index.doc_lengths = data["doc_lengths"]
+        index.postings = data["postings"]
+        index._prepare()
+        return index
+
+
+def build_bm25_index(sources, data_dir=None, path=None):
+    """
+    Build the index from the source JSON files (rendered with the same
+    text functions as the embeddings) and persist it.
+
+    Args:
+        sources (list): Entries of ingest_to_chromadb.SOURCES
+    """
+    data_dir = data_dir or os.path.join(get_project_root(), "data")
+    path = path or get_bm25_path()
+    index = BM25Index()
+    for source in sources:
+        json_path = os.path.join(data_dir, source["json_file"])
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+        except Exception as e:
+            print(f"BM25: skipping {json_path}: {e}")
+            continue
+        index.add_collection(source["collection"], [source["text_fn"](item) for item in items])
+    index.save(path)
+    print(f"BM25 index with {len(index.ids)} documents saved to {path}")
+    # the next query loads the new index
+    _reset_index()
+    return index
+
+
+def get_bm25_index():
+    """Return the shared BM25 index, or None if it has not been built"""
+    global _index, _index_loaded
+    if not _index_loaded:
+        with _lock:
+            if not _index_loaded:
+                path = get_bm25_path()
+                if os.path.exists(path):
+                    try:
+                        _index = BM25Index.load(path)
+                    except Exception as e:
+                        print(f"Could not load BM25 index {path}: {str(e)}")
+                _index_loaded = True
+    return _index
+
+
+def hybrid_search_enabled():
+    return os.getenv("HYBRID_SEARCH", "1") != "0"
+
+
+def hybrid_fusion():
+    """Fusion method for combine_and_rank_results: rrf (default) or weighted"""
+    return os.getenv("HYBRID_FUSION", "rrf").lower()
+
+
+def lexical_search(query, collections, n_results=10):
+    """BM25 results per collection as a list, or None when hybrid search is off or unavailable"""
+    if not hybrid_search_enabled():
+        return None
+    index = get_bm25_index()
+    if index is None:
+        return None
+    return list(index.search(query, n_results, collections).values())
+
+
+def _reset_index(collection_name=None):
+    global _index, _index_loaded
+    with _lock:
+        _index = None
+        _index_loaded = False
+
+
+register_invalidation_hook(_reset_index)
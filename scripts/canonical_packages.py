@@ -0,0 +1,214 @@
+# canonical_packages.py
+# Ingestion-time entity resolution: the same package appears in several
+# sources with different text. Near-duplicates are clustered by embedding
+# similarity and compatible attributes into data/canonical_packages.json, and
+# the query path keeps one hit per canonical package.
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from scripts.embedding_cache import document_ids, encode_with_cache
+from scripts.package_attributes import NUMERIC_ATTRIBUTES, text_attributes
+from scripts.resources import get_embedding_model, get_project_root, register_invalidation_hook
+
+# cosine similarity above which two packages with compatible attributes are merged
+SIMILARITY_THRESHOLD = 0.92
+# lower bar when the normalized package names are identical
+SAME_NAME_THRESHOLD = 0.8
+
+_lock = threading.Lock()
+_mapping = None
+_mapping_loaded = False
+
+
+def get_canonical_path():
+    return os.path.join(get_project_root(), "data", "canonical_packages.json")
+
+
+def package_name(text):
+    """Normalized package name: the rendered text up to the first '. '"""
+    return re.sub(r"[^a-z0-9]+", " ", text.split(". ", 1)[0].lower()).strip()
+
+
+def attributes_compatible(a, b):
+    """Attributes known for both packages must agree (prices within 1%)"""
+    for name in NUMERIC_ATTRIBUTES:
+        if name in a and name in b:
+            if name == "price_rs":
+                if abs(a[name] - b[name]) > 0.01 * max(a[name], b[name]):
+                    return False
+            elif a[name] != b[name]:
+                return False
+    return True
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def cluster_packages(embeddings, texts, threshold=SIMILARITY_THRESHOLD):
+    """
+    Group near-duplicate packages.
+
+    Returns:
+        list: clusters as lists of row indices, in order of first appearance
+    """
+    n = len(texts)
+    if n == 0:
+        return []
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = matrix / norms
+    similarity = matrix @ matrix.T
+
+    names = [package_name(text) for text in texts]
+    attributes = [text_attributes(text) for text in texts]
+    parent = list(range(n))
+    rows, cols = np.nonzero(np.triu(similarity >= min(threshold, SAME_NAME_THRESHOLD), k=1))
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        bar = SAME_NAME_THRESHOLD if names[i] and names[i] == names[j] else threshold
+        if similarity[i, j] >= bar and attributes_compatible(attributes[i], attributes[j]):
+            root_i, root_j = _find(parent, i), _find(parent, j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    clusters = {}
+    for i in range(n):
+        clusters.setdefault(_find(parent, i), []).append(i)
+    return list(clusters.values())
+
+
+def build_canonical_table(sources, cache, data_dir=None, path=None, threshold=SIMILARITY_THRESHOLD):
+    """
+    Cluster every package of every source and write the canonical table.
+    Embeddings come from the ingestion embedding cache, so normally nothing
+    is encoded here.
+
+    Args:
+        sources (list): Entries of ingest_to_chromadb.SOURCES, in priority order
+        cache (EmbeddingCache): Embedding cache filled by ingestion
+
+    Returns:
+        dict: {"packages": [...], "documents": {document ID: canonical ID}}
+    """
+    data_dir = data_dir or os.path.join(get_project_root(), "data")
+    path = path or get_canonical_path()
+    ids, texts, collections = [], [], []
+    for source in sources:
+        json_path = os.path.join(data_dir, source["json_file"])
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+        except Exception as e:
+            print(f"Canonical table: skipping {json_path}: {e}")
+            continue
+        source_texts = [source["text_fn"](item) for item in items]
+        ids.extend(document_ids(source["collection"], source_texts))
+        texts.extend(source_texts)
+        collections.extend([source["collection"]] * len(source_texts))
+
+    embeddings, _, computed = encode_with_cache(texts, cache, get_embedding_model)
+    if computed:
+        cache.save()
+
+    packages = []
+    documents = {}
+    for number, rows in enumerate(cluster_packages(embeddings, texts, threshold), 1):
+        canonical_id = f"pkg_{number:05d}"
+        # earlier sources win for the merged attributes and representative text
+        merged = {}
+        for i in rows:
+            for name, value in text_attributes(texts[i]).items():
+                merged.setdefault(name, value)
+        packages.append({
+            "canonical_id": canonical_id,
+            "name": package_name(texts[rows[0]]),
+            "text": texts[rows[0]],
+            "attributes": merged,
+            "members": [{"id": ids[i], "collection": collections[i], "text": texts[i]} for i in rows],
+        })
+        for i in rows:
+            documents[ids[i]] = canonical_id
+
+    table = {"packages": packages, "documents": documents}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    print(f"Canonical table: {len(texts)} documents -> {len(packages)} packages, saved to {path}")
+    # the next query loads the new table
+    _reset_mapping()
+    return table
+
+
+def get_canonical_mapping():
+    """Return {document ID: canonical ID}, or None if the table has not been built"""
+    global _mapping, _mapping_loaded
+    if not _mapping_loaded:
+        with _lock:
+            if not _mapping_loaded:
+                path = get_canonical_path()
+                if os.path.exists(path):
+                    try:
+                        with open(path, "r", encoding="utf-8") as f:
+                            _mapping = json.load(f)["documents"]
+                    except Exception as e:
+                        print(f"Could not load canonical table {path}: {str(e)}")
+                _mapping_loaded = True
+    return _mapping
+
+
+def dedup_enabled():
+    return os.getenv("DEDUP_RESULTS", "1") != "0"
+
+
+def collapse_duplicates(combined_results):
+    """
+    Keep the best-ranked hit of every canonical package in a combined result
+    (see combine_and_rank_results). The kept hit's metadata lists the other
+    sources under "also_in".
+    """
+    mapping = get_canonical_mapping() if dedup_enabled() else None
+    if not mapping:
+        return combined_results
+
+    ids = combined_results["ids"]
+    kept = {}
+    rows = []
+    metadatas = []
+    for i, doc_id in enumerate(ids):
+        metadata = combined_results["metadatas"][i] or {}
+        # results without an ID are always kept
+        canonical_id = mapping.get(doc_id, doc_id) if doc_id is not None else ("row", i)
+        if canonical_id not in kept:
+            kept[canonical_id] = len(rows)
+            rows.append(i)
+            metadatas.append(dict(metadata))
+            continue
+        first = metadatas[kept[canonical_id]]
+        source = metadata.get("source")
+        if source and source != first.get("source") and source not in first.get("also_in", []):
+            first.setdefault("also_in", []).append(source)
+
+    if len(rows) < len(ids):
+        print(f"Collapsed {len(ids)} hits into {len(rows)} packages")
+    collapsed = {key: [values[i] for i in rows] for key, values in combined_results.items()}
+    collapsed["metadatas"] = metadatas
+    return collapsed
+
+
+def _reset_mapping(collection_name=None):
+    global _mapping, _mapping_loaded
+    with _lock:
+        _mapping = None
+        _mapping_loaded = False
+
+
+register_invalidation_hook(_reset_mapping)
@@ -1,69 +1,85 @@
 import os
-import chromadb
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import numpy as np
 import json
-
-def get_project_root():
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    markers = ['requirements.txt', 'README.MD']
-    while current_dir != os.path.dirname(current_dir):
-        if any(os.path.exists(os.path.join(current_dir, marker)) for marker in markers):
-            return current_dir
-        current_dir = os.path.dirname(current_dir)
-    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+from scripts.embedding_cache import document_ids
+from scripts.ingest_pipeline import (
+    delete_stale_documents, existing_document_ids, invalidate_collection, upsert_documents
+)
+from scripts.resources import get_chroma_client, get_project_root
 
 
 project_root = get_project_root()
 chroma_path = os.path.join(project_root, "data", "chroma_db")
-client = chromadb.PersistentClient(path=chroma_path)
 
-def ingest_collection(collection_name, embedding_file, text_file):
-    """Generalized function to ingest data into a ChromaDB collection"""
+def ingest_collection(collection_name, embedding_file, text_file, batch_size=256, force=False):
+    """
+    Generalized function to ingest data into a ChromaDB collection.
+    Idempotent: documents get content-derived IDs, only new ones are upserted
+    (in chunks of batch_size) and documents that disappeared from the source
+    are deleted, so a live store can be refreshed in place.
+
+    Args:
+        force (bool): Upsert every document, e.g. after changing the embedding model
+    """
     try:
         embeddings = np.load(embedding_file)
         with open(text_file, "r", encoding="utf-8") as f:
             texts = json.load(f)
 
-        collection = client.get_or_create_collection(name=collection_name)
-        ids = [f"{collection_name}_{i}" for i in range(len(texts))]
-        metadatas = [{"text": text, "source": collection_name} for text in texts]
+        collection = get_chroma_client(chroma_path).get_or_create_collection(name=collection_name)
+        ids = document_ids(collection_name, texts)
 
-        collection.add(
-            embeddings=embeddings,
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
+        existing_ids = existing_document_ids(collection)
+
+        # Upsert new (or, with force, all) packages in chunks
+        rows = [i for i, doc_id in enumerate(ids) if force or doc_id not in existing_ids]
+        upsert_documents(
+            collection, collection_name,
+            [ids[i] for i in rows],
+            [texts[i] for i in rows],
+            embeddings[rows],
+            batch_size
+        )
+        # Remove packages that are no longer in the source, once the new ones are in
+        deleted = delete_stale_documents(collection, ids, existing_ids, batch_size)
+        print(
+            f"Ingested {len(texts)} documents into collection '{collection_name}' "
+            f"(upserted: {len(rows)}, deleted: {deleted}, unchanged: {len(texts) - len(rows)})"
         )
-        print(f"Ingested {len(texts)} documents into collection '{collection_name}'")
+        # let warm handles and caches in this process pick up the new data
+        if rows or deleted:
+            invalidate_collection(collection_name, chroma_path)
         return True
     except Exception as e:
         print(f"Error ingesting {collection_name}: {str(e)}")
         return False
 
 
-# collections for dummy data
-print("=== Ingesting Dummy Data Collections ===")
-ingest_collection(
-    collection_name="jazz_packages",
-    embedding_file=os.path.join(project_root, "data", "jazz_package_embeddings.npy"),
-    text_file=os.path.join(project_root, "data", "jazz_package_texts.json")
-)
-# collections for scrape ProPakistani data
-print("=== Ingesting ProPakistani Data Collections ===")
-ingest_collection(
-    collection_name="propakistani_packages",
-    embedding_file=os.path.join(project_root,"data", "propakistani_package_embeddings.npy"),
-    text_file=os.path.join(project_root, "data", "propakistani_package_texts.json")
-)
-# collections for OCR data
-print("=== Ingesting OCR Data Collections ===")
-ingest_collection(
-    collection_name="ocr_packages",
-    embedding_file=os.path.join(project_root, "data", "ocr_package_embeddings.npy"),
-    text_file=os.path.join(project_root, "data", "ocr_package_texts.json")
-)
-
-
-
+def main():
+    # collections for dummy data
+    print("=== Ingesting Dummy Data Collections ===")
+    ingest_collection(
+        collection_name="jazz_packages",
+        embedding_file=os.path.join(project_root, "data", "jazz_package_embeddings.npy"),
+        text_file=os.path.join(project_root, "data", "jazz_package_texts.json")
+    )
+    # collections for scrape ProPakistani data
+    print("=== Ingesting ProPakistani Data Collections ===")
+    ingest_collection(
+        collection_name="propakistani_packages",
+        embedding_file=os.path.join(project_root,"data", "propakistani_package_embeddings.npy"),
+        text_file=os.path.join(project_root, "data", "propakistani_package_texts.json")
+    )
+    # collections for OCR data
+    print("=== Ingesting OCR Data Collections ===")
+    ingest_collection(
+        collection_name="ocr_packages",
+        embedding_file=os.path.join(project_root, "data", "ocr_package_embeddings.npy"),
+        text_file=os.path.join(project_root, "data", "ocr_package_texts.json")
+    )
 
 
+if __name__ == "__main__":
+    main()
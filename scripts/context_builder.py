@@ -0,0 +1,192 @@
+# context_builder.py
+# Assembles the retrieved packages and web results into the LLM context under
+# a token budget: weak hits are cut by distance and score gap (lexical-only
+# hits by count), and every package becomes one compact fielded line instead
+# of its full text (descriptions included).
+import math
+import os
+import re
+
+from scripts.canonical_packages import package_name
+from scripts.package_attributes import text_attributes
+
+ACTIVATION_CODE = re.compile(r"\*[\d*]+#")
+# labelled fields of the rendered package texts (see ingest_to_chromadb.SOURCES)
+FIELD_LABEL = re.compile(
+    r"\b(price|validity|data|on-net|off-net|sms|activation code|subscription|category|description):\s*", re.I
+)
+FIELD_ORDER = ("price", "validity", "data", "on-net", "off-net", "sms", "activation code", "subscription", "category")
+AMOUNT = re.compile(r"(\d[\d,]*(?:\.\d+)?)")
+ZERO = re.compile(r"(?:rs\.?\s*)?0+(?:\.0+)?(?:\s*rs)?$", re.I)
+TOKEN_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Local token estimate: one token per punctuation mark and per ~4
+    characters of a word, close to BPE tokenizers on this kind of text.
+    """
+    return sum(math.ceil(len(piece) / 4) for piece in TOKEN_PIECES.findall(text))
+
+
+def context_settings():
+    """Budget and cutoffs from the environment"""
+    return {
+        "token_budget": int(os.getenv("CONTEXT_TOKEN_BUDGET", "800")),
+        # squared L2 between unit vectors, as reported by ChromaDB (0 = identical, 4 = opposite)
+        "max_distance": float(os.getenv("CONTEXT_MAX_DISTANCE", "1.3")),
+        "score_gap": float(os.getenv("CONTEXT_SCORE_GAP", "0.3")),
+        "max_lexical_only": int(os.getenv("CONTEXT_MAX_LEXICAL_ONLY", "2")),
+    }
+
+
+def _format_amount(value):
+    return f"{value:g}"
+
+
+def _compact_field(label, value):
+    """Compact form of one labelled field of a package text; None if it does not parse"""
+    if label in ("price", "validity", "data", "on-net"):
+        key = {"price": "price_rs", "validity": "validity_days", "data": "data_mb", "on-net": "onnet_mins"}[label]
+        amount = text_attributes(f"{label}: {value}").get(key)
+        if amount is None:
+            return None
+        if label == "price":
+            return f"Rs {_format_amount(amount)}"
+        if label == "validity":
+            return f"{amount} day" if amount == 1 else f"{amount} days"
+        if label == "data":
+            whole_gb = amount >= 1000 and amount % 1000 == 0
+            return f"{_format_amount(amount / 1000)} GB" if whole_gb else f"{_format_amount(amount)} MB"
+        return f"{_format_amount(amount)} on-net mins"
+    if label in ("off-net", "sms"):
+        match = AMOUNT.match(value)
+        if not match:
+            return None
+        amount = _format_amount(float(match.group(1).replace(",", "")))
+        return f"{amount} off-net mins" if label == "off-net" else f"{amount} SMS"
+    if label in ("activation code", "subscription"):
+        code = ACTIVATION_CODE.search(value)
+        return code.group(0) if code else value
+    # category and description are kept as they are
+    return value
+
+
+def compact_package_line(doc, metadata):
+    """
+    One line per package: name | price | validity | data | minutes | SMS | code
+    | category | description [source]. Texts without labelled fields, or with
+    a field that does not parse (e.g. "Validity: Unlimited"), are kept whole.
+    """
+    source = metadata.get("source", "Unknown")
+    if metadata.get("also_in"):
+        source += f", also in {', '.join(metadata['also_in'])}"
+    full_line = f"- {' '.join(doc.split())} [{source}]"
+
+    text = " ".join(doc.split())
+    name = text.split(". ", 1)[0].strip() or package_name(doc)
+    rest = text[len(name):].lstrip(". ")
+    labels = list(FIELD_LABEL.finditer(rest))
+    if not labels:
+        return full_line
+
+    # text before the first label is a free-text description (jazz_packages)
+    description = [rest[:labels[0].start()].strip(" .,;")]
+    fields = {}
+    for k, label in enumerate(labels):
+        end = labels[k + 1].start() if k + 1 < len(labels) else len(rest)
+        value = rest[label.end():end].strip(" .,;")
+        # N/A, and the price of 0 older scrapes stored when it did not parse
+        if not value or value.lower().startswith("n/a") or (label.group(1).lower() == "price" and ZERO.match(value)):
+            continue
+        field = _compact_field(label.group(1).lower(), value)
+        if field is None:
+            return full_line
+        if label.group(1).lower() == "description":
+            description.append(field)
+        else:
+            fields[label.group(1).lower()] = field
+
+    parts = [fields[label] for label in FIELD_ORDER if label in fields]
+    parts.extend(d for d in description if d)
+    if not parts:
+        return full_line
+    return f"- {name} | {' | '.join(parts)} [{source}]"
+
+
+def select_hits(combined_results, max_distance, score_gap, max_lexical_only=2):
+    """
+    Indices of the hits worth sending, in rank order: vector hits within
+    max_distance and no more than score_gap worse than the best hit, plus the
+    max_lexical_only best-ranked lexical-only hits (no distance to cut on).
+    """
+    distances = [d for d in combined_results["distances"] if d is not None]
+    best = min(distances) if distances else None
+    selected = []
+    lexical_only = 0
+    for i, distance in enumerate(combined_results["distances"]):
+        if distance is None:
+            if lexical_only < max_lexical_only:
+                lexical_only += 1
+                selected.append(i)
+        elif distance <= max_distance and distance - best <= score_gap:
+            selected.append(i)
+    return selected
+
+
+def compact_web_line(result):
+    title = result.get('title', 'No title')
+    snippet = ' '.join(result.get('body', '').split())
+    if len(snippet) > 200:
+        snippet = snippet[:200].rsplit(' ', 1)[0] + "..."
+    return f"- {title}: {snippet} [{result.get('source_type', 'Unknown source')}, {result.get('href', 'No URL')}]"
+
+
+def build_context(combined_results, bang_results=None, web_searched=False, token_budget=None,
+                  max_distance=None, score_gap=None, max_lexical_only=None):
+    """
+    Build the retrieved-information block of the prompt.
+
+    Database hits come first, in rank order; web results share what is left
+    of the budget but always get at least a third of it when searched.
+
+    Returns:
+        tuple: (context text, stats dict with hits, kept, web and tokens)
+    """
+    settings = context_settings()
+    token_budget = settings["token_budget"] if token_budget is None else token_budget
+    max_distance = settings["max_distance"] if max_distance is None else max_distance
+    score_gap = settings["score_gap"] if score_gap is None else score_gap
+    max_lexical_only = settings["max_lexical_only"] if max_lexical_only is None else max_lexical_only
+
+    database_budget = token_budget - (token_budget // 3 if web_searched else 0)
+    lines = []
+    used = 0
+    for i in select_hits(combined_results, max_distance, score_gap, max_lexical_only):
+        line = compact_package_line(combined_results["documents"][i], combined_results["metadatas"][i] or {})
+        cost = estimate_tokens(line)
+        if lines and used + cost > database_budget:
+            break
+        lines.append(line)
+        used += cost
+    kept = len(lines)
+
+    context = "Packages from our database:\n" + "\n".join(lines) if lines else "No matching packages in our database."
+    web_kept = 0
+    if web_searched:
+        web_lines = []
+        for result in bang_results or []:
+            line = compact_web_line(result)
+            cost = estimate_tokens(line)
+            if used + cost > token_budget:
+                break
+            web_lines.append(line)
+            used += cost
+        web_kept = len(web_lines)
+        if web_lines:
+            context += "\n\nLatest packages found online (verify on the official Jazz website):\n" + "\n".join(web_lines)
+        else:
+            context += "\n\nNo recent packages found online."
+
+    stats = {"hits": len(combined_results["documents"]), "kept": kept, "web": web_kept, "tokens": estimate_tokens(context)}
+    return context, stats
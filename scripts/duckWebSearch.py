@@ -1,12 +1,22 @@
 # ----- web search script -----
 # duckWebSearch.py
-from ddgs import DDGS
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import time
 
-import re
+from scripts.instrumentation import span
+from scripts.web_search_cache import get_web_search_cache, web_search_cache_enabled
+
+# filler words dropped from queries (web search, query embedding cache keys)
+QUERY_STOP_WORDS = ['tell', 'me', 'about', 'what', 'are', 'is', 'the', 'for']
 
 def search_jazz_with_bang(query, max_results=5):
     """
-    Search for Jazz packages using DuckDuckGo bang commands
+    Search for Jazz packages using DuckDuckGo bang commands.
+    Results are cached per cleaned query; identical concurrent searches share
+    one fetch and stale entries are served while they refresh in the background.
     
     Args:
         query (str): The user's search query
@@ -15,47 +25,109 @@ def search_jazz_with_bang(query, max_results=5):
     Returns:
         list: Search results with titles, snippets, and URLs
     """
+    if not web_search_cache_enabled():
+        return fetch_jazz_with_bang(query, max_results)
+    cache = get_web_search_cache()
+    results = cache.get_or_fetch(search_cache_key(query, max_results), lambda: fetch_jazz_with_bang(query, max_results))
+    print(f"Web search cache: {cache.stats()}")
+    return results
+
+async def asearch_jazz_with_bang(query, max_results=5):
+    """asyncio variant of search_jazz_with_bang, sharing its cache and in-flight searches"""
+    return await asyncio.to_thread(search_jazz_with_bang, query, max_results)
+
+def search_cache_key(query, max_results=5):
+    return f"{' '.join(clean_query_for_search(query).lower().split())}|{max_results}"
+
+def fetch_jazz_with_bang(query, max_results=5):
+    """
+    Uncached search: run the site queries concurrently, keeping their order in the results
+    """
+    site_queries = build_site_queries(query)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(site_queries)) as executor:
+        # each worker runs in a copy of the caller's context so its span joins the trace
+        futures = [
+            executor.submit(contextvars.copy_context().run, run_site_query, q, max_results)
+            for q in site_queries
+        ]
+        results_per_query = [future.result() for future in futures]
+
+    all_results = [result for results in results_per_query for result in results]
+    unique_results = remove_duplicate_results(all_results)
+    return unique_results[:max_results]
+
+def build_site_queries(query):
+    """
+    Build the site-restricted queries for a user query
+    """
     # Clean and enhance the query
     clean_query = clean_query_for_search(query)
     
     # Try multiple bang commands for comprehensive results
-    site_queries = [
+    return [
         f"site:jazz.com.pk {clean_query} package details",
         f"site:propakistani.pk {clean_query} jazz bundle",
         f"{clean_query} Jazz mobile internet plan Pakistan"
     ]
 
-    all_results = []
+def run_site_query(q, max_results=5):
+    """
+    Run one site query against DuckDuckGo, or the stub with WEB_SEARCH_BACKEND=stub
+    """
+    print(f"Searching with: {q}")
+    with span("web_search_query", source_type=determine_source_type(q)):
+        if os.getenv("WEB_SEARCH_BACKEND", "ddgs").lower() == "stub":
+            return stub_site_query(q, max_results)
+        return ddgs_site_query(q, max_results)
 
-    with DDGS() as ddgs:
-        for q in site_queries:
-            print(f"Searching with: {q}")
-            try:
-                results = ddgs.text(
-                    q,
-                    region='pk-en',
-                    safesearch='moderate',
-                    timelimit='y',
-                    max_results=max_results
-                )
-                for result in results:
-                    result['search_query'] = q
-                    result['source_type'] = determine_source_type(q)
-                all_results.extend(results)
-            except Exception as e:
-                print(f"Error with query '{q}': {e}")
-                continue
+def ddgs_site_query(q, max_results=5):
+    """
+    Run one DuckDuckGo text query; each call uses its own DDGS session so
+    queries can run on separate threads
+    """
+    # imported here: ddgs is only needed when a real web search runs
+    from ddgs import DDGS
+    try:
+        with DDGS() as ddgs:
+            results = ddgs.text(
+                q,
+                region='pk-en',
+                safesearch='moderate',
+                timelimit='y',
+                max_results=max_results
+            )
+        for result in results:
+            result['search_query'] = q
+            result['source_type'] = determine_source_type(q)
+        return results
+    except Exception as e:
+        print(f"Error with query '{q}': {e}")
+        return []
 
-    unique_results = remove_duplicate_results(all_results)
-    return unique_results[:max_results]
+def stub_site_query(q, max_results=5):
+    """
+    Offline stand-in for run_site_query (WEB_SEARCH_BACKEND=stub), used by the
+    benchmark. Sleeps WEB_SEARCH_STUB_LATENCY seconds and returns canned results.
+    """
+    time.sleep(float(os.getenv("WEB_SEARCH_STUB_LATENCY", "0.3")))
+    return [
+        {
+            'title': f"Jazz package result {i + 1}",
+            'body': f"Stub search result for '{q}': 10 GB data, 1000 on-net minutes, Rs. {200 + 50 * i}.",
+            'href': f"https://example.com/jazz/{abs(hash(q)) % 10000}/{i}",
+            'search_query': q,
+            'source_type': determine_source_type(q),
+        }
+        for i in range(max_results)
+    ]
 
 def clean_query_for_search(query):
     """
     Clean and optimize the query for better search results
     """
     # Remove unnecessary words
-    stop_words = ['tell', 'me', 'about', 'what', 'are', 'is', 'the', 'for']
-    query_words = [word for word in query.split() if word.lower() not in stop_words]
+    query_words = [word for word in query.split() if word.lower() not in QUERY_STOP_WORDS]
     
     # Add package-related terms if not present
     if not any(word in query.lower() for word in ['package', 'offer', 'bundle', 'deal', 'international', 'city']):
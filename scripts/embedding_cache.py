@@ -0,0 +1,169 @@
+# embedding_cache.py
+# Persistent embedding cache keyed by (model name, text hash), so ingestion
+# only encodes packages whose rendered text is new or changed.
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def document_ids(collection_name, texts):
+    """
+    Stable, content-derived document IDs: the same text always gets the same ID,
+    repeated texts within a source get an occurrence suffix.
+    """
+    seen = {}
+    ids = []
+    for text in texts:
+        base = f"{collection_name}_{text_hash(text)[:16]}"
+        count = seen.get(base, 0)
+        seen[base] = count + 1
+        ids.append(base if count == 0 else f"{base}_{count}")
+    return ids
+
+
+class EmbeddingCache:
+    """
+    Embeddings for one model, stored as data/embedding_cache/<model>.npy plus
+    a JSON index mapping text hash -> row. The saved matrix is memory-mapped
+    rather than read into memory; new embeddings go into a growing array and
+    save() writes the live rows back into one file.
+    """
+
+    def __init__(self, cache_dir, model_name):
+        self.model_name = model_name
+        safe_name = model_name.replace("/", "_")
+        self.matrix_path = os.path.join(cache_dir, f"{safe_name}.npy")
+        self.index_path = os.path.join(cache_dir, f"{safe_name}_index.json")
+        self._index = {}
+        self._saved = np.zeros((0, 0), dtype=np.float32)
+        self._added = None
+        self._added_count = 0
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.index_path)):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            matrix = np.load(self.matrix_path, mmap_mode="r")
+        except Exception as e:
+            print(f"Ignoring unreadable embedding cache {self.matrix_path}: {str(e)}")
+            return
+        self._saved = matrix
+        self._index = {h: row for h, row in index.items() if row < len(matrix)}
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def dimension(self):
+        """Length of the cached embeddings, None while the cache is empty"""
+        if len(self._saved):
+            return self._saved.shape[1]
+        return self._added.shape[1] if self._added_count else None
+
+    def _row(self, row):
+        saved = len(self._saved)
+        return self._saved[row] if row < saved else self._added[row - saved]
+
+    def get(self, hash_):
+        row = self._index.get(hash_)
+        return None if row is None else self._row(row)
+
+    def put(self, hash_, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        if self._added is None:
+            self._added = np.empty((64, len(embedding)), dtype=np.float32)
+        elif self._added_count == len(self._added):
+            grown = np.empty((2 * len(self._added), self._added.shape[1]), dtype=np.float32)
+            grown[:self._added_count] = self._added
+            self._added = grown
+        self._added[self._added_count] = embedding
+        # a replaced row stays behind until the next save()
+        self._index[hash_] = len(self._saved) + self._added_count
+        self._added_count += 1
+        self._dirty = True
+
+    def prune(self, keep_hashes):
+        """Drop every entry whose hash is not in keep_hashes"""
+        keep = {h: row for h, row in self._index.items() if h in keep_hashes}
+        if len(keep) == len(self._index):
+            return
+        self._index = keep
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.matrix_path), exist_ok=True)
+        hashes = list(self._index)
+        if hashes:
+            # written row by row into a new file, so the old one can stay mapped until the swap
+            tmp_path = self.matrix_path + ".tmp.npy"
+            out = np.lib.format.open_memmap(
+                tmp_path, mode="w+", dtype=np.float32, shape=(len(hashes), self.dimension)
+            )
+            for i, h in enumerate(hashes):
+                out[i] = self._row(self._index[h])
+            out.flush()
+            del out
+            self._saved = np.zeros((0, 0), dtype=np.float32)
+            os.replace(tmp_path, self.matrix_path)
+            self._saved = np.load(self.matrix_path, mmap_mode="r")
+        else:
+            self._saved = np.zeros((0, 0), dtype=np.float32)
+            if os.path.exists(self.matrix_path):
+                os.remove(self.matrix_path)
+        self._index = {h: i for i, h in enumerate(hashes)}
+        self._added = None
+        self._added_count = 0
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        self._dirty = False
+
+
+def embedding_dimension(cache, get_model):
+    """Embedding length: from the cache if it has entries, otherwise from the model"""
+    return cache.dimension or get_model().get_sentence_embedding_dimension()
+
+
+def encode_with_cache(texts, cache, get_model, batch_size=32, show_progress_bar=False):
+    """
+    Encode texts, reusing cached embeddings and encoding only the misses.
+
+    Args:
+        texts (list): Texts to encode
+        cache (EmbeddingCache): Cache for the model
+        get_model (callable): Returns the encoder; only called if something misses
+        batch_size (int): Encoder batch size
+
+    Returns:
+        tuple: (embeddings array in input order, reused count, computed count)
+    """
+    hashes = [text_hash(text) for text in texts]
+    missing = {}
+    for h, text in zip(hashes, texts):
+        if cache.get(h) is None and h not in missing:
+            missing[h] = text
+
+    if missing:
+        new_embeddings = get_model().encode(
+            list(missing.values()), batch_size=batch_size, show_progress_bar=show_progress_bar
+        )
+        for h, embedding in zip(missing, new_embeddings):
+            cache.put(h, embedding)
+
+    if not texts:
+        # (0, dimension), so callers can concatenate it with other sources
+        return np.zeros((0, embedding_dimension(cache, get_model)), dtype=np.float32), 0, 0
+    embeddings = np.stack([cache.get(h) for h in hashes])
+    computed = len(missing)
+    return embeddings, len(texts) - computed, computed
@@ -0,0 +1,238 @@
+# ingest_pipeline.py
+# Single-pass ingestion: read each source JSON, render texts, encode in bounded
+# batches and write straight into ChromaDB while the next batch is encoding.
+# The .npy / _texts.json intermediates of ingest_to_chromadb.py are optional.
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import numpy as np
+from scripts.bm25_index import build_bm25_index
+from scripts.canonical_packages import build_canonical_table
+from scripts.embedding_cache import document_ids, embedding_dimension, encode_with_cache
+from scripts.ingest_to_chromadb import SOURCES, get_embedding_cache
+from scripts.package_attributes import attribute_metadata
+from scripts.resources import (
+    get_chroma_client, get_chroma_path, get_embedding_model, get_project_root, invalidate, register_invalidation_hook
+)
+from scripts.response_cache import invalidate_response_cache
+
+
+def invalidate_collection(name, chroma_path=None):
+    """
+    After documents were upserted or deleted: drop everything derived from
+    the collection's old data, cached LLM answers (and their file, with
+    RESPONSE_CACHE_PATH) included.
+    """
+    register_invalidation_hook(invalidate_response_cache)
+    invalidate(name, chroma_path)
+
+
+def existing_document_ids(collection):
+    """IDs of the documents in the collection"""
+    return set(collection.get(include=[])["ids"])
+
+
+def delete_stale_documents(collection, ids, existing_ids, batch_size=256):
+    """
+    Delete the documents of existing_ids whose IDs are not in ids. Called
+    after the new documents were upserted, so a run that fails halfway
+    leaves the old packages searchable.
+
+    Returns:
+        int: number deleted
+    """
+    stale_ids = sorted(existing_ids - set(ids))
+    for start in range(0, len(stale_ids), batch_size):
+        collection.delete(ids=stale_ids[start:start + batch_size])
+    return len(stale_ids)
+
+
+def upsert_documents(collection, collection_name, ids, texts, embeddings, batch_size=256):
+    """Upsert documents in chunks of batch_size, with their normalized attributes as metadata"""
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        collection.upsert(
+            embeddings=embeddings[start:end],
+            documents=texts[start:end],
+            metadatas=[
+                {"text": text, "source": collection_name, **attribute_metadata(text)} for text in texts[start:end]
+            ],
+            ids=ids[start:end]
+        )
+
+
+def ingest_source(source, data_dir, chroma_path=None, batch_size=64, write_intermediates=True,
+                  cache=None, force=False):
+    """
+    Ingest one source from its JSON file straight into its ChromaDB collection.
+
+    Args:
+        source (dict): Entry of ingest_to_chromadb.SOURCES
+        data_dir (str): Directory with the source JSON (and the intermediates)
+        chroma_path (str): ChromaDB store (default: data/chroma_db)
+        batch_size (int): Texts per encode / upsert batch
+        write_intermediates (bool): Also write <prefix>_embeddings.npy and _texts.json
+        cache (EmbeddingCache): Embedding cache to reuse
+        force (bool): Upsert every document, not only new ones
+
+    Returns:
+        dict: counts of documents, upserted, deleted, reused and computed embeddings,
+              or None if the source could not be read
+    """
+    name = source["collection"]
+    json_path = os.path.join(data_dir, source["json_file"])
+    print(f"Processing JSON file: {json_path}")
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+    except Exception as e:
+        print(f"Failed to load JSON file {json_path}: {e}")
+        return None
+
+    texts = [source["text_fn"](item) for item in items]
+    ids = document_ids(name, texts)
+    collection = get_chroma_client(chroma_path).get_or_create_collection(name=name)
+    existing_ids = existing_document_ids(collection)
+
+    # Rows to encode: all of them when the intermediates are written, otherwise
+    # only the ones that still have to go into the store
+    pending = set(i for i, doc_id in enumerate(ids) if force or doc_id not in existing_ids)
+    rows = list(range(len(texts))) if write_intermediates else sorted(pending)
+    batches = [rows[start:start + batch_size] for start in range(0, len(rows), batch_size)]
+
+    own_cache = cache is None
+    if own_cache:
+        cache = get_embedding_cache(data_dir)
+    emb_path = os.path.join(data_dir, f"{source['prefix']}_embeddings.npy")
+    tmp_emb_path = emb_path + ".tmp.npy"
+    emb_out = None
+    stats = {"documents": len(texts), "upserted": 0, "deleted": 0, "reused": 0, "computed": 0}
+
+    def encode(batch):
+        return encode_with_cache([texts[i] for i in batch], cache, get_embedding_model, batch_size=batch_size)
+
+    # encode batch k+1 on the worker while batch k is written on this thread
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(encode, batches[0]) if batches else None
+        for k, batch in enumerate(batches):
+            embeddings, reused, computed = future.result()
+            if k + 1 < len(batches):
+                future = executor.submit(encode, batches[k + 1])
+            stats["reused"] += reused
+            stats["computed"] += computed
+
+            if write_intermediates:
+                if emb_out is None:
+                    emb_out = np.lib.format.open_memmap(
+                        tmp_emb_path, mode='w+', dtype=np.float32, shape=(len(texts), embeddings.shape[1])
+                    )
+                emb_out[batch[0]:batch[-1] + 1] = embeddings
+
+            write = [j for j, i in enumerate(batch) if i in pending]
+            if write:
+                upsert_documents(
+                    collection, name,
+                    [ids[batch[j]] for j in write],
+                    [texts[batch[j]] for j in write],
+                    embeddings[write]
+                )
+                stats["upserted"] += len(write)
+
+    # only now that the new packages are in the store
+    stats["deleted"] = delete_stale_documents(collection, ids, existing_ids)
+
+    if own_cache:
+        cache.save()
+
+    if write_intermediates:
+        if emb_out is not None:
+            emb_out.flush()
+            del emb_out
+            os.replace(tmp_emb_path, emb_path)
+        else:
+            np.save(emb_path, np.zeros((0, embedding_dimension(cache, get_embedding_model)), dtype=np.float32))
+        with open(os.path.join(data_dir, f"{source['prefix']}_texts.json"), 'w', encoding='utf-8') as f:
+            json.dump(texts, f, ensure_ascii=False, indent=2)
+
+    if stats["upserted"] or stats["deleted"]:
+        invalidate_collection(name, chroma_path)
+    print(
+        f"Ingested {stats['documents']} documents into collection '{name}' "
+        f"(upserted: {stats['upserted']}, deleted: {stats['deleted']}, "
+        f"embeddings reused: {stats['reused']}, computed: {stats['computed']})"
+    )
+    return stats
+
+
+def unchanged_delta_sources(delta_paths):
+    """
+    Collections whose scraper delta file (<source json stem>.delta.json, see
+    propakistani_jazz_scraper.py --incremental) reports no changes.
+    """
+    unchanged = set()
+    for path in delta_paths:
+        json_file = os.path.basename(path).replace('.delta.json', '.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                delta = json.load(f)
+        except Exception as e:
+            print(f"Ignoring unreadable delta file {path}: {e}")
+            continue
+        if not (delta.get('added') or delta.get('changed') or delta.get('removed')):
+            unchanged.update(s['collection'] for s in SOURCES if s['json_file'] == json_file)
+    return unchanged
+
+
+def run_pipeline(batch_size=64, write_intermediates=True, force=False, chroma_path=None, skip_collections=()):
+    """Ingest every source in ingest_to_chromadb.SOURCES; returns the summed counts"""
+    data_dir = os.path.join(get_project_root(), 'data')
+    chroma_path = chroma_path or get_chroma_path()
+    cache = get_embedding_cache(data_dir)
+    totals = {"documents": 0, "upserted": 0, "deleted": 0, "reused": 0, "computed": 0}
+    for i, source in enumerate(SOURCES, 1):
+        if source['collection'] in skip_collections:
+            print(f"\n=== {i}. Skipping {source['title']} (no changes) ===")
+            continue
+        print(f"\n=== {i}. Ingesting {source['title']} ===")
+        try:
+            stats = ingest_source(
+                source, data_dir, chroma_path=chroma_path, batch_size=batch_size,
+                write_intermediates=write_intermediates, cache=cache, force=force
+            )
+        except Exception as e:
+            print(f"Error ingesting {source['collection']}: {str(e)}")
+            stats = None
+        # keep what was encoded so far even if a later source fails
+        cache.save()
+        if stats:
+            for key in totals:
+                totals[key] += stats[key]
+
+    # lexical index for hybrid retrieval, rebuilt from the source JSON files
+    build_bm25_index(SOURCES, data_dir)
+    # one canonical entry per package across sources
+    build_canonical_table(SOURCES, cache, data_dir)
+    print(f"\n=== Ingestion Complete: {totals} ===")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest all package sources straight into ChromaDB")
+    parser.add_argument("--batch-size", type=int, default=64, help="texts per encode/upsert batch")
+    parser.add_argument("--no-intermediates", action="store_true",
+                        help="do not write the *_embeddings.npy / *_texts.json files")
+    parser.add_argument("--force", action="store_true", help="re-upsert every document")
+    parser.add_argument("--delta", action="append", default=[],
+                        help="scraper delta file; its source is skipped when the delta is empty")
+    args = parser.parse_args()
+    run_pipeline(
+        batch_size=args.batch_size, write_intermediates=not args.no_intermediates, force=args.force,
+        skip_collections=unchanged_delta_sources(args.delta)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
-from sentence_transformers import SentenceTransformer
 import json
 import numpy as np
 import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.bm25_index import build_bm25_index
+from scripts.canonical_packages import build_canonical_table
+from scripts.embedding_cache import EmbeddingCache, encode_with_cache, text_hash
+from scripts.resources import embedding_model_key, get_embedding_model
 
 def get_project_root():
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -12,14 +17,75 @@ def get_project_root():
         current_dir = os.path.dirname(current_dir)
     return os.path.dirname(os.path.dirname(__file__))
 
-def ingest_to_chromadb(json_path, text_fn, emb_path, text_output_path):
+def jazz_package_text(pkg):
+    return (
+        f"{pkg['Name']}. {pkg.get('Description', '')} "
+        f"Validity: {pkg.get('Validity', '')}. "
+        f"Price: {pkg.get('Price', '')}. "
+        f"Activation Code: {pkg.get('Activation Code', '')}"
+    )
+
+def propakistani_package_text(pkg):
+    return (
+        f"{pkg['package_name']}. "
+        f"On-Net: {pkg.get('onnet_mins', 'N/A')} mins, "
+        f"Off-Net: {pkg.get('offnet_mins', 'N/A')} mins, "
+        f"SMS: {pkg.get('sms', 'N/A')}, "
+        f"Data: {pkg.get('data_mb', 'N/A')} MB, "
+        f"Validity: {pkg.get('validity', 'N/A')}, "
+        f"Price: {pkg.get('price_rs') or 'N/A'} Rs, "
+        f"Subscription: {pkg.get('subscription_code', 'N/A')}, "
+        f"Category: {pkg.get('category', 'N/A')}"
+    )
+
+def ocr_package_text(pkg):
+    return (
+        f"{pkg['extracted_data']['package_name']}. "
+        f"Description: {'; '.join(pkg['extracted_data'].get('description', []))}. "
+        f"Price: {pkg['extracted_data'].get('price', 'N/A')}"
+    )
+
+# Data sources: input JSON, text renderer and output file prefix in data/
+SOURCES = [
+    {
+        "title": "Jazz Packages (Dummy Data)",
+        "collection": "jazz_packages",
+        "json_file": "jazz_packages.json",
+        "text_fn": jazz_package_text,
+        "prefix": "jazz_package",
+    },
+    {
+        "title": "Scraped Packages (ProPakistani Data)",
+        "collection": "propakistani_packages",
+        "json_file": "propakistani_jazz_packages.json",
+        "text_fn": propakistani_package_text,
+        "prefix": "propakistani_package",
+    },
+    {
+        "title": "OCR Packages (Extracted from Images)",
+        "collection": "ocr_packages",
+        "json_file": "extracted_packages.json",
+        "text_fn": ocr_package_text,
+        "prefix": "ocr_package",
+    },
+]
+
+def get_embedding_cache(data_dir=None):
+    data_dir = data_dir or os.path.join(get_project_root(), 'data')
+    return EmbeddingCache(os.path.join(data_dir, 'embedding_cache'), embedding_model_key())
+
+def ingest_to_chromadb(json_path, text_fn, emb_path, text_output_path, cache=None):
     """
     processes the json file to generate embeddings and save texts.
+    Only texts that are not in the embedding cache are encoded.
     args:
          json_path: Path to input JSON file
         text_fn: Function to transform each JSON item to text
         emb_path: Path to save embeddings (.npy file)
         text_out_path: Path to save processed texts (JSON file)
+        cache: EmbeddingCache to reuse (default: the one in data/embedding_cache)
+    returns:
+        dict with the text hashes and the reused/computed embedding counts, or None on failure
     """
     print(f"Processing JSON file: {json_path}")
 
@@ -37,17 +103,19 @@ def ingest_to_chromadb(json_path, text_fn, emb_path, text_output_path):
     for i, text in enumerate(texts[:2]):
         print(f"Text {i+1}, first 100 chars: {text[:100]}...")
 
-
-    # 3. Load embedding model
-    print("Loading embedding model...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-
-    # 4. Generate embeddings
+    # 3. Generate embeddings, loading the model only if something changed
+    own_cache = cache is None
+    if own_cache:
+        cache = get_embedding_cache(os.path.dirname(emb_path))
     print("Generating embeddings...")
-    embeddings = model.encode(texts, show_progress_bar=True)
-    print(f"generate embeddings with shape: {embeddings.shape}")
+    embeddings, reused, computed = encode_with_cache(
+        texts, cache, get_embedding_model, show_progress_bar=True
+    )
+    if own_cache:
+        cache.save()
+    print(f"generate embeddings with shape: {embeddings.shape} (reused: {reused}, computed: {computed})")
 
-# 5. Save embeddings and texts  (for ChromaDB or further use)
+# 4. Save embeddings and texts  (for ChromaDB or further use)
     try:
         np.save(emb_path, embeddings)
         with open (text_output_path, 'w', encoding='utf-8') as f:
@@ -57,58 +125,49 @@ def ingest_to_chromadb(json_path, text_fn, emb_path, text_output_path):
     except Exception as e:
         print(f"Error saving files : {str(e)}")
 
+    return {
+        "hashes": [text_hash(text) for text in texts],
+        "reused": reused,
+        "computed": computed,
+    }
+
 def main():
     project_root = get_project_root()
     data_dir = os.path.join(project_root, 'data')
+    cache = get_embedding_cache(data_dir)
 
-    # 1. Jazz packages (dummy data)
-    print("=== Processing Jazz Packages (Dummy Data) ===")
-    ingest_to_chromadb(
-        json_path=os.path.join(data_dir, 'jazz_packages.json'),
-        text_fn=lambda pkg: (
-            f"{pkg['Name']}. {pkg.get('Description', '')} "
-            f"Validity: {pkg.get('Validity', '')}. "
-            f"Price: {pkg.get('Price', '')}. "
-            f"Activation Code: {pkg.get('Activation Code', '')}"
-        ),
-        emb_path=os.path.join(data_dir, 'jazz_package_embeddings.npy'),
-        text_output_path=os.path.join(data_dir, 'jazz_package_texts.json')
-    )
-    
-    # 2. Scraped packages (ProPakistani data)
-    print("\n=== Processing Scraped Packages (ProPakistani Data) ===")
-    ingest_to_chromadb(
-        json_path=os.path.join(data_dir, 'propakistani_jazz_packages.json'),
-        text_fn=lambda pkg: (
-            f"{pkg['package_name']}. "
-            f"On-Net: {pkg.get('onnet_mins', 'N/A')} mins, "
-            f"Off-Net: {pkg.get('offnet_mins', 'N/A')} mins, "
-            f"SMS: {pkg.get('sms', 'N/A')}, "
-            f"Data: {pkg.get('data_mb', 'N/A')} MB, "
-            f"Validity: {pkg.get('validity', 'N/A')}, "
-            f"Price: {pkg.get('price_rs', 'N/A')} Rs, "
-            f"Subscription: {pkg.get('subscription_code', 'N/A')}, "
-            f"Category: {pkg.get('category', 'N/A')}"
-        ),
-        emb_path=os.path.join(data_dir, 'propakistani_package_embeddings.npy'),
-        text_output_path=os.path.join(data_dir, 'propakistani_package_texts.json')
-    )
-    
-    # 3. OCR packages (extracted from images)
-    print("\n=== Processing OCR Packages (Extracted from Images) ===")
-    ingest_to_chromadb(
-        json_path=os.path.join(data_dir, 'extracted_packages.json'),
-        text_fn=lambda pkg: (
-            f"{pkg['extracted_data']['package_name']}. "
-            f"Description: {'; '.join(pkg['extracted_data'].get('description', []))}. "
-            f"Price: {pkg['extracted_data'].get('price', 'N/A')}"
-        ),
-        emb_path=os.path.join(data_dir, 'ocr_package_embeddings.npy'),
-        text_output_path=os.path.join(data_dir, 'ocr_package_texts.json')
-    )
-    
+    used_hashes = set()
+    all_loaded = True
+    total_reused = total_computed = 0
+    for i, source in enumerate(SOURCES, 1):
+        print(f"\n=== {i}. Processing {source['title']} ===")
+        stats = ingest_to_chromadb(
+            json_path=os.path.join(data_dir, source['json_file']),
+            text_fn=source['text_fn'],
+            emb_path=os.path.join(data_dir, f"{source['prefix']}_embeddings.npy"),
+            text_output_path=os.path.join(data_dir, f"{source['prefix']}_texts.json"),
+            cache=cache
+        )
+        if stats:
+            used_hashes.update(stats["hashes"])
+            total_reused += stats["reused"]
+            total_computed += stats["computed"]
+        else:
+            all_loaded = False
+
+    # Forget embeddings of packages that no longer exist in any source
+    if all_loaded:
+        cache.prune(used_hashes)
+    cache.save()
+
+    # lexical index for hybrid retrieval (see bm25_index.py)
+    build_bm25_index(SOURCES, data_dir)
+    # one canonical entry per package across sources (see canonical_packages.py)
+    build_canonical_table(SOURCES, cache, data_dir)
+
+    print(f"\nEmbeddings reused: {total_reused}, computed: {total_computed}")
     print("\n=== All Data Processing Complete ===")
+    return {"reused": total_reused, "computed": total_computed}
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,328 @@
+# instrumentation.py
+# Lightweight tracing and metrics for the query pipeline.
+#
+# - span(name, **attributes): times a block, feeds the stage histogram and
+#   emits a structured JSON log event carrying the request's trace ID
+# - increment(name, **labels): counters (cache hits, web search triggers, ...)
+# - observe(name, value): histograms of other quantities (e.g. batch sizes)
+# - render_prometheus(): Prometheus text format, served on METRICS_PORT
+#   and/or written to METRICS_FILE after every request
+#
+# With METRICS_DIR set (scripts/serve.py sets it for its workers), every
+# process also writes a snapshot of its metrics to <dir>/metrics-<pid>.json
+# after each request, and render_prometheus() reports the sum over all of
+# them, so any one process can export the metrics of the whole server.
+#
+# Structured logs go to the "jazzbot.trace" logger; INSTRUMENTATION_LOG=stderr
+# (or a file path) attaches a JSON-lines handler to it.
+import collections
+import contextvars
+import glob
+import http.server
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# histogram bucket bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# bucket bounds for observe(), e.g. batch sizes
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+# raw durations kept per stage for percentiles (scripts/benchmark.py)
+MAX_SAMPLES = 100000
+
+logger = logging.getLogger("jazzbot.trace")
+
+_lock = threading.Lock()
+_samples = {}
+_histograms = {}
+_value_histograms = {}
+_counters = {}
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_span_name = contextvars.ContextVar("span_name", default=None)
+_exporters_started = False
+
+
+def _observe(stage, seconds):
+    with _lock:
+        _samples.setdefault(stage, collections.deque(maxlen=MAX_SAMPLES)).append(seconds)
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+
+
+def log_event(event, **fields):
+    """Emit one structured log record (JSON) tagged with the current trace ID"""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    record = {"ts": round(time.time(), 3), "event": event, "trace_id": _trace_id.get()}
+    record.update(fields)
+    logger.info(json.dumps(record, default=str))
+
+
+def record(stage, seconds, **attributes):
+    """Record a duration measured elsewhere (e.g. across awaits)"""
+    _observe(stage, seconds)
+    log_event("span", span=stage, parent=_span_name.get(), duration_ms=round(seconds * 1000, 3), **attributes)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time the with-block under name. The outermost span of a request starts a
+    new trace ID; nested spans (also in asyncio.to_thread calls) share it.
+    """
+    root = _trace_id.get() is None
+    trace_token = _trace_id.set(uuid.uuid4().hex[:16]) if root else None
+    parent = _span_name.get()
+    name_token = _span_name.set(name)
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        _span_name.reset(name_token)
+        _observe(name, seconds)
+        fields = dict(attributes)
+        if error:
+            fields["error"] = error
+        log_event("span", span=name, parent=parent, duration_ms=round(seconds * 1000, 3), **fields)
+        if root:
+            _trace_id.reset(trace_token)
+            export_metrics()
+
+
+def timed(stage):
+    """Alias of span without attributes"""
+    return span(stage)
+
+
+def increment(name, value=1, **labels):
+    """Add value to the counter name{labels}"""
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    log_event("counter", counter=name, value=value, **labels)
+
+
+def observe(name, value, buckets=SIZE_BUCKETS):
+    """Add value to the histogram name (exported as jazzbot_<name>)"""
+    with _lock:
+        histogram = _value_histograms.get(name)
+        if histogram is None:
+            histogram = _value_histograms[name] = {"bounds": buckets, "buckets": [0] * len(buckets),
+                                                   "sum": 0.0, "count": 0}
+        for i, bound in enumerate(histogram["bounds"]):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def counters():
+    """Current counter values, "name{label=value,...}" -> value"""
+    with _lock:
+        items = list(_counters.items())
+    return {
+        name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else ""): value
+        for (name, labels), value in items
+    }
+
+
+def stage_samples():
+    """Copy of the recorded durations, stage -> list of seconds"""
+    with _lock:
+        return {stage: list(values) for stage, values in _samples.items()}
+
+
+def reset_samples():
+    with _lock:
+        _samples.clear()
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def snapshot():
+    """JSON-serializable copy of this process's histograms and counters"""
+    with _lock:
+        return {
+            "stages": {stage: {"buckets": list(h["buckets"]), "sum": h["sum"], "count": h["count"]}
+                       for stage, h in _histograms.items()},
+            "values": {name: {"bounds": list(h["bounds"]), "buckets": list(h["buckets"]),
+                              "sum": h["sum"], "count": h["count"]}
+                       for name, h in _value_histograms.items()},
+            "counters": [[name, [list(pair) for pair in labels], value] for (name, labels), value in _counters.items()],
+        }
+
+
+def merge_snapshots(snapshots):
+    """Sum snapshots (e.g. of several worker processes) into one"""
+    merged = {"stages": {}, "values": {}, "counters": {}}
+    for snap in snapshots:
+        for kind in ("stages", "values"):
+            for name, histogram in snap[kind].items():
+                total = merged[kind].get(name)
+                if total is None:
+                    merged[kind][name] = dict(histogram, buckets=list(histogram["buckets"]))
+                    continue
+                total["buckets"] = [a + b for a, b in zip(total["buckets"], histogram["buckets"])]
+                total["sum"] += histogram["sum"]
+                total["count"] += histogram["count"]
+        for name, labels, value in snap["counters"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            merged["counters"][key] = merged["counters"].get(key, 0) + value
+    merged["counters"] = [[name, labels, value] for (name, labels), value in merged["counters"].items()]
+    return merged
+
+
+def _snapshot_path(directory, pid=None):
+    return os.path.join(directory, f"metrics-{pid or os.getpid()}.json")
+
+
+def _other_snapshots(directory):
+    """Snapshots the other processes sharing METRICS_DIR wrote"""
+    own = _snapshot_path(directory)
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+        if path == own:
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            # a worker that died mid-write; its last complete snapshot is gone
+            continue
+    return snapshots
+
+
+def render_prometheus():
+    """
+    All histograms and counters in the Prometheus text exposition format,
+    summed over every process writing to METRICS_DIR when it is set
+    """
+    snapshots = [snapshot()]
+    directory = os.getenv("METRICS_DIR")
+    if directory:
+        snapshots.extend(_other_snapshots(directory))
+    merged = merge_snapshots(snapshots)
+
+    lines = [
+        "# HELP jazzbot_stage_duration_seconds Duration of pipeline stages",
+        "# TYPE jazzbot_stage_duration_seconds histogram",
+    ]
+    for stage, histogram in sorted(merged["stages"].items()):
+        for bound, count in zip(BUCKETS, histogram["buckets"]):
+            lines.append(f'jazzbot_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'jazzbot_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+        lines.append(f'jazzbot_stage_duration_seconds_sum{{stage="{stage}"}} {histogram["sum"]:.6f}')
+        lines.append(f'jazzbot_stage_duration_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+
+    for name, histogram in sorted(merged["values"].items()):
+        metric = f"jazzbot_{name}"
+        lines.append(f"# TYPE {metric} histogram")
+        for bound, count in zip(histogram["bounds"], histogram["buckets"]):
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram["count"]}')
+        lines.append(f"{metric}_sum {histogram['sum']:g}")
+        lines.append(f"{metric}_count {histogram['count']}")
+
+    typed = set()
+    for name, labels, value in sorted(merged["counters"]):
+        metric = f"jazzbot_{name}"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} counter")
+            typed.add(metric)
+        lines.append(f"{metric}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def export_metrics():
+    """
+    Write this process's snapshot to METRICS_DIR and the Prometheus text to
+    METRICS_FILE, for whichever is set; runs after every request.
+    """
+    directory = os.getenv("METRICS_DIR")
+    path = os.getenv("METRICS_FILE")
+    if directory:
+        try:
+            _write_atomic(_snapshot_path(directory), json.dumps(snapshot()))
+        except OSError as e:
+            logger.warning(f"Could not write metrics snapshot to {directory}: {e}")
+    if path:
+        try:
+            _write_atomic(path, render_prometheus())
+        except OSError as e:
+            logger.warning(f"Could not write metrics file {path}: {e}")
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve /metrics on a daemon thread; returns the server"""
+    server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def configure_from_env(metrics_server=True):
+    """
+    Set up the exporters requested in the environment, once per process:
+    INSTRUMENTATION_LOG (stderr or a file path) and, unless metrics_server is
+    False (forked server workers, whose parent serves it), METRICS_PORT.
+    """
+    global _exporters_started
+    if _exporters_started:
+        return
+    with _lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+    target = os.getenv("INSTRUMENTATION_LOG")
+    if target:
+        handler = logging.StreamHandler() if target == "stderr" else logging.FileHandler(target, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    port = os.getenv("METRICS_PORT")
+    if port and metrics_server:
+        try:
+            start_metrics_server(int(port))
+        except OSError as e:
+            logger.warning(f"Could not start metrics server on port {port}: {e}")
@@ -0,0 +1,247 @@
+# llm_client.py
+# OpenAI-compatible chat client used for every LLM call: pooled keep-alive
+# connections, timeouts, retries with exponential backoff on 429/5xx and a
+# cap on concurrent requests. The provider is chosen from the environment, so
+# the pipeline can run against Groq or the local mock server
+# (scripts/mock_llm_server.py). requests and httpx are imported when a client
+# is created or first used asynchronously, not when this module is imported.
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import weakref
+
+from scripts.instrumentation import increment
+
+PROVIDER_URLS = {
+    "groq": "https://api.groq.com/openai/v1",
+    "openai": "https://api.openai.com/v1",
+    "mock": "http://127.0.0.1:8001/v1",
+}
+# environment variable holding the API key of each provider
+PROVIDER_KEYS = {"groq": "GROQ_API_KEY", "openai": "OPENAI_API_KEY"}
+DEFAULT_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_lock = threading.Lock()
+_client = None
+
+
+class LLMError(Exception):
+    """The LLM request failed (after retries)"""
+
+
+def answer_content(data):
+    """The message content of a chat completions response body; LLMError if it is malformed"""
+    try:
+        return data["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError) as e:
+        raise LLMError(f"Malformed LLM response: {str(data)[:200]}") from e
+
+
+def iter_sse_tokens(lines):
+    """Yield the content deltas from the lines of an OpenAI-style SSE stream"""
+    for line in lines:
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            break
+        choices = json.loads(payload).get("choices") or []
+        if choices:
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+class LLMClient:
+    """
+    Chat completions client for an OpenAI-compatible endpoint.
+
+    Args:
+        base_url (str): API root, e.g. https://api.groq.com/openai/v1
+        api_key (str): Bearer token (optional for the mock server)
+        model (str): Model name sent with every request
+        timeout (float): Read timeout in seconds
+        connect_timeout (float): Connect timeout in seconds
+        max_retries (int): Retries on 429/5xx and connection errors
+        backoff (float): Base delay in seconds, doubled on every retry
+        max_retry_after (float): Longest Retry-After delay honored, in seconds
+        max_concurrency (int): Requests allowed in flight at once (also the pool size)
+    """
+
+    def __init__(self, base_url, api_key=None, model=DEFAULT_MODEL, max_tokens=1024, temperature=0.7,
+                 timeout=60.0, connect_timeout=10.0, max_retries=3, backoff=0.5, max_retry_after=30.0,
+                 max_concurrency=8):
+        self.base_url = base_url.rstrip("/")
+        self.chat_url = f"{self.base_url}/chat/completions"
+        self.api_key = api_key
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.max_concurrency = max_concurrency
+        self.retries = 0
+
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_semaphores = weakref.WeakKeyDictionary()
+
+    def _headers(self):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def _payload(self, prompt, stream=False):
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "stream": stream
+        }
+
+    def _retry_delay(self, attempt, retry_after=None):
+        self.retries += 1
+        increment("llm_retries_total")
+        if retry_after:
+            try:
+                # a provider asking for minutes must not hold a request thread that long
+                return min(max(float(retry_after), 0.0), self.max_retry_after)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    def _post(self, payload, stream=False):
+        """POST with retries; returns a 200 response (open if stream) or raises LLMError"""
+        import requests
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(
+                    self.chat_url, headers=self._headers(), json=payload, stream=stream,
+                    timeout=(self.connect_timeout, self.timeout)
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise LLMError(f"LLM request failed: {e}") from e
+                time.sleep(self._retry_delay(attempt))
+                continue
+            if response.status_code == 200:
+                return response
+            if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+                delay = self._retry_delay(attempt, response.headers.get("Retry-After"))
+                response.close()
+                time.sleep(delay)
+                continue
+            text = response.text
+            response.close()
+            raise LLMError(text)
+
+    def complete(self, prompt):
+        """Return the full answer to prompt"""
+        with self._semaphore:
+            response = self._post(self._payload(prompt))
+            try:
+                data = response.json()
+            except ValueError as e:
+                raise LLMError(f"LLM response is not JSON: {response.text[:200]}") from e
+            return answer_content(data)
+
+    def stream(self, prompt):
+        """
+        Yield the answer piece by piece from the SSE stream. Retries only
+        happen before the first token; a connection dropped or a malformed
+        event later on raises LLMError.
+        """
+        import requests
+        with self._semaphore:
+            with self._post(self._payload(prompt, stream=True), stream=True) as response:
+                # text/event-stream has no charset, requests would assume latin-1
+                response.encoding = "utf-8"
+                try:
+                    yield from iter_sse_tokens(response.iter_lines(decode_unicode=True))
+                except (requests.RequestException, ValueError) as e:
+                    raise LLMError(f"LLM stream failed: {e}") from e
+
+    def _async_client(self):
+        """Pooled keep-alive httpx client and semaphore for the running event loop"""
+        import httpx
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency)
+            )
+            self._async_clients[loop] = client
+            self._async_semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return client, self._async_semaphores[loop]
+
+    async def acomplete(self, prompt):
+        """asyncio variant of complete"""
+        import httpx
+        client, semaphore = self._async_client()
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await client.post(self.chat_url, headers=self._headers(), json=self._payload(prompt))
+                except httpx.TransportError as e:
+                    if attempt == self.max_retries:
+                        raise LLMError(f"LLM request failed: {e}") from e
+                    await asyncio.sleep(self._retry_delay(attempt))
+                    continue
+                if response.status_code == 200:
+                    try:
+                        data = response.json()
+                    except ValueError as e:
+                        raise LLMError(f"LLM response is not JSON: {response.text[:200]}") from e
+                    return answer_content(data)
+                if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+                    await asyncio.sleep(self._retry_delay(attempt, response.headers.get("Retry-After")))
+                    continue
+                raise LLMError(response.text)
+
+
+def get_llm_client():
+    """
+    Return the shared client configured from the environment:
+    LLM_PROVIDER (groq, openai or mock), LLM_BASE_URL, LLM_API_KEY, LLM_MODEL,
+    LLM_MAX_TOKENS, LLM_TIMEOUT, LLM_MAX_RETRIES, LLM_MAX_RETRY_AFTER and
+    LLM_MAX_CONCURRENCY.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                provider = os.getenv("LLM_PROVIDER", "groq").lower()
+                base_url = os.getenv("LLM_BASE_URL") or PROVIDER_URLS.get(provider)
+                if not base_url:
+                    raise ValueError(f"Unknown LLM_PROVIDER '{provider}', set LLM_BASE_URL")
+                api_key = os.getenv("LLM_API_KEY") or os.getenv(PROVIDER_KEYS.get(provider, ""), "")
+                if not api_key and provider != "mock":
+                    raise ValueError(f"{PROVIDER_KEYS.get(provider, 'LLM_API_KEY')} not set in environment variables")
+                _client = LLMClient(
+                    base_url,
+                    api_key=api_key,
+                    model=os.getenv("LLM_MODEL", DEFAULT_MODEL),
+                    max_tokens=int(os.getenv("LLM_MAX_TOKENS", "1024")),
+                    timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+                    max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+                    max_retry_after=float(os.getenv("LLM_MAX_RETRY_AFTER", "30")),
+                    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+                )
+    return _client
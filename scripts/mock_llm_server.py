@@ -0,0 +1,143 @@
+# mock_llm_server.py
+# Local OpenAI-compatible chat completions server for offline runs and load
+# tests. Point the chatbot at it with LLM_PROVIDER=mock (or LLM_BASE_URL).
+#
+#   python scripts/mock_llm_server.py --port 8001 --latency 0.3 --token-latency 0.01
+import argparse
+import http.server
+import json
+import random
+import threading
+import time
+import uuid
+
+DEFAULT_ANSWER = (
+    "Here are the packages that match your request, based on the results provided. "
+    "Please verify the details on the official Jazz website before subscribing."
+)
+
+
+class MockLLMHandler(http.server.BaseHTTPRequestHandler):
+    # set by make_server
+    latency = 0.0
+    token_latency = 0.0
+    error_rate = 0.0
+    answer = DEFAULT_ANSWER
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)) or 0)
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid JSON"}})
+            return
+        if self.error_rate and random.random() < self.error_rate:
+            self._send_json(429, {"error": {"message": "rate limited (mock)"}}, {"Retry-After": "0"})
+            return
+
+        time.sleep(self.latency)
+        model = request.get("model", "mock")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        if request.get("stream"):
+            self._stream(completion_id, model)
+            return
+        time.sleep(self.token_latency * len(self.answer.split()))
+        prompt = "".join(m.get("content", "") for m in request.get("messages", []))
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": self.answer}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": len(prompt.split()),
+                "completion_tokens": len(self.answer.split()),
+                "total_tokens": len(prompt.split()) + len(self.answer.split()),
+            },
+        })
+
+    def _stream(self, completion_id, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        words = self.answer.split(" ")
+        for i, word in enumerate(words):
+            time.sleep(self.token_latency)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else f" {word}"}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def make_server(port=8001, latency=0.0, token_latency=0.0, error_rate=0.0, answer=DEFAULT_ANSWER):
+    """Create the mock server; port 0 picks a free port (see server.server_address)"""
+    handler = type("ConfiguredMockLLMHandler", (MockLLMHandler,), {
+        "latency": latency, "token_latency": token_latency, "error_rate": error_rate, "answer": answer,
+    })
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve_in_background(port=0, **options):
+    """
+    Start the mock server on a daemon thread.
+    Returns (server, base_url); call server.shutdown() when done.
+    """
+    server = make_server(port, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="seconds per streamed token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    args = parser.parse_args()
+
+    server = make_server(args.port, args.latency, args.token_latency, args.error_rate)
+    print(f"Mock LLM server on http://127.0.0.1:{args.port}/v1 (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# numpy_backend.py
+# In-process exact-search retrieval backend over the *_embeddings.npy and
+# *_texts.json files written by ingest_to_chromadb.py. Selected with
+# RETRIEVAL_BACKEND=numpy (see parallelchroma.py).
+import json
+import os
+import threading
+
+import numpy as np
+
+from scripts.embedding_cache import document_ids
+from scripts.package_attributes import NUMERIC_ATTRIBUTES, text_attributes
+from scripts.resources import get_project_root, register_invalidation_hook
+
+# collection name -> file prefix used by ingest_to_chromadb.py
+COLLECTION_FILES = {
+    'jazz_packages': 'jazz_package',
+    'propakistani_packages': 'propakistani_package',
+    'ocr_packages': 'ocr_package',
+}
+
+_lock = threading.Lock()
+_index = None
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class NumpyIndex:
+    """
+    Exact cosine search over all package sources at once.
+
+    The normalized, stacked matrix of every source is written next to the
+    inputs (data/numpy_index_<dtype>.npy) and memory-mapped read-only, so it
+    is only rebuilt when an embeddings file changes.
+    """
+
+    def __init__(self, data_dir=None, dtype=np.float32):
+        self.data_dir = data_dir or os.path.join(get_project_root(), "data")
+        self.dtype = np.dtype(dtype)
+        self.offsets = {}
+        self.texts = []
+        self.ids = []
+        self.sources = []
+
+        sources = []
+        for name, prefix in COLLECTION_FILES.items():
+            emb_path = os.path.join(self.data_dir, f"{prefix}_embeddings.npy")
+            text_path = os.path.join(self.data_dir, f"{prefix}_texts.json")
+            if not (os.path.exists(emb_path) and os.path.exists(text_path)):
+                print(f"NumPy backend: no embeddings for '{name}', skipping...")
+                continue
+            with open(text_path, "r", encoding="utf-8") as f:
+                texts = json.load(f)
+            sources.append((name, emb_path, texts))
+
+        start = 0
+        for name, _, texts in sources:
+            self.offsets[name] = (start, start + len(texts))
+            self.texts.extend(texts)
+            self.ids.extend(document_ids(name, texts))
+            self.sources.extend([name] * len(texts))
+            start += len(texts)
+
+        self.matrix = self._load_matrix([emb_path for _, emb_path, _ in sources])
+        # columnar numeric attributes (NaN when missing) for filtered queries
+        attributes = [text_attributes(text) for text in self.texts]
+        self.columns = {
+            name: np.array([a.get(name, np.nan) for a in attributes], dtype=np.float64)
+            for name in NUMERIC_ATTRIBUTES
+        }
+
+    def _load_matrix(self, emb_paths):
+        index_path = os.path.join(self.data_dir, f"numpy_index_{self.dtype.name}.npy")
+        fresh = os.path.exists(index_path) and all(
+            os.path.getmtime(index_path) >= os.path.getmtime(p) for p in emb_paths
+        )
+        if fresh:
+            matrix = np.load(index_path, mmap_mode='r')
+            if matrix.shape[0] == len(self.texts):
+                return matrix
+
+        # sources without packages may have saved (0, 0) arrays
+        parts = [part for part in (np.load(p, mmap_mode='r') for p in emb_paths) if part.shape[0]]
+        if not parts:
+            return np.zeros((0, 0), dtype=self.dtype)
+        matrix = _normalize(np.concatenate(parts, axis=0).astype(np.float32)).astype(self.dtype)
+        # written beside the old index and swapped in: other processes may still have it mapped
+        tmp_path = f"{index_path}.{os.getpid()}.tmp.npy"
+        try:
+            np.save(tmp_path, matrix)
+            os.replace(tmp_path, index_path)
+            return np.load(index_path, mmap_mode='r')
+        except OSError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"NumPy backend: could not write {index_path}: {str(e)}")
+            return matrix
+
+    def attribute_mask(self, constraints):
+        """Boolean row mask of the documents matching package_attributes constraints"""
+        mask = np.ones(len(self.texts), dtype=bool)
+        for name, bounds in constraints.items():
+            column = self.columns.get(name)
+            if column is None:
+                continue
+            matches = np.ones(len(self.texts), dtype=bool)
+            if "eq" in bounds:
+                matches &= column == bounds["eq"]
+            if "min" in bounds:
+                matches &= column >= bounds["min"]
+            if "max" in bounds:
+                matches &= column <= bounds["max"]
+            # documents that do not state the attribute are kept
+            mask &= matches | np.isnan(column)
+        return mask
+
+    def collection_names(self):
+        return list(self.offsets)
+
+    def query(self, query_embeddings, collections, n_results=10, constraints=None):
+        """
+        Top-k search for a batch of query embeddings, restricted to the
+        documents matching constraints (see package_attributes.py) if given.
+
+        Returns:
+            dict: collection name -> ChromaDB-shaped result with one row per query.
+                  Distances are squared L2 between unit vectors (2 - 2 * cosine),
+                  the same scale ChromaDB reports for normalized embeddings.
+        """
+        if self.matrix.shape[0] == 0:
+            return {}
+        queries = _normalize(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        # one matmul against every source
+        scores = (queries.astype(self.dtype) @ self.matrix.T).astype(np.float32)
+        mask = self.attribute_mask(constraints) if constraints else None
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+
+        results = {}
+        for name in collections:
+            if name not in self.offsets:
+                continue
+            start, end = self.offsets[name]
+            k = min(n_results, end - start if mask is None else int(mask[start:end].sum()))
+            if k <= 0:
+                continue
+            block = scores[:, start:end]
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1) + start
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+            results[name] = {
+                "ids": [[self.ids[i] for i in row] for row in top],
+                "documents": [[self.texts[i] for i in row] for row in top],
+                "metadatas": [[{"text": self.texts[i], "source": name} for i in row] for row in top],
+                "distances": (2.0 - 2.0 * top_scores).tolist(),
+            }
+        return results
+
+
+def get_numpy_index():
+    """Return the shared NumpyIndex, building it on first use"""
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                dtype = np.float16 if os.getenv("NUMPY_INDEX_DTYPE", "float32") == "float16" else np.float32
+                _index = NumpyIndex(dtype=dtype)
+    return _index
+
+
+def _reset_index(collection_name=None):
+    global _index
+    with _lock:
+        _index = None
+
+
+register_invalidation_hook(_reset_index)
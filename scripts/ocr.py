@@ -1,12 +1,15 @@
 import os
 import json
 import base64
+import hashlib
+import random
+import threading
+import time
+import argparse
+import concurrent.futures
 import cv2
 from dotenv import load_dotenv
-from mistralai import Mistral
-from PIL import Image
 from langchain.prompts import PromptTemplate
-from langchain_mistralai import ChatMistralAI
 
 # Setup parser fallback
 try:
@@ -29,9 +32,6 @@ except ImportError:
 load_dotenv()
 api_key = os.getenv("MISTRAL_API_KEY")
 
-# Initialize clients
-client = Mistral(api_key=api_key)
-llm = ChatMistralAI(api_key=api_key, model="mistral-ocr-latest", temperature=0.2)
 parser = JsonOutputParser()
 
 # Prompt for extracting structured data
@@ -53,18 +53,123 @@ Text:
     partial_variables={"format_instructions": parser.get_format_instructions()}
 )
 
-# Directory setup - Fixed path with raw string
-screenshots_dir = r"D:\Cloudpacer\chatbot\jazz_packeges"
-output_json = []
+# Directory setup, relative to the project root unless overridden
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+screenshots_dir = os.getenv("OCR_SCREENSHOTS_DIR", os.path.join(project_root, "jazz_packeges"))
+upscaled_dir = os.path.join(project_root, "upscaled_images")
+output_path = os.path.join(project_root, "data", "extracted_packages.json")
+cache_path = os.path.join(project_root, "data", "ocr_cache.json")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# Clients are created on first use (or replaced by the offline stubs)
+client = None
+llm = None
+
+
+class _StubOCR:
+    def process(self, model, document):
+        return {"pages": [{"markdown": "Stub Package\n1 GB Internet\n100 Minutes\nRs. 100"}]}
+
+
+class StubOCRClient:
+    """Offline stand-in for the Mistral client, returns a fixed OCR page"""
+    def __init__(self):
+        self.ocr = _StubOCR()
+
+
+class _StubMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+class StubLLM:
+    """Offline stand-in for ChatMistralAI, returns a fixed extraction"""
+    def invoke(self, _prompt):
+        return _StubMessage(json.dumps({
+            "package_name": "Stub Package",
+            "description": ["1 GB Internet", "100 Minutes"],
+            "price": "Rs. 100"
+        }))
+
+
+def init_clients(offline=False):
+    global client, llm
+    if offline:
+        client, llm = StubOCRClient(), StubLLM()
+        return
+    from mistralai import Mistral
+    from langchain_mistralai import ChatMistralAI
+    client = Mistral(api_key=api_key)
+    llm = ChatMistralAI(api_key=api_key, model="mistral-ocr-latest", temperature=0.2)
+
+
+class RateLimiter:
+    """Thread-safe limiter allowing at most `rate` calls per second"""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+# statuses worth another try: timeouts, rate limits and server errors
+TRANSIENT_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+def is_transient(error):
+    """
+    True for errors a retry can fix (rate limits, 5xx, timeouts, dropped
+    connections); bad requests, auth failures and parse errors are not.
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status in TRANSIENT_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    try:
+        import httpx
+    except ImportError:
+        return False
+    return isinstance(error, httpx.TransportError)
+
+
+def with_retry(fn, limiter=None, retries=4, base_delay=1.0):
+    """Call fn() under the rate limiter, retrying transient errors with exponential backoff and jitter"""
+    for attempt in range(retries + 1):
+        if limiter:
+            limiter.wait()
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries or not is_transient(e):
+                raise
+            delay = base_delay * (2 ** attempt) * (0.5 + random.random())
+            print(f"⏳ Retrying in {delay:.1f}s after error: {e}")
+            time.sleep(delay)
+
 
 # Helper functions
+def image_hash(image_path):
+    with open(image_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
 def upscale_image_2x(image_path):
     img = cv2.imread(image_path)
     if img is None:
         return image_path
     upscaled = cv2.resize(img, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-    upscaled_path = os.path.join("upscaled_images", os.path.basename(image_path))
-    os.makedirs("upscaled_images", exist_ok=True)
+    upscaled_path = os.path.join(upscaled_dir, os.path.basename(image_path))
+    os.makedirs(upscaled_dir, exist_ok=True)
     cv2.imwrite(upscaled_path, upscaled)
     return upscaled_path
 
@@ -72,65 +177,174 @@ def encode_image(image_path):
     with open(image_path, "rb") as image_file:
         return base64.b64encode(image_file.read()).decode('utf-8')
 
+def prepare_image(image_path):
+    """CPU stage: upscale and base64-encode"""
+    return encode_image(upscale_image_2x(image_path))
+
+def ocr_from_base64(base64_image, limiter=None):
+    """Network stage: Mistral OCR call, raises after the retries are exhausted"""
+    response = with_retry(lambda: client.ocr.process(
+        model="mistral-ocr-latest",
+        document={"type": "image_url", "image_url": f"data:image/jpeg;base64,{base64_image}"}
+    ), limiter)
+    # Handle response properly
+    if hasattr(response, 'model_dump_json'):
+        data = json.loads(response.model_dump_json())
+    elif hasattr(response, 'json'):
+        data = json.loads(response.json())
+    else:
+        data = response if isinstance(response, dict) else json.loads(response)
+
+    pages = data.get('pages', [])
+    return "\n\n".join([p.get("markdown", "") for p in pages])
+
 def ocr_from_image(image_path):
-    upscaled_path = upscale_image_2x(image_path)
-    base64_image = encode_image(upscaled_path)
     try:
-        # Use the correct OCR model name
-        response = client.ocr.process(
-            model="mistral-ocr-latest",
-            document={"type": "image_url", "image_url": f"data:image/jpeg;base64,{base64_image}"}
-        )
-        # Handle response properly
-        if hasattr(response, 'model_dump_json'):
-            data = json.loads(response.model_dump_json())
-        elif hasattr(response, 'json'):
-            data = json.loads(response.json())
-        else:
-            data = response if isinstance(response, dict) else json.loads(response)
-        
-        pages = data.get('pages', [])
-        text = "\n\n".join([p.get("markdown", "") for p in pages])
-        return text
+        return ocr_from_base64(prepare_image(image_path))
     except Exception as e:
         print(f"❌ OCR error for {image_path}: {e}")
         return ""
 
-def extract_package_info(ocr_text):
+def extract_package_info(ocr_text, limiter=None):
     """Extract package information using LLM"""
     try:
         # Use the modern invoke method instead of deprecated run
         result = prompt.invoke({"ocr_text": ocr_text})
-        response = llm.invoke(result)
+        response = with_retry(lambda: llm.invoke(result), limiter)
         json_data = parser.parse(response.content)
         return json_data
     except Exception as e:
         print(f"⚠️ LLM extraction error: {e}")
         return None
 
-# Loop through all images
-for filename in os.listdir(screenshots_dir):
-    if filename.lower().endswith((".png", ".jpg", ".jpeg",".PNG")):
-        image_path = os.path.join(screenshots_dir, filename)
-        print(f"🔍 Processing: {filename}")
 
-        ocr_text = ocr_from_image(image_path)
+def load_cache(path=cache_path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable OCR cache {path}: {e}")
+        return {}
+
+def save_cache(cache, path=cache_path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # written to a temporary file first, an interrupted save keeps the old cache
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def process_images(image_dir=screenshots_dir, concurrency=4, rate=2.0, offline=False, use_cache=True,
+                   save_every=10):
+    """
+    OCR every screenshot in image_dir.
+
+    Upscaling runs on a CPU pool and feeds a bounded pool of network workers
+    (rate limited, with retries), so both overlap; at most 2 * concurrency
+    images are between the two stages, so upscaling cannot run ahead and hold
+    every encoded image in memory. Results are cached by image hash, saved
+    every save_every new entries, and only new or changed screenshots are sent
+    to the APIs.
+
+    Returns:
+        list: [{"image": filename, "extracted_data": {...}}] in filename order
+    """
+    init_clients(offline)
+    cache = load_cache() if use_cache else {}
+    limiter = RateLimiter(rate)
+
+    filenames = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    results = {}
+    todo = []
+    for filename in filenames:
+        image_path = os.path.join(image_dir, filename)
+        h = image_hash(image_path)
+        entry = cache.get(h)
+        if entry is not None:
+            print(f"♻️ Cached: {filename}")
+            results[filename] = entry.get("extracted_data")
+        else:
+            todo.append((filename, image_path, h))
+
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(2 * concurrency)
+    unsaved = 0
+
+    def run_network(filename, base64_image):
+        print(f"🔍 Processing: {filename}")
+        ocr_text = ocr_from_base64(base64_image, limiter)
         if not ocr_text.strip():
             print(f"⚠️ Skipped {filename} (no text)")
-            continue
+            return None, True
+        json_data = extract_package_info(ocr_text, limiter)
+        # a failed extraction is not cached so it is retried next run
+        return json_data, json_data is not None
 
+    def process(filename, h, prepared):
+        nonlocal unsaved
         try:
-            json_data = extract_package_info(ocr_text)
-            if json_data:
-                output_json.append({
-                    "image": filename,
-                    "extracted_data": json_data
-                })
-        except Exception as e:
-            print(f"⚠️ JSON extraction failed for {filename}: {e}")
+            try:
+                base64_image = prepared.result()
+            except Exception as e:
+                print(f"❌ Upscaling failed for {filename}: {e}")
+                return
+            try:
+                json_data, cacheable = run_network(filename, base64_image)
+            except Exception as e:
+                print(f"❌ OCR error for {filename}: {e}")
+                return
+            with lock:
+                results[filename] = json_data
+                if cacheable and not offline:
+                    cache[h] = {"image": filename, "extracted_data": json_data}
+                    unsaved += 1
+                    # an interrupted run keeps what it already paid for
+                    if use_cache and unsaved >= save_every:
+                        save_cache(cache)
+                        unsaved = 0
+        finally:
+            slots.release()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 2) as cpu_pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as net_pool:
+        for filename, path, h in todo:
+            slots.acquire()
+            net_pool.submit(process, filename, h, cpu_pool.submit(prepare_image, path))
+
+    if use_cache and unsaved:
+        save_cache(cache)
+
+    return [
+        {"image": filename, "extracted_data": results[filename]}
+        for filename in filenames if results.get(filename)
+    ]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Extract Jazz packages from screenshots with OCR")
+    arg_parser.add_argument("--image-dir", default=screenshots_dir)
+    arg_parser.add_argument("--output", default=output_path)
+    arg_parser.add_argument("--concurrency", type=int, default=4, help="parallel API workers")
+    arg_parser.add_argument("--rate", type=float, default=2.0, help="max API calls per second")
+    arg_parser.add_argument("--offline", action="store_true", help="use stub clients, no API calls")
+    arg_parser.add_argument("--no-cache", action="store_true", help="re-process every image")
+    args = arg_parser.parse_args()
+
+    output_json = process_images(
+        args.image_dir, concurrency=args.concurrency, rate=args.rate,
+        offline=args.offline or os.getenv("OCR_OFFLINE") == "1", use_cache=not args.no_cache
+    )
+
+    # Save results to a file
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output_json, f, indent=2, ensure_ascii=False)
+
+    print(f"\n✅ Extraction complete! Results saved to '{args.output}'")
 
-# Save results to a file
-with open("extracted_packages.json", "w", encoding="utf-8") as f:
-    json.dump(output_json, f, indent=2, ensure_ascii=False)
 
-print("\n✅ Extraction complete! Results saved to 'extracted_packages.json'")
+if __name__ == "__main__":
+    main()
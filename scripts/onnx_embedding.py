@@ -0,0 +1,223 @@
+# onnx_embedding.py
+# all-MiniLM-L6-v2 on ONNX Runtime (CPU): the exported model from the Hugging
+# Face repo, fp32 or int8-quantized, with the same tokenization, mean pooling
+# and normalization as the SentenceTransformer. Selected with
+# EMBEDDING_ENGINE=onnx (see resources.get_embedding_model); torch is never
+# imported, which keeps every worker's memory small.
+#
+#   python scripts/onnx_embedding.py --check          # agreement with the PyTorch model
+#   python scripts/onnx_embedding.py --check --speed  # plus encode latency vs PyTorch
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+# ONNX exports published alongside the model; int8 uses the quantization
+# matching the CPU architecture
+ONNX_FILES = {
+    "fp32": "onnx/model.onnx",
+    "int8": "onnx/model_quint8_avx2.onnx",
+    "int8-arm64": "onnx/model_qint8_arm64.onnx",
+}
+MAX_SEQ_LENGTH = 256
+DEFAULT_THRESHOLD = 0.98
+
+
+def resolve_variant(variant):
+    """Key of ONNX_FILES for int8 or fp32: int8 picks the quantization for this CPU architecture"""
+    variant = variant.lower()
+    if variant == "int8" and platform.machine().lower() in ("arm64", "aarch64"):
+        return "int8-arm64"
+    if variant not in ONNX_FILES:
+        raise ValueError(f"Unknown ONNX variant '{variant}' (expected int8 or fp32)")
+    return variant
+
+
+def onnx_variant():
+    """EMBEDDING_ONNX_VARIANT: int8 (default) or fp32, resolved for this CPU"""
+    return resolve_variant(os.getenv("EMBEDDING_ONNX_VARIANT", "int8"))
+
+
+def _model_file(model_name, filename):
+    """
+    Path of one file of the model: from EMBEDDING_ONNX_DIR when set (offline
+    deployments), otherwise downloaded once into the Hugging Face cache.
+    """
+    local_dir = os.getenv("EMBEDDING_ONNX_DIR")
+    if local_dir:
+        return os.path.join(local_dir, filename)
+    from huggingface_hub import hf_hub_download
+    repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    return hf_hub_download(repo_id, filename)
+
+
+class OnnxEmbeddingModel:
+    """
+    Drop-in replacement for SentenceTransformer.encode on ONNX Runtime.
+
+    Args:
+        model_name (str): Sentence-transformers model with ONNX exports
+        variant (str): int8 or fp32 (default: onnx_variant())
+        threads (int): Intra-op threads, 0 for the runtime default
+            (EMBEDDING_ONNX_THREADS)
+    """
+
+    def __init__(self, model_name, variant=None, threads=None, max_seq_length=MAX_SEQ_LENGTH):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.model_name = model_name
+        self.variant = resolve_variant(variant) if variant else onnx_variant()
+        self.max_seq_length = max_seq_length
+
+        self.tokenizer = Tokenizer.from_file(_model_file(model_name, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.no_padding()
+
+        options = onnxruntime.SessionOptions()
+        threads = int(os.getenv("EMBEDDING_ONNX_THREADS", "0")) if threads is None else threads
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            _model_file(model_name, ONNX_FILES[self.variant]), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        # the hidden size is a fixed dimension of the export (384 for MiniLM)
+        hidden_size = self.session.get_outputs()[0].shape[-1]
+        self.dimension = hidden_size if isinstance(hidden_size, int) else 384
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        length = max(len(e.ids) for e in encodings)
+        input_ids = np.zeros((len(texts), length), dtype=np.int64)
+        attention_mask = np.zeros((len(texts), length), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            input_ids[row, :len(encoding.ids)] = encoding.ids
+            attention_mask[row, :len(encoding.ids)] = 1
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        # mean pooling over the real tokens, then L2 normalization (the model's Normalize layer)
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, **kwargs):
+        """
+        Embed sentences (a string or a list); returns float32 rows in input
+        order, like SentenceTransformer.encode. Extra keyword arguments are
+        accepted for compatibility and ignored.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        # similar lengths per batch means less padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            embeddings[rows] = self._encode_batch([texts[i] for i in rows])
+        return embeddings[0] if single else embeddings
+
+
+def check_consistency(model, reference_model, data_dir=None, sources=None, sample=200,
+                      threshold=DEFAULT_THRESHOLD):
+    """
+    Compare the engine's embeddings with a fresh encode by reference_model
+    (the PyTorch SentenceTransformer) over up to `sample` texts per source
+    from data/<prefix>_texts.json. The stored *_embeddings.npy are not used:
+    they may have been produced by this same engine.
+
+    Returns:
+        dict: per source {"compared", "min", "mean"} (cosine similarity),
+              plus "passed": every compared text is at least threshold
+    """
+    from scripts.ingest_to_chromadb import SOURCES
+    from scripts.resources import get_project_root
+
+    data_dir = data_dir or os.path.join(get_project_root(), "data")
+    report = {"threshold": threshold, "sources": {}}
+    passed = True
+    for source in sources or SOURCES:
+        prefix = source["prefix"]
+        try:
+            with open(os.path.join(data_dir, f"{prefix}_texts.json"), "r", encoding="utf-8") as f:
+                texts = json.load(f)
+        except Exception as e:
+            print(f"Consistency check: skipping {prefix}: {e}")
+            continue
+        rows = list(range(len(texts)))
+        if len(rows) > sample:
+            rows = [int(i) for i in np.linspace(0, len(rows) - 1, sample)]
+        if not rows:
+            continue
+        sample_texts = [texts[i] for i in rows]
+        computed = np.asarray(model.encode(sample_texts), dtype=np.float32)
+        reference = np.asarray(reference_model.encode(sample_texts), dtype=np.float32)
+        reference /= np.clip(np.linalg.norm(reference, axis=1, keepdims=True), 1e-12, None)
+        similarity = (computed * reference).sum(axis=1)
+        report["sources"][prefix] = {
+            "compared": len(rows),
+            "min": float(similarity.min()),
+            "mean": float(similarity.mean()),
+        }
+        passed = passed and float(similarity.min()) >= threshold
+    report["passed"] = passed and bool(report["sources"])
+    return report
+
+
+def encode_latency(model, texts, repeats=3):
+    """Mean milliseconds to encode one text at a time (the query-time pattern)"""
+    model.encode(texts[:1])
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for text in texts:
+            model.encode([text])
+    return (time.perf_counter() - start) / (repeats * len(texts)) * 1000
+
+
+def main():
+    from scripts.resources import EMBEDDING_MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="ONNX Runtime engine for the embedding model")
+    parser.add_argument("--check", action="store_true", help="compare with the PyTorch model's embeddings")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="minimum cosine agreement")
+    parser.add_argument("--sample", type=int, default=200, help="texts compared per source")
+    parser.add_argument("--variant", choices=["fp32", "int8"], help="ONNX export (default: EMBEDDING_ONNX_VARIANT)")
+    parser.add_argument("--speed", action="store_true", help="also time single-query encoding against PyTorch")
+    args = parser.parse_args()
+
+    model = OnnxEmbeddingModel(EMBEDDING_MODEL_NAME, variant=args.variant)
+    print(f"Loaded {EMBEDDING_MODEL_NAME} ({model.variant}) on ONNX Runtime")
+    status = 0
+    torch_model = None
+    if args.check or args.speed:
+        from sentence_transformers import SentenceTransformer
+        torch_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    if args.check:
+        report = check_consistency(model, torch_model, sample=args.sample, threshold=args.threshold)
+        for prefix, stats in report["sources"].items():
+            print(f"{prefix:<24} compared {stats['compared']:>4}  min {stats['min']:.4f}  mean {stats['mean']:.4f}")
+        print("Consistency check " + ("passed" if report["passed"] else f"FAILED (threshold {args.threshold})"))
+        status = 0 if report["passed"] else 1
+    if args.speed:
+        from scripts.benchmark import DEFAULT_QUERIES
+        print(f"ONNX ({model.variant}): {encode_latency(model, DEFAULT_QUERIES):.2f} ms per query")
+        print(f"PyTorch: {encode_latency(torch_model, DEFAULT_QUERIES):.2f} ms per query")
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# package_attributes.py
+# Normalized numeric package attributes (price, validity, data, on-net minutes,
+# category) and a small parser for constraints such as "under Rs 200",
+# "7 days" or "5 GB" in user queries. Attributes are stored as ChromaDB
+# metadata at ingestion, so filters run inside the vector search. A package
+# that does not state an attribute (e.g. OCR'd texts without a validity) is
+# never excluded by a constraint on it.
+import re
+
+# numeric attributes; category is stored as a string
+NUMERIC_ATTRIBUTES = ("price_rs", "validity_days", "data_mb", "onnet_mins")
+
+NUMBER = r"(\d[\d,]*(?:\.\d+)?)"
+VALIDITY_WORDS = {"hourly": 1, "daily": 1, "weekly": 7, "fortnightly": 15, "monthly": 30}
+UNIT_DAYS = {"hour": 1, "hours": 1, "day": 1, "days": 1, "week": 7, "weeks": 7, "month": 30, "months": 30}
+
+# rendered package texts (see ingest_to_chromadb.SOURCES)
+PRICE_FIELD = re.compile(r"price:\s*(?:rs\.?|pkr)?\s*" + NUMBER)
+VALIDITY_FIELD = re.compile(r"validity:\s*([^.,]+)")
+DATA_FIELD = re.compile(r"data:\s*" + NUMBER + r"\s*(gb|mb)?")
+ONNET_FIELD = re.compile(r"on-net:\s*" + NUMBER)
+CATEGORY_FIELD = re.compile(r"category:\s*(?!n/a)([a-z][\w-]*)")
+DATA_AMOUNT = re.compile(NUMBER + r"\s*(gb|mb)\b")
+MINUTES_AMOUNT = re.compile(NUMBER + r"\s*(?:on-?net\s+)?(?:mins?|minutes)\b")
+DURATION = re.compile(r"(\d+)\s*-?\s*(hours?|days?|weeks?|months?)\b")
+
+# user queries
+PRICE_MARKER = r"(?:rs\.?|pkr|rupees?)"
+PRICE_AMOUNT = re.compile(PRICE_MARKER + r"\s*" + NUMBER + "|" + NUMBER + r"\s*" + PRICE_MARKER)
+# "at least 5 GB" or "under 30 days" is not a price
+NOT_AMOUNT = r"(?![\d.,])(?!\s*(?:gb|mb|mins?|minutes|sms|hours?|days?|weeks?|months?)\b)"
+PRICE_BETWEEN = re.compile(r"between\s+" + PRICE_MARKER + r"?\s*" + NUMBER + r"\s*(?:and|-|to)\s*"
+                           + PRICE_MARKER + r"?\s*" + NUMBER + NOT_AMOUNT)
+PRICE_MAX = re.compile(r"(?:under|below|less than|cheaper than|within|upto|up to|max(?:imum)?|at most)\s+"
+                       + PRICE_MARKER + r"?\s*" + NUMBER + NOT_AMOUNT)
+PRICE_MIN = re.compile(r"(?:above|over|more than|at least|min(?:imum)?)\s+" + PRICE_MARKER + r"?\s*" + NUMBER
+                       + NOT_AMOUNT)
+# "under 30 days" (group 1) or "at least 7 days" (group 2)
+DURATION_BOUND = re.compile(r"(?:(under|below|less than|within|upto|up to|at most|max(?:imum)?)|"
+                            r"(above|over|more than|at least|min(?:imum)?))\s+" + DURATION.pattern)
+
+
+def _number(text):
+    return float(text.replace(",", ""))
+
+
+def _data_mb(amount, unit):
+    # decimal, as the operators advertise it: 5 GB is 5000 MB
+    return _number(amount) * (1000 if unit == "gb" else 1)
+
+
+def _duration_days(amount, unit):
+    return max(1, amount // 24) if unit.startswith("hour") else amount * UNIT_DAYS[unit]
+
+
+def validity_days(text):
+    """Days of validity for "7 Days", "24 Hours", "Weekly", ...; None if unknown"""
+    text = text.lower()
+    match = DURATION.search(text)
+    if match:
+        return _duration_days(int(match.group(1)), match.group(2))
+    for word, days in VALIDITY_WORDS.items():
+        if word in text:
+            return days
+    return None
+
+
+def text_attributes(text):
+    """
+    Normalized attributes of a rendered package text.
+
+    Returns:
+        dict: attribute -> value, only for attributes found in the text
+    """
+    text = text.lower()
+    attributes = {}
+
+    match = PRICE_FIELD.search(text)
+    # a price of 0 is what older scrapes stored when the price did not parse
+    if match and _number(match.group(1)) > 0:
+        attributes["price_rs"] = _number(match.group(1))
+
+    match = VALIDITY_FIELD.search(text)
+    days = validity_days(match.group(1)) if match else None
+    if days is not None:
+        attributes["validity_days"] = days
+
+    # labelled fields first, free-text descriptions otherwise
+    match = DATA_FIELD.search(text) or DATA_AMOUNT.search(text)
+    if match:
+        attributes["data_mb"] = _data_mb(match.group(1), match.group(2))
+
+    match = ONNET_FIELD.search(text) or MINUTES_AMOUNT.search(text)
+    if match:
+        attributes["onnet_mins"] = _number(match.group(1))
+
+    match = CATEGORY_FIELD.search(text)
+    if match:
+        attributes["category"] = match.group(1)
+    return attributes
+
+
+def attribute_metadata(text):
+    """
+    ChromaDB metadata for a rendered package text: text_attributes plus a
+    has_<attribute> flag per numeric attribute, which lets chroma_where keep
+    the documents that do not state it.
+    """
+    attributes = text_attributes(text)
+    for name in NUMERIC_ATTRIBUTES:
+        attributes[f"has_{name}"] = name in attributes
+    return attributes
+
+
+def _hours_only(amount, unit):
+    return unit.startswith("hour") and amount < 24
+
+
+def validity_constraint(query):
+    """
+    Validity bounds of a lowercased query: {"max": days} for "under 30 days",
+    {"min": days} for "at least 7 days", {"eq": days} for a bare "weekly" or
+    "7 days". None for hourly packages, which are stored as 1 day like the
+    daily ones and cannot be told apart from them.
+    """
+    if "hourly" in query:
+        return None
+    bounds = {}
+    for match in DURATION_BOUND.finditer(query):
+        amount, unit = int(match.group(3)), match.group(4)
+        if _hours_only(amount, unit):
+            return None
+        bounds["max" if match.group(1) else "min"] = _duration_days(amount, unit)
+    if bounds:
+        return bounds
+    match = DURATION.search(query)
+    if match and _hours_only(int(match.group(1)), match.group(2)):
+        return None
+    days = validity_days(query)
+    return {"eq": days} if days is not None else None
+
+
+def parse_constraints(query):
+    """
+    Extract price, validity and data constraints from a user query.
+
+    Returns:
+        dict: attribute -> {"min": x} / {"max": x} / {"eq": x}, empty when
+              the query has no constraints
+    """
+    query = query.lower()
+    constraints = {}
+
+    match = PRICE_BETWEEN.search(query)
+    if match:
+        low, high = sorted((_number(match.group(1)), _number(match.group(2))))
+        constraints["price_rs"] = {"min": low, "max": high}
+    else:
+        price = {}
+        match = PRICE_MAX.search(query)
+        if match:
+            price["max"] = _number(match.group(1))
+        match = PRICE_MIN.search(query)
+        if match:
+            price["min"] = _number(match.group(1))
+        if not price:
+            # a bare "for Rs 200" is read as a budget
+            match = PRICE_AMOUNT.search(query)
+            if match:
+                price["max"] = _number(match.group(1) or match.group(2))
+        if price:
+            constraints["price_rs"] = price
+
+    validity = validity_constraint(query)
+    if validity:
+        constraints["validity_days"] = validity
+
+    match = DATA_AMOUNT.search(query)
+    if match:
+        constraints["data_mb"] = {"min": _data_mb(match.group(1), match.group(2))}
+    return constraints
+
+
+def matches_constraints(attributes, constraints):
+    """True if the attributes satisfy every constraint (missing attributes always match)"""
+    for name, bounds in constraints.items():
+        value = attributes.get(name)
+        if value is None:
+            continue
+        if "eq" in bounds and value != bounds["eq"]:
+            return False
+        if "min" in bounds and value < bounds["min"]:
+            return False
+        if "max" in bounds and value > bounds["max"]:
+            return False
+    return True
+
+
+def chroma_where(constraints):
+    """
+    ChromaDB where filter for the constraints, or None. Documents ingested
+    with attribute_metadata pass when they do not state the attribute.
+    """
+    operators = {"eq": "$eq", "min": "$gte", "max": "$lte"}
+    clauses = []
+    for name, bounds in constraints.items():
+        bound_clauses = [{name: {operators[op]: value}} for op, value in bounds.items()]
+        if not bound_clauses:
+            continue
+        bound = bound_clauses[0] if len(bound_clauses) == 1 else {"$and": bound_clauses}
+        clauses.append({"$or": [bound, {f"has_{name}": {"$eq": False}}]})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def filter_results(results, constraints):
+    """Keep only the documents of ChromaDB-shaped single-query results that match the constraints"""
+    filtered = []
+    for result in results:
+        keys = [key for key in ("ids", "documents", "metadatas", "distances", "scores") if result.get(key)]
+        rows = [
+            i for i, doc in enumerate(result["documents"][0])
+            if matches_constraints(text_attributes(doc), constraints)
+        ]
+        if rows:
+            filtered.append({key: [[result[key][0][i] for i in rows]] for key in keys})
+    return filtered
@@ -1,45 +1,70 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
 import concurrent.futures
+import contextvars
 import os
-import time
+from scripts.instrumentation import span
+from scripts.numpy_backend import get_numpy_index
+from scripts.package_attributes import chroma_where
+from scripts.resources import get_collection, list_collection_names, reopen
 
+def use_numpy_backend():
+    # RETRIEVAL_BACKEND: "chroma" (default) or "numpy" for the in-process exact-search backend
+    return os.getenv("RETRIEVAL_BACKEND", "chroma").lower() == "numpy"
 
+def _numpy_query(query_embeddings, collections, n_results=10, constraints=None):
+    with span("collection_query", backend="numpy", collections=len(collections), queries=len(query_embeddings)):
+        return get_numpy_index().query(query_embeddings, collections, n_results, constraints)
 
-def query_single_collection(chroma_path, collection_name, query_embedding, n_results=10):
-    """Query a single collection to be used in parallel execution"""
+def _submit(executor, fn, *args):
+    """Submit with the caller's context, so spans in the worker join its trace"""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+def list_available_collections(chroma_path):
+    """List the collections the selected retrieval backend can query"""
+    if use_numpy_backend():
+        return get_numpy_index().collection_names()
+    return list_collection_names(chroma_path)
+
+def query_single_collection(chroma_path, collection_name, query_embedding, n_results=10, constraints=None):
+    """
+    Query a single collection to be used in parallel execution.
+    constraints (see package_attributes.py) become a metadata where filter.
+    """
     try:
-        # create a new clint for each thread
-        client = chromadb.PersistentClient(path=chroma_path)
-        # check if the collection exists
+        # reuse the process-wide collection handle
         try:
-            collection = client.get_collection(name=collection_name)
+            collection = get_collection(collection_name, chroma_path)
         except Exception as e:
             print(f"Collection '{collection_name}' not found.")
             return (collection_name, None)
         # Query the collection
-        results = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results,
-                include=["documents", "metadatas", "distances"]
-            )
+        with span("collection_query", backend="chroma", collection=collection_name, filtered=bool(constraints)):
+            results = collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=n_results,
+                    where=chroma_where(constraints or {}),
+                    include=["documents", "metadatas", "distances"]
+                )
         return (collection_name, results)
     except Exception as e:
         print(f"Error querying {collection_name}: {str(e)}")
+        # the cached handle may be stale (collection rebuilt), reopen it next time
+        reopen(collection_name, chroma_path)
         return (collection_name, None)
 
-def query_all_collections_parallel(chroma_path, collections, query_embedding, n_results=10):
+def query_all_collections_parallel(chroma_path, collections, query_embedding, n_results=10, constraints=None):
         """Query multiple collections in parallel"""
+        if use_numpy_backend():
+            return _numpy_query([query_embedding], collections, n_results, constraints)
         results = {}
         # verify chromaDB path exists
         if not os.path.exists(chroma_path):
             print(f"ChromaDB path '{chroma_path}' does not exist.")
             return results
         
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(collections), 1)) as executor:
             # Submit all queries at once
             future_to_collection = {
-                executor.submit(query_single_collection, chroma_path, name, query_embedding, n_results): name
+                _submit(executor, query_single_collection, chroma_path, name, query_embedding, n_results, constraints): name
                 for name in collections
             }
             
@@ -56,17 +81,14 @@ def query_all_collections_parallel(chroma_path, collections, query_embedding, n_
         
         return results
 
-def query_all_sequential_collections(chroma_path, collections, query_embedding, n_results=10):
+def query_all_sequential_collections(chroma_path, collections, query_embedding, n_results=10, constraints=None):
     """fallback sequential query method"""
+    if use_numpy_backend():
+        return _numpy_query([query_embedding], collections, n_results, constraints)
     results = {}
-    try:
-        client = chromadb.PersistentClient(path=chroma_path)
-    except Exception as e:
-        print(f"Error connecting to ChromaDB client: {str(e)}")
-        return results
     # Get available collections
     try:
-        available_collections = [col.name for col in client.list_collections()]
+        available_collections = list_collection_names(chroma_path)
         print(f"Available collections: {available_collections}")
     except Exception as e:
         print(f"Error listing collections: {str(e)}")
@@ -79,16 +101,64 @@ def query_all_sequential_collections(chroma_path, collections, query_embedding,
             continue
         
         try:
-            collection = client.get_collection(name=collection_name)
-            result = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results,
-                include=["documents", "metadatas", "distances"]
-            )
+            collection = get_collection(collection_name, chroma_path)
+            with span("collection_query", backend="chroma", collection=collection_name, filtered=bool(constraints)):
+                result = collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=n_results,
+                    where=chroma_where(constraints or {}),
+                    include=["documents", "metadatas", "distances"]
+                )
             results[collection_name] = result
             print(f"Successfully queried {collection_name}")
         except Exception as e:
             print(f"Error querying {collection_name}: {str(e)}")
             continue
     
-    return results
\ No newline at end of file
+    return results
+
+def query_single_collection_batch(chroma_path, collection_name, query_embeddings, n_results=10):
+    """Query a single collection with many embeddings in one request"""
+    try:
+        try:
+            collection = get_collection(collection_name, chroma_path)
+        except Exception as e:
+            print(f"Collection '{collection_name}' not found: {str(e)}")
+            return (collection_name, None)
+        with span("collection_query", backend="chroma", collection=collection_name, queries=len(query_embeddings)):
+            results = collection.query(
+                    query_embeddings=list(query_embeddings),
+                    n_results=n_results,
+                    include=["documents", "metadatas", "distances"]
+                )
+        return (collection_name, results)
+    except Exception as e:
+        print(f"Error batch querying {collection_name}: {str(e)}")
+        reopen(collection_name, chroma_path)
+        return (collection_name, None)
+
+def query_all_collections_batch(chroma_path, collections, query_embeddings, n_results=10):
+    """
+    Query multiple collections with a batch of query embeddings.
+    Sends one multi-embedding request per collection; each returned result
+    holds one row per query embedding, in input order.
+    """
+    if use_numpy_backend():
+        return _numpy_query(query_embeddings, collections, n_results) if len(query_embeddings) else {}
+    results = {}
+    if not os.path.exists(chroma_path):
+        print(f"ChromaDB path '{chroma_path}' does not exist.")
+        return results
+    if len(query_embeddings) == 0 or not collections:
+        return results
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(collections)) as executor:
+        futures = [
+            _submit(executor, query_single_collection_batch, chroma_path, name, query_embeddings, n_results)
+            for name in collections
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            name, result = future.result()
+            if result is not None:
+                results[name] = result
+    return results
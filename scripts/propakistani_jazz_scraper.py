@@ -2,10 +2,22 @@ import os
 import json
 import time
 import re
+import argparse
+import asyncio
+import functools
+import hashlib
+import http.server
+import threading
+from urllib.parse import urljoin, urlparse
+import requests
 from dotenv import load_dotenv
 from agentql import wrap
+from playwright.async_api import async_playwright
 from playwright.sync_api import sync_playwright
 
+LISTING_URL = 'https://propakistani.pk/packages/mobilink-jazz-packages/'
+OUTPUT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'propakistani_jazz_packages.json'))
+
 def human_delay(a=1, b=2):
     time.sleep(a + (b - a) * 0.5)
 
@@ -31,7 +43,7 @@ def extract_package_from_row(row):
         
         # Extract price
         price_cell = cells[7] if len(cells) > 7 else None
-        price = "0"
+        price = None
         if price_cell:
             price_elem = price_cell.query_selector('.pack-price')
             if price_elem:
@@ -69,82 +81,292 @@ def extract_package_from_row(row):
         print(f"Error extracting package from row: {e}")
         return None
 
-def extract_subscription_code_from_page(page):
-    """Extract subscription code from the Mechanics section"""
-    try:
-        # Look for Mechanics section
-        mechanics_selectors = [
-            'h2:contains("Mechanics")',
-            'h3:contains("Mechanics")',
-            'h4:contains("Mechanics")',
-            '.mechanics',
-            '[class*="mechanics"]',
-            'div:contains("Mechanics")'
-        ]
-        
-        # Also look for subscription code patterns
-        code_patterns = [
-            r'SUB\s*\*\d+#',
-            r'\*\d+#',
-            r'Dial\s*\*\d+#',
-            r'Code:\s*\*\d+#',
-            r'Subscription:\s*\*\d+#',
-            r'Activation:\s*\*\d+#',
-            r'Subscribe:\s*\*\d+#'
-        ]
-        
-        page_content = page.content()
-        
-        # First try to find Mechanics section
-        for selector in mechanics_selectors:
-            try:
-                mechanics_elem = page.query_selector(selector)
-                if mechanics_elem:
-                    mechanics_text = mechanics_elem.inner_text()
-                    # Look for subscription code in mechanics text
-                    for pattern in code_patterns:
-                        match = re.search(pattern, mechanics_text, re.IGNORECASE)
-                        if match:
-                            return match.group(0).strip()
-            except:
-                continue
-        
-        # If no mechanics section found, search entire page content
-        for pattern in code_patterns:
-            match = re.search(pattern, page_content, re.IGNORECASE)
+# Subscription code patterns, tried on the Mechanics section first, then the whole page
+CODE_PATTERNS = [
+    r'SUB\s*\*\d+#',
+    r'\*\d+#',
+    r'Dial\s*\*\d+#',
+    r'Code:\s*\*\d+#',
+    r'Subscription:\s*\*\d+#',
+    r'Activation:\s*\*\d+#',
+    r'Subscribe:\s*\*\d+#'
+]
+
+# Requests the scraper never needs
+BLOCKED_RESOURCE_TYPES = {'image', 'font', 'media'}
+AD_HOSTS = (
+    'doubleclick.net', 'googlesyndication.com', 'googletagservices.com', 'googletagmanager.com',
+    'google-analytics.com', 'adservice.google', 'amazon-adsystem.com', 'taboola.com',
+    'outbrain.com', 'facebook.net'
+)
+
+# Collects everything the detail parser needs in one round trip to the browser
+DETAIL_PAGE_SCRIPT = """
+() => {
+    const text = el => ((el && el.innerText) || '').trim();
+    const first = sel => document.querySelector(sel);
+    const mechanics = [...document.querySelectorAll('h2, h3, h4, .mechanics, [class*="mechanics"]')]
+        .find(el => /mechanics/i.test(el.className) || /Mechanics/.test(el.innerText));
+    let mechanicsText = text(mechanics);
+    if (mechanics && /^H[2-4]$/.test(mechanics.tagName) && mechanics.nextElementSibling) {
+        mechanicsText += '\\n' + text(mechanics.nextElementSibling);
+    }
+    const descriptions = ['.package-description', '.description', '.entry-content p', '.post-content p', 'p']
+        .map(sel => text(first(sel)));
+    const terms = ['.terms', '.conditions', '[class*="terms"]', '[class*="conditions"]']
+        .map(first).find(Boolean);
+    return {
+        mechanics: mechanicsText,
+        descriptions: descriptions,
+        terms: text(terms),
+        content: document.documentElement.outerHTML
+    };
+}
+"""
+
+def find_subscription_code(mechanics_text, page_content):
+    """Find a subscription code in the Mechanics text, falling back to the whole page"""
+    for text in (mechanics_text, page_content):
+        if not text:
+            continue
+        for pattern in CODE_PATTERNS:
+            match = re.search(pattern, text, re.IGNORECASE)
             if match:
                 return match.group(0).strip()
-        
-        # Look for any text that contains subscription instructions
-        subscription_texts = page.query_selector_all('p, div, span')
-        for elem in subscription_texts:
+    return None
+
+def parse_detail_page(data):
+    """Turn the DETAIL_PAGE_SCRIPT output into the package detail fields"""
+    details = {}
+    subscription_code = find_subscription_code(data.get('mechanics'), data.get('content'))
+    details['subscription_code'] = subscription_code or "Not found"
+
+    # Only a substantial description
+    for desc_text in data.get('descriptions', []):
+        if len(desc_text) > 50:
+            details['description'] = desc_text
+            break
+
+    if data.get('terms'):
+        details['terms_conditions'] = data['terms']
+    return details
+
+def should_block(resource_type, url):
+    return resource_type in BLOCKED_RESOURCE_TYPES or any(host in url for host in AD_HOSTS)
+
+def _block_heavy_requests(route):
+    if should_block(route.request.resource_type, route.request.url):
+        route.abort()
+    else:
+        route.continue_()
+
+async def _ablock_heavy_requests(route):
+    if should_block(route.request.resource_type, route.request.url):
+        await route.abort()
+    else:
+        await route.continue_()
+
+class HostRateLimiter:
+    """Polite per-host pacing: at most one request per host every min_interval seconds"""
+    def __init__(self, min_interval=1.0):
+        self.min_interval = min_interval
+        self._next = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, url):
+        host = urlparse(url).netloc
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.min_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+async def _detail_worker(context, queue, limiter, total, timeout_ms):
+    page = await context.new_page()
+    try:
+        while True:
             try:
-                text = elem.inner_text()
-                if any(keyword in text.lower() for keyword in ['dial', 'code', 'subscription', 'activate', 'subscribe']):
-                    for pattern in code_patterns:
-                        match = re.search(pattern, text, re.IGNORECASE)
-                        if match:
-                            return match.group(0).strip()
-            except:
-                continue
-        
-        return None
+                i, package = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                print(f"Getting details for: {package['package_name']} ({i+1}/{total})")
+                await limiter.wait(package['package_url'])
+                await page.goto(package['package_url'], wait_until='domcontentloaded', timeout=timeout_ms)
+                details = parse_detail_page(await page.evaluate(DETAIL_PAGE_SCRIPT))
+                if details['subscription_code'] != "Not found":
+                    print(f"    ✓ Found subscription code: {details['subscription_code']}")
+                else:
+                    print("    ✗ No subscription code found")
+                package.update(details, details_fetched=True)
+            except Exception as e:
+                print(f"Error getting details for {package['package_name']}: {e}")
+    finally:
+        await page.close()
+
+async def fetch_package_details(packages, workers=4, headless=True, min_interval=1.0, timeout_ms=30000):
+    """
+    Visit the detail page of every package with a URL, using a bounded pool of
+    pages in one browser context. Images, fonts, media and ad hosts are blocked
+    and requests to the same host are paced by min_interval seconds.
+    Packages are updated in place.
+    """
+    queue = asyncio.Queue()
+    for i, package in enumerate(packages):
+        if package.get('package_url'):
+            queue.put_nowait((i, package))
+    if queue.empty():
+        return packages
+
+    limiter = HostRateLimiter(min_interval)
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=headless)
+        context = await browser.new_context()
+        await context.route("**/*", _ablock_heavy_requests)
+        await asyncio.gather(*(
+            _detail_worker(context, queue, limiter, len(packages), timeout_ms)
+            for _ in range(max(1, min(workers, queue.qsize())))
+        ))
+        await browser.close()
+    return packages
+
+def serve_fixtures(directory, port=0):
+    """
+    Serve a directory of saved HTML pages on localhost, so the scraper can be
+    run against fixtures. Returns (server, base_url); call server.shutdown() when done.
+    """
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+# details_fetched marks packages whose detail page was read successfully
+DETAIL_FIELDS = ('subscription_code', 'description', 'terms_conditions', 'details_fetched')
+
+def row_content_hash(row_key, cell_texts):
+    """Hash of a listing row: its data-row attribute plus the text of its cells"""
+    content = json.dumps([row_key] + [text.strip() for text in cell_texts], ensure_ascii=False)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
     except Exception as e:
-        print(f"Error extracting subscription code: {e}")
-        return None
+        print(f"Ignoring unreadable {path}: {e}")
+        return default
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def conditional_get_listing(url, listing_state):
+    """
+    Conditional GET of the listing page with the stored ETag / Last-Modified.
 
-def scrape_propakistani_jazz():
-    load_dotenv()
-    api_key = os.getenv('AGENTQL_API_KEY')
-    if not api_key:
-        raise RuntimeError('AGENTQL_API_KEY not set in environment variables or .env file.')
+    Returns:
+        tuple: (changed, validators to store after a successful run, the
+                fetched page as {"body", "content_type"} or None)
+    """
+    headers = {'User-Agent': 'Mozilla/5.0 (compatible; JazzPackagesBot/1.0)'}
+    if listing_state.get('etag'):
+        headers['If-None-Match'] = listing_state['etag']
+    if listing_state.get('last_modified'):
+        headers['If-Modified-Since'] = listing_state['last_modified']
+    try:
+        response = requests.get(url, headers=headers, timeout=30)
+    except requests.RequestException as e:
+        # keep the stored validators, so the next run can still get a 304
+        print(f"Conditional GET failed, scraping anyway: {e}")
+        return True, listing_state, None
+    if response.status_code == 304:
+        return False, listing_state, None
+    if response.status_code != 200:
+        print(f"Conditional GET returned {response.status_code}, scraping anyway")
+        return True, listing_state, None
+    validators = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified')
+    }
+    page = {'body': response.content, 'content_type': response.headers.get('Content-Type', 'text/html')}
+    return True, validators, page
+
+def compute_delta(previous_packages, packages):
+    """Added / changed / removed packages between two runs, matched by row_key"""
+    previous = {p['row_key']: p for p in previous_packages if p.get('row_key')}
+    current_keys = set()
+    delta = {'added': [], 'changed': [], 'removed': [], 'unchanged': 0}
+    for package in packages:
+        key = package.get('row_key')
+        current_keys.add(key)
+        old = previous.get(key)
+        if old is None:
+            delta['added'].append(package)
+        elif old.get('row_hash') != package.get('row_hash'):
+            delta['changed'].append(package)
+        else:
+            delta['unchanged'] += 1
+    delta['removed'] = [p for key, p in previous.items() if key not in current_keys]
+    return delta
+
+def scrape_propakistani_jazz(url=LISTING_URL, workers=4, headless=True, min_interval=1.0,
+                             output_path=OUTPUT_PATH, use_agentql=True, incremental=False):
+    """
+    Scrape the ProPakistani Jazz packages listing, then the package detail
+    pages with a pool of `workers` pages.
+
+    Args:
+        url (str): Listing page URL (a fixture server URL for offline runs)
+        workers (int): Concurrent detail pages
+        headless (bool): Run the browser headless
+        min_interval (float): Seconds between requests to the same host
+        output_path (str): Where to write the packages JSON
+        use_agentql (bool): Wrap the listing page with AgentQL (needs AGENTQL_API_KEY)
+        incremental (bool): Skip the run if the listing is unchanged (ETag /
+            Last-Modified) and only fetch detail pages of new or changed rows.
+            Writes <output>.delta.json and <output>.state.json next to the output.
+    """
+    if use_agentql:
+        load_dotenv()
+        api_key = os.getenv('AGENTQL_API_KEY')
+        if not api_key:
+            raise RuntimeError('AGENTQL_API_KEY not set in environment variables or .env file.')
+
+    delta_path = os.path.splitext(output_path)[0] + '.delta.json'
+    state_path = os.path.splitext(output_path)[0] + '.state.json'
+    previous_packages = load_json(output_path, []) if incremental else []
+    state = load_json(state_path, {}) if incremental else {}
+    listing_state = {}
+    listing_page = None
+    if incremental:
+        changed, listing_state, listing_page = conditional_get_listing(url, state.get('listing', {}))
+        if not changed and previous_packages:
+            print("Listing page not modified since the last run, nothing to do.")
+            write_json(delta_path, {'added': [], 'changed': [], 'removed': [], 'unchanged': len(previous_packages)})
+            return previous_packages
 
-    url = 'https://propakistani.pk/packages/mobilink-jazz-packages/'
     all_packages = []
     
     with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)
-        page = wrap(browser.new_page())
+        browser = p.chromium.launch(headless=headless)
+        page = browser.new_page()
+        page.route("**/*", _block_heavy_requests)
+        if listing_page is not None:
+            # the conditional GET already downloaded the listing; the browser gets
+            # that copy (routes registered later are tried first)
+            page.route(
+                lambda request_url: request_url == url,
+                lambda route: route.fulfill(
+                    status=200, content_type=listing_page['content_type'], body=listing_page['body']
+                )
+            )
+        if use_agentql:
+            page = wrap(page)
         
         print(f"Scraping: {url}")
         page.goto(url)
@@ -205,6 +427,13 @@ def scrape_propakistani_jazz():
                     package = extract_package_from_row(row)
                     if package:
                         package['category'] = category
+                        if package['package_url']:
+                            # fixture pages link their detail pages relatively
+                            package['package_url'] = urljoin(url, package['package_url'])
+                        row_key = row.get_attribute('data-row')
+                        cell_texts = row.evaluate("r => [...r.querySelectorAll('td')].map(td => td.innerText)")
+                        package['row_key'] = f"{category}:{row_key}"
+                        package['row_hash'] = row_content_hash(row_key, cell_texts)
                         category_packages.append(package)
                         
                         # Show subscription code if found in table
@@ -220,86 +449,44 @@ def scrape_propakistani_jazz():
                 print(f"Error processing {category} category: {e}")
                 continue
         
-        # Get detailed information for ALL packages by visiting their detail pages
-        print(f"\n=== GETTING DETAILED INFORMATION FOR ALL PACKAGES ===")
-        detailed_packages = []
-        
-        for i, package in enumerate(all_packages):
-            if package.get('package_url'):
-                try:
-                    print(f"Getting details for: {package['package_name']} ({i+1}/{len(all_packages)})")
-                    
-                    # Open package page in new tab
-                    new_page = browser.new_page()
-                    new_page.goto(package['package_url'])
-                    human_delay(2, 3)
-                    
-                    # Extract additional details
-                    details = {}
-                    
-                    # Extract subscription code from Mechanics section
-                    subscription_code = extract_subscription_code_from_page(new_page)
-                    if subscription_code:
-                        details['subscription_code'] = subscription_code
-                        print(f"    ✓ Found subscription code: {subscription_code}")
-                    else:
-                        details['subscription_code'] = "Not found"
-                        print(f"    ✗ No subscription code found")
-                    
-                    # Look for description
-                    desc_selectors = [
-                        '.package-description',
-                        '.description', 
-                        '.entry-content p',
-                        '.post-content p',
-                        'p'
-                    ]
-                    
-                    for selector in desc_selectors:
-                        desc_elem = new_page.query_selector(selector)
-                        if desc_elem:
-                            desc_text = desc_elem.inner_text().strip()
-                            if len(desc_text) > 50:  # Only if it's substantial
-                                details['description'] = desc_text
-                                break
-                    
-                    # Look for terms and conditions
-                    terms_selectors = [
-                        '.terms',
-                        '.conditions', 
-                        '[class*="terms"]',
-                        '[class*="conditions"]'
-                    ]
-                    
-                    for selector in terms_selectors:
-                        terms_elem = new_page.query_selector(selector)
-                        if terms_elem:
-                            details['terms_conditions'] = terms_elem.inner_text().strip()
-                            break
-                    
-                    # Add details to package
-                    package.update(details)
-                    detailed_packages.append(package)
-                    
-                    new_page.close()
-                    human_delay(1, 2)
-                    
-                except Exception as e:
-                    print(f"Error getting details for {package['package_name']}: {e}")
-                    detailed_packages.append(package)
-            else:
-                detailed_packages.append(package)
-        
         browser.close()
+
+    # Get detailed information for ALL packages by visiting their detail pages
+    # (in incremental mode only for new or changed rows and rows whose details
+    # could not be fetched before, the rest keep their details)
+    delta = compute_delta(previous_packages, all_packages)
+    if incremental:
+        previous = {p['row_key']: p for p in previous_packages if p.get('row_key')}
+        to_fetch = []
+        for package in all_packages:
+            old = previous.get(package['row_key'])
+            if old is not None and old.get('row_hash') == package['row_hash'] and old.get('details_fetched'):
+                package.update({field: old[field] for field in DETAIL_FIELDS if field in old})
+            else:
+                to_fetch.append(package)
+    else:
+        to_fetch = all_packages
+    print(f"\n=== GETTING DETAILED INFORMATION FOR {len(to_fetch)} PACKAGES ({workers} workers) ===")
+    asyncio.run(
+        fetch_package_details(to_fetch, workers=workers, headless=headless, min_interval=min_interval)
+    )
+    detailed_packages = all_packages
     
     # Save results
-    with open('propakistani_jazz_packages.json', 'w', encoding='utf-8') as f:
-        json.dump(detailed_packages, f, ensure_ascii=False, indent=2)
+    write_json(output_path, detailed_packages)
+    if incremental:
+        write_json(delta_path, delta)
+        # row changes are detected from the row_hash of the previous output
+        write_json(state_path, {'listing': listing_state})
+        print(
+            f"Delta: {len(delta['added'])} added, {len(delta['changed'])} changed, "
+            f"{len(delta['removed'])} removed, {delta['unchanged']} unchanged -> {delta_path}"
+        )
     
     print(f"\n=== SCRAPING COMPLETE ===")
     print(f"Total packages found: {len(all_packages)}")
     print(f"Detailed packages: {len(detailed_packages)}")
-    print(f"Results saved to: propakistani_jazz_packages.json")
+    print(f"Results saved to: {output_path}")
     
     # Print summary
     print(f"\n=== PACKAGE SUMMARY ===")
@@ -319,5 +506,33 @@ def scrape_propakistani_jazz():
     
     return detailed_packages
 
+def main():
+    parser = argparse.ArgumentParser(description="Scrape Jazz packages from ProPakistani")
+    parser.add_argument('--workers', type=int, default=4, help='concurrent detail pages')
+    parser.add_argument('--headful', action='store_true', help='show the browser window')
+    parser.add_argument('--min-interval', type=float, default=1.0, help='seconds between requests to one host')
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    parser.add_argument('--fixtures', help='serve this directory locally and scrape its index.html instead')
+    parser.add_argument('--incremental', action='store_true',
+                        help='skip unchanged listings and only fetch details of new or changed rows')
+    args = parser.parse_args()
+
+    if args.fixtures:
+        server, base_url = serve_fixtures(args.fixtures)
+        try:
+            scrape_propakistani_jazz(
+                f"{base_url}/index.html", workers=args.workers, headless=not args.headful,
+                min_interval=0, output_path=args.output, use_agentql=False,
+                incremental=args.incremental
+            )
+        finally:
+            server.shutdown()
+    else:
+        scrape_propakistani_jazz(
+            workers=args.workers, headless=not args.headful,
+            min_interval=args.min_interval, output_path=args.output,
+            incremental=args.incremental
+        )
+
 if __name__ == '__main__':
-    scrape_propakistani_jazz()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,222 @@
+# query_embedding_cache.py
+# LRU cache of query embeddings, keyed by a normalized form of the query
+# (case, whitespace, punctuation and filler words do not matter), so repeated
+# questions skip the encoder. With QUERY_EMBEDDING_CACHE_PATH set, a
+# memory-mapped slot table in that file is shared by every process on the
+# host (e.g. the workers of scripts/serve.py).
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from scripts.duckWebSearch import QUERY_STOP_WORDS
+from scripts.instrumentation import increment
+from scripts.resources import embedding_model_key
+
+try:
+    import fcntl
+except ImportError:  # Windows: no shared store
+    fcntl = None
+
+# all-MiniLM-L6-v2
+DIMENSION = 384
+KEY_BYTES = 16
+
+_lock = threading.Lock()
+_cache = None
+
+
+def normalize_query(query):
+    """Lowercase, drop surrounding punctuation and filler words, collapse whitespace"""
+    words = (word.strip("?!.,;:'\"()") for word in query.lower().split())
+    return " ".join(word for word in words if word and word not in QUERY_STOP_WORDS)
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+class SharedEmbeddingStore:
+    """
+    Fixed-size, direct-mapped table of embeddings in a memory-mapped file:
+    slot = hash(key) % slots, a newer key overwrites an older one in its slot.
+    Writers take an exclusive file lock; readers are lock-free and re-check
+    the slot's key after copying the vector, so a concurrent overwrite reads
+    as a miss rather than a wrong embedding.
+    """
+
+    def __init__(self, path, slots=16384, dimension=DIMENSION):
+        self.path = path
+        self.slots = slots
+        self.dimension = dimension
+        size = slots * (KEY_BYTES + 4 * dimension)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a+b")
+        with self._locked():
+            current = os.fstat(self._file.fileno()).st_size
+            if current == 0:
+                self._file.truncate(size)
+            elif current != size:
+                # other processes may have it mapped, so it is never resized
+                raise ValueError(f"{path} has a different layout (slots/dimension), remove it first")
+        self._keys = np.memmap(path, dtype=np.uint8, mode="r+", shape=(slots, KEY_BYTES))
+        self._vectors = np.memmap(path, dtype=np.float32, mode="r+", offset=slots * KEY_BYTES,
+                                  shape=(slots, dimension))
+
+    @contextmanager
+    def _locked(self):
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _slot(self, digest):
+        return int.from_bytes(digest[:8], "little") % self.slots
+
+    def get(self, digest):
+        slot = self._slot(digest)
+        if self._keys[slot].tobytes() != digest:
+            return None
+        vector = np.array(self._vectors[slot])
+        return vector if self._keys[slot].tobytes() == digest else None
+
+    def put(self, digest, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        if embedding.shape != (self.dimension,):
+            return
+        slot = self._slot(digest)
+        with self._locked():
+            self._keys[slot] = 0
+            self._vectors[slot] = embedding
+            self._keys[slot] = np.frombuffer(digest, dtype=np.uint8)
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU of query embeddings in front of an optional shared store.
+
+    Args:
+        max_entries (int): LRU capacity of this process
+        shared (SharedEmbeddingStore): Cross-process store, or None
+    """
+
+    def __init__(self, max_entries=1024, shared=None):
+        self.max_entries = max_entries
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, query):
+        # the engine is part of the key: ONNX and PyTorch vectors differ slightly
+        return _digest(f"{embedding_model_key()}\n{normalize_query(query)}")
+
+    def get(self, key):
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if embedding is not None:
+            increment("query_embedding_cache_total", result="hit")
+            return embedding
+        if self.shared is not None:
+            embedding = self.shared.get(key)
+            if embedding is not None:
+                self._remember(key, embedding)
+                with self._lock:
+                    self.shared_hits += 1
+                increment("query_embedding_cache_total", result="shared_hit")
+                return embedding
+        with self._lock:
+            self.misses += 1
+        increment("query_embedding_cache_total", result="miss")
+        return None
+
+    def _remember(self, key, embedding):
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, key, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self._remember(key, embedding)
+        if self.shared is not None:
+            self.shared.put(key, embedding)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+def get_query_embedding_cache():
+    """Return the shared query embedding cache configured from the environment"""
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                shared = None
+                path = os.getenv("QUERY_EMBEDDING_CACHE_PATH")
+                if path and fcntl is None:
+                    print("QUERY_EMBEDDING_CACHE_PATH needs file locking (not available here), ignoring it")
+                elif path:
+                    try:
+                        shared = SharedEmbeddingStore(
+                            path, slots=int(os.getenv("QUERY_EMBEDDING_CACHE_SLOTS", "16384"))
+                        )
+                    except Exception as e:
+                        print(f"Could not open shared query embedding cache {path}: {str(e)}")
+                _cache = QueryEmbeddingCache(
+                    max_entries=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024")),
+                    shared=shared,
+                )
+    return _cache
+
+
+def query_embedding_cache_enabled():
+    return os.getenv("QUERY_EMBEDDING_CACHE", "1") != "0"
+
+
+def encode_queries(queries, get_model, batch_size=32):
+    """
+    Embeddings of queries (array in input order), encoding only the cache
+    misses, in one call. get_model is only called if something misses.
+    """
+    queries = list(queries)
+    if not query_embedding_cache_enabled():
+        return np.asarray(get_model().encode(queries, batch_size=batch_size))
+    cache = get_query_embedding_cache()
+    keys = [cache.key(query) for query in queries]
+    embeddings = [cache.get(key) for key in keys]
+    missing = {}
+    for i, (key, embedding) in enumerate(zip(keys, embeddings)):
+        if embedding is None:
+            # repeated queries in one batch are encoded once
+            missing.setdefault(key, []).append(i)
+    if missing:
+        new_embeddings = get_model().encode([queries[rows[0]] for rows in missing.values()], batch_size=batch_size)
+        for (key, rows), embedding in zip(missing.items(), new_embeddings):
+            cache.put(key, embedding)
+            for i in rows:
+                embeddings[i] = embedding
+    return np.stack(embeddings) if embeddings else np.zeros((0, DIMENSION), dtype=np.float32)
+
+
+def encode_query(query, get_model):
+    """Embedding of one query, through the cache"""
+    return encode_queries([query], get_model)[0]
@@ -1,25 +1,35 @@
 # def query_llm(user_query):
+import asyncio
 import os
-import requests
-from dotenv import load_dotenv
-from scripts.parallelchroma import query_all_collections_parallel, query_all_sequential_collections
-from scripts.result_combiner import combine_and_rank_results
-from scripts.duckWebSearch import search_jazz_with_bang, determine_source_type, remove_duplicate_results
-from sentence_transformers import SentenceTransformer
-from scripts.format_bang_results import format_bang_results
-import chromadb
-
-load_dotenv()
-
-def get_project_root():
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    markers = ['requirements.txt', 'README.MD']
-    while current_dir != os.path.dirname(current_dir):
-        if any(os.path.exists(os.path.join(current_dir, marker)) for marker in markers):
-            return current_dir
-        current_dir = os.path.dirname(current_dir)
-        
-    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+import sys
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.parallelchroma import list_available_collections, query_all_collections_batch, query_all_collections_parallel, query_all_sequential_collections
+from scripts.result_combiner import combine_and_rank_batch_results, combine_and_rank_results
+from scripts.duckWebSearch import asearch_jazz_with_bang, search_jazz_with_bang
+from scripts.context_builder import build_context, estimate_tokens
+from scripts.bm25_index import hybrid_fusion, lexical_search
+from scripts.package_attributes import filter_results, parse_constraints
+from scripts.canonical_packages import collapse_duplicates
+from scripts.resources import COLLECTIONS, get_chroma_path, get_embedding_model, load_environment, warmup_in_background
+from scripts.response_cache import get_response_cache, response_cache_enabled
+from scripts.query_embedding_cache import encode_queries, encode_query
+from scripts.batch_encoder import get_query_encoder
+from scripts.llm_client import LLMError, get_llm_client
+from scripts.instrumentation import configure_from_env, increment, log_event, record, span, timed
+from scripts.web_search_cache import web_search_cache_enabled
+
+NO_RESULTS_RESPONSE = "I couldn't find any relevant information about Jazz packages in our database."
+
+# Keywords indicating latest/current information
+LATEST_KEYWORDS = [
+    'latest', 'current', 'new package', 'today', 'now', 'recent', 'updated',
+    '2024', 'this month', 'this week', 'available now'
+]
+
+# Specific package types that may not be in the database
+PACKAGE_TYPES = ['5g', '4g', 'unlimited', 'night', 'student', 'senior']
+
 def should_use_bang_search(query, database_results):
     """
     Determine if we should use bang search based on query and database results
@@ -29,105 +39,165 @@ def should_use_bang_search(query, database_results):
         return True
     
     # Check for keywords indicating latest/current information
-    latest_keywords = [
-        'latest', 'current', 'new package', 'today', 'now', 'recent', 'updated',
-        '2024', 'this month', 'this week', 'available now'
-    ]
-    
     query_lower = query.lower()
-    if any(keyword in query_lower for keyword in latest_keywords):
+    if any(keyword in query_lower for keyword in LATEST_KEYWORDS):
         return True
     
     # Check for specific package types not in database
-    package_types = ['5g', '4g', 'unlimited', 'night', 'student', 'senior']
-    if any(ptype in query_lower for ptype in package_types):
+    if any(ptype in query_lower for ptype in PACKAGE_TYPES):
         # Check if database results contain these types
         db_text = ' '.join(database_results["documents"]).lower()
-        if not any(ptype in db_text for ptype in package_types):
+        if not any(ptype in db_text for ptype in PACKAGE_TYPES):
             return True
     
     return False
 
-def query_llm(user_query):
-    if not os.getenv("GROQ_API_KEY"):
-        raise ValueError("GROQ_API_KEY not set in environment variables")
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        return "GROQ_API_KEY not set!"
+def bang_search_likely(query):
+    """
+    Keyword part of should_use_bang_search, known before the database results.
+    True when web search will be used (latest keywords) or may be (package types).
+    """
+    query_lower = query.lower()
+    return any(keyword in query_lower for keyword in LATEST_KEYWORDS + PACKAGE_TYPES)
+
+def retrieve_batch(user_queries, n_results=10, batch_size=64):
+    """
+    Retrieve database results for many queries at once.
+    Encodes the queries missing from the query embedding cache in one
+    model.encode call and sends one multi-embedding request per collection.
 
-    project_root = get_project_root()
-    chroma_path = os.path.join(project_root, "data", "chroma_db")
+    Args:
+        user_queries (list): The user queries
+        n_results (int): Results per collection per query
+        batch_size (int): Encoder batch size
 
-    # First, verify ChromaDB and collections exist
+    Returns:
+        list: One combined result per query (same shape as combine_and_rank_results)
+    """
+    user_queries = list(user_queries)
+    if not user_queries:
+        return []
+
+    chroma_path = get_chroma_path()
     try:
-        client = chromadb.PersistentClient(path=chroma_path)
-        available_collections = [col.name for col in client.list_collections()]
-        print(f"Available collections: {available_collections}")
+        available_collections = list_available_collections(chroma_path)
     except Exception as e:
-        return f"Error connecting to ChromaDB: {str(e)}"
-    
-    # load embedding model
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    
-    # Generate query embedding
-    query_embedding = model.encode([user_query])[0]
-
-    # Define collections to query
-    collections = ['jazz_packages', 'propakistani_packages', 'ocr_packages']
-    
-    # Filter to only include collections that exist
-    existing_collections = [col for col in collections if col in available_collections]
+        print(f"Error connecting to ChromaDB: {str(e)}")
+        return [combine_and_rank_results([]) for _ in user_queries]
+    existing_collections = [col for col in COLLECTIONS if col in available_collections]
     if not existing_collections:
-        return "No valid collections found in ChromaDB."
-    
+        return [combine_and_rank_results([]) for _ in user_queries]
+
+    query_embeddings = encode_queries(user_queries, get_embedding_model, batch_size=batch_size)
+    collection_results_dict = query_all_collections_batch(
+        chroma_path, existing_collections, query_embeddings, n_results=n_results
+    )
+    lexical_results = [lexical_search(query, existing_collections, n_results) for query in user_queries]
+    if None in lexical_results:
+        lexical_results = None
+    batch_results = combine_and_rank_batch_results(
+        list(collection_results_dict.values()), len(user_queries), lexical_results, fusion=hybrid_fusion()
+    )
+    return [collapse_duplicates(combined) for combined in batch_results]
+
+def _existing_collections(chroma_path):
+    """Collections to query: the known package collections that exist in the store"""
+    available_collections = list_available_collections(chroma_path)
+    print(f"Available collections: {available_collections}")
+    return [col for col in COLLECTIONS if col in available_collections]
+
+def _query_collections(chroma_path, existing_collections, query_embedding, constraints=None):
     print(f"Querying existing collections: {existing_collections}")
     
     # Try parallel querying first
     print("Attempting parallel query...")
     collection_results_dict = query_all_collections_parallel(
-        chroma_path, existing_collections, query_embedding, n_results=10
+        chroma_path, existing_collections, query_embedding, n_results=10, constraints=constraints
     )
     
     # If parallel query failed, try sequential
     if not collection_results_dict:
         print("Parallel query failed, trying sequential...")
         collection_results_dict = query_all_sequential_collections(
-            chroma_path, existing_collections, query_embedding, n_results=10
+            chroma_path, existing_collections, query_embedding, n_results=10, constraints=constraints
         )
     
-    # Convert dictionary values to list for combining
-    collection_results = list(collection_results_dict.values())
-    
-    if not collection_results:
-        return "I couldn't find any relevant information about Jazz packages in our database."
-    
-    # Combine and rank results
-    combined_results = combine_and_rank_results(collection_results)
+    return collection_results_dict
 
-    # Build context with source information
-    retrieved_info = ""
-    for doc, metadata in zip(combined_results["documents"], combined_results["metadatas"]):
-        source = metadata.get("source", "Unknown")
-        retrieved_info += f"Source: {source}\n{doc}\n\n"
-    
-       # If no results found
-    if not combined_results["documents"]:
-        return "I couldn't find any relevant information about Jazz packages in our database."
+def _has_documents(collection_results):
+    return any(result.get("documents") and result["documents"][0] for result in collection_results)
 
-    # Check if we should use bang search
-    if should_use_bang_search(user_query, combined_results):
-        print("Using DuckDuckGo bang search for latest packages...")
-        bang_results = search_jazz_with_bang(user_query)
-        
-        if bang_results:
-            # Format bang search results
-            bang_info = format_bang_results(bang_results)
-            retrieved_info += f"\n{bang_info}"
-        else:
-            retrieved_info += "\nNo recent packages found online.\n"
-    
+def _filtered_query_collections(chroma_path, existing_collections, query_embedding, constraints):
+    """
+    Query only the packages matching the price/validity/data constraints of the
+    query. Collections where nothing matches (e.g. stores ingested before
+    packages without an attribute were let through) are searched unfiltered,
+    and when no collection matches the constraints are dropped.
+
+    Returns:
+        tuple: (collection results, constraints that were applied)
+    """
+    if not constraints:
+        return list(_query_collections(chroma_path, existing_collections, query_embedding).values()), {}
+    print(f"Filtering packages on {constraints}")
+    results = _query_collections(chroma_path, existing_collections, query_embedding, constraints)
+    unmatched = [name for name in existing_collections if not _has_documents([results.get(name, {})])]
+    if len(unmatched) == len(existing_collections):
+        constraints = {}
+    if unmatched:
+        print(f"No packages match the filters in {unmatched}, searching them without...")
+        results.update(_query_collections(chroma_path, unmatched, query_embedding))
+    return [results[name] for name in existing_collections if name in results], constraints
+
+def _combine_results(user_query, existing_collections, collection_results, constraints=None):
+    """
+    Rank vector results, fused with BM25 results when the lexical index is
+    available, keeping one hit per canonical package.
+    """
+    lexical_results = lexical_search(user_query, existing_collections)
+    if lexical_results is not None and constraints:
+        lexical_results = filter_results(lexical_results, constraints)
+    return collapse_duplicates(
+        combine_and_rank_results(collection_results, lexical_results, fusion=hybrid_fusion())
+    )
+
+def _assemble_prompt(user_query, combined_results, bang_results=None, web_searched=False):
+    """Token-budgeted context (see context_builder.py) and the final prompt, with its size logged"""
+    with timed("context"):
+        retrieved_info, stats = build_context(combined_results, bang_results, web_searched)
+        prompt = build_prompt(user_query, retrieved_info)
+    prompt_tokens = estimate_tokens(prompt)
+    print(
+        f"Context: {stats['kept']}/{stats['hits']} packages, {stats['web']} web results, "
+        f"~{stats['tokens']} tokens (prompt ~{prompt_tokens} tokens)"
+    )
+    log_event("context", prompt_tokens=prompt_tokens, **stats)
+    increment("prompt_tokens_total", prompt_tokens)
+    return prompt
+
+def _lookup_cached_response(user_query, query_embedding, combined_results):
+    """
+    Decide whether web search is needed and, if not, look the answer up in the cache.
+    Answers that need live web results are never served from the cache.
+
+    Returns:
+        tuple: (use_bang_search, use_cache, cached_response or None)
+    """
+    use_bang_search = should_use_bang_search(user_query, combined_results)
+    if use_bang_search:
+        increment("web_search_triggered_total")
+    use_cache = response_cache_enabled() and not use_bang_search
+    cached_response = None
+    if use_cache:
+        cached_response = get_response_cache().get(query_embedding, combined_results["ids"])
+        increment("response_cache_lookups_total", result="miss" if cached_response is None else "hit")
+        if cached_response is not None:
+            print(f"Response cache hit {get_response_cache().stats()}")
+    return use_bang_search, use_cache, cached_response
+
+def build_prompt(user_query, retrieved_info):
     # Construct prompt for LLM
-    prompt = (
+    return (
     "You are JazzBot, a helpful assistant for Jazz, the mobile telecom company in Pakistan. "
     "Your job is to help users find the best mobile packages including internet, SMS, and call bundles.\n\n"
     "Here are the top relevant results from our database and web search:\n"
@@ -142,23 +212,246 @@ def query_llm(user_query):
     "Based on the information provided above, respond with a list of packages that match the user's request."
 )
 
-    llm_model = "meta-llama/llama-4-scout-17b-16e-instruct"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": llm_model,
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 1024,
-        "temperature": 0.7
+def prepare_query(user_query):
+    """
+    Run retrieval (and web search when needed) and build the LLM prompt.
+
+    Returns:
+        dict: {"response": text} when the answer is already known (error,
+              no results or cache hit), otherwise the prompt plus what is
+              needed to make the LLM call and cache its answer
+    """
+    load_environment()
+    configure_from_env()
+    # fail early on a missing API key
+    get_llm_client()
+    chroma_path = get_chroma_path()
+
+    # First, verify ChromaDB and collections exist
+    try:
+        existing_collections = _existing_collections(chroma_path)
+    except Exception as e:
+        return {"response": f"Error connecting to ChromaDB: {str(e)}"}
+    
+    # Generate query embedding (repeated queries come from the cache, concurrent
+    # misses are encoded together by the batch encoder)
+    with timed("encode"):
+        query_embedding = encode_query(user_query, get_query_encoder)
+
+    if not existing_collections:
+        return {"response": "No valid collections found in ChromaDB."}
+    
+    with timed("retrieval"):
+        collection_results, constraints = _filtered_query_collections(
+            chroma_path, existing_collections, query_embedding, parse_constraints(user_query)
+        )
+    if not collection_results:
+        return {"response": NO_RESULTS_RESPONSE}
+    
+    # Combine and rank results
+    with timed("combine"):
+        combined_results = _combine_results(user_query, existing_collections, collection_results, constraints)
+    if not combined_results["documents"]:
+        return {"response": NO_RESULTS_RESPONSE}
+
+    use_bang_search, use_cache, cached_response = _lookup_cached_response(user_query, query_embedding, combined_results)
+    if cached_response is not None:
+        return {"response": cached_response}
+
+    # Check if we should use bang search
+    bang_results = None
+    if use_bang_search:
+        print("Using DuckDuckGo bang search for latest packages...")
+        with timed("web_search"):
+            bang_results = search_jazz_with_bang(user_query)
+
+    return {
+        "prompt": _assemble_prompt(user_query, combined_results, bang_results, use_bang_search),
+        "query_embedding": query_embedding,
+        "combined_results": combined_results,
+        "use_cache": use_cache,
     }
-    response = requests.post(
-        "https://api.groq.com/openai/v1/chat/completions",
-        headers=headers,
-        json=data
-    )
-    if response.status_code == 200:
-        return response.json()["choices"][0]["message"]["content"]
-    else:
-        return f"Error: {response.text}"
\ No newline at end of file
+
+def _discard_result(task):
+    # retrieve the outcome so a failed background search is not reported as unhandled
+    if not task.cancelled():
+        task.exception()
+
+def _encode_query(user_query):
+    with timed("encode"):
+        return encode_query(user_query, get_query_encoder)
+
+async def aprepare_query(user_query):
+    """
+    asyncio variant of prepare_query.
+    Encoding and the collection lookup overlap, the collections are queried
+    concurrently, and web search starts speculatively as soon as the query's
+    keywords suggest it will be needed.
+    """
+    load_environment()
+    configure_from_env()
+    # fail early on a missing API key
+    get_llm_client()
+    chroma_path = get_chroma_path()
+
+    web_task = None
+    use_bang_search = False
+    # a search thread cannot be stopped once started, so only speculate when an
+    # unneeded result is not thrown away but kept in the web search cache
+    if web_search_cache_enabled() and bang_search_likely(user_query):
+        print("Starting DuckDuckGo bang search speculatively...")
+        web_task = asyncio.create_task(asearch_jazz_with_bang(user_query))
+    try:
+        collections_task = asyncio.to_thread(_existing_collections, chroma_path)
+        encode_task = asyncio.to_thread(_encode_query, user_query)
+        existing_collections, query_embedding = await asyncio.gather(
+            collections_task, encode_task, return_exceptions=True
+        )
+        if isinstance(existing_collections, Exception):
+            return {"response": f"Error connecting to ChromaDB: {str(existing_collections)}"}
+        # an encoding error propagates, as in prepare_query
+        if isinstance(query_embedding, Exception):
+            raise query_embedding
+
+        if not existing_collections:
+            return {"response": "No valid collections found in ChromaDB."}
+
+        # the collections are queried in parallel on the helper's own threads
+        retrieval_start = time.perf_counter()
+        collection_results, constraints = await asyncio.to_thread(
+            _filtered_query_collections, chroma_path, existing_collections, query_embedding,
+            parse_constraints(user_query)
+        )
+        record("retrieval", time.perf_counter() - retrieval_start)
+        if not collection_results:
+            return {"response": NO_RESULTS_RESPONSE}
+
+        with timed("combine"):
+            combined_results = _combine_results(user_query, existing_collections, collection_results, constraints)
+        if not combined_results["documents"]:
+            return {"response": NO_RESULTS_RESPONSE}
+
+        use_bang_search, use_cache, cached_response = _lookup_cached_response(user_query, query_embedding, combined_results)
+        if cached_response is not None:
+            return {"response": cached_response}
+
+        bang_results = None
+        if use_bang_search:
+            print("Using DuckDuckGo bang search for latest packages...")
+            web_start = time.perf_counter()
+            bang_results = await (web_task or asearch_jazz_with_bang(user_query))
+            # time spent waiting; the speculative search may have started earlier
+            record("web_search", time.perf_counter() - web_start)
+
+        return {
+            "prompt": _assemble_prompt(user_query, combined_results, bang_results, use_bang_search),
+            "query_embedding": query_embedding,
+            "combined_results": combined_results,
+            "use_cache": use_cache,
+        }
+    finally:
+        if web_task is not None:
+            increment("web_search_speculative_total", used=use_bang_search)
+            if not use_bang_search:
+                # not awaited: it finishes in the background into the web search cache
+                web_task.add_done_callback(_discard_result)
+
+def _cache_answer(request, answer):
+    if request["use_cache"] and answer:
+        combined_results = request["combined_results"]
+        sources = [metadata.get("source") for metadata in combined_results["metadatas"]]
+        get_response_cache().put(request["query_embedding"], combined_results["ids"], answer, sources)
+
+def query_llm(user_query):
+    with timed("query"):
+        request = prepare_query(user_query)
+        if "response" in request:
+            return request["response"]
+
+        try:
+            with timed("llm"):
+                answer = get_llm_client().complete(request["prompt"])
+        except LLMError as e:
+            increment("llm_errors_total")
+            return f"Error: {e}"
+        _cache_answer(request, answer)
+        return answer
+
+async def aquery_llm(user_query):
+    """
+    asyncio-native query_llm: overlaps the collection queries and web search
+    (see aprepare_query) and reuses a pooled HTTP client for the LLM.
+    """
+    with timed("query"):
+        request = await aprepare_query(user_query)
+        if "response" in request:
+            return request["response"]
+
+        try:
+            with timed("llm"):
+                answer = await get_llm_client().acomplete(request["prompt"])
+        except LLMError as e:
+            increment("llm_errors_total")
+            return f"Error: {e}"
+        _cache_answer(request, answer)
+        return answer
+
+def stream_query_llm(user_query):
+    """
+    Streaming variant of query_llm.
+    Yields the answer piece by piece as the LLM's SSE stream delivers the tokens.
+    """
+    start = time.perf_counter()
+    with span("prepare"):
+        request = prepare_query(user_query)
+    if "response" in request:
+        record("query", time.perf_counter() - start)
+        yield request["response"]
+        return
+
+    parts = []
+    llm_start = time.perf_counter()
+    try:
+        for token in get_llm_client().stream(request["prompt"]):
+            if not parts:
+                record("llm_first_token", time.perf_counter() - llm_start)
+            parts.append(token)
+            yield token
+    except LLMError as e:
+        increment("llm_errors_total")
+        yield f"Error: {e}"
+        return
+    # the time the consumer spends between tokens is included
+    record("llm", time.perf_counter() - llm_start)
+    record("query", time.perf_counter() - start)
+    _cache_answer(request, "".join(parts))
+
+def main():
+    """Terminal chat loop, printing the answer as it streams in"""
+    load_environment()
+    # load the model while the user types the first question
+    warmup_in_background()
+    print("JazzBot: ask about Jazz packages. Type 'exit', 'quit' or 'bye' to end the chat.")
+    while True:
+        try:
+            user_query = input("\nAsk about a Jazz package: ").strip()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if not user_query:
+            continue
+        if user_query.lower() in ("exit", "quit", "bye"):
+            break
+        print("Processing...")
+        try:
+            print_header = True
+            for token in stream_query_llm(user_query):
+                if print_header:
+                    print("\nLLM Response:")
+                    print_header = False
+                print(token, end="", flush=True)
+            print()
+        except Exception as e:
+            print(f"Error: {e}")
+
+if __name__ == "__main__":
+    main()
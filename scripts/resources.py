@@ -0,0 +1,217 @@
+# resources.py
+# Process-wide registry for the expensive, reusable resources of the chatbot:
+# the sentence embedding model, the ChromaDB client and its collection handles.
+# chromadb and sentence_transformers (with torch) are imported on first use, so
+# importing the query path stays cheap until a model or store is needed.
+import os
+import threading
+
+from scripts.instrumentation import timed
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+COLLECTIONS = ['jazz_packages', 'propakistani_packages', 'ocr_packages']
+
+_lock = threading.RLock()
+_model = None
+_clients = {}
+_collections = {}
+_collection_names = {}
+_invalidation_hooks = []
+_env_loaded = False
+
+
+def get_project_root():
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    markers = ['requirements.txt', 'README.MD']
+    while current_dir != os.path.dirname(current_dir):
+        if any(os.path.exists(os.path.join(current_dir, marker)) for marker in markers):
+            return current_dir
+        current_dir = os.path.dirname(current_dir)
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_chroma_path():
+    return os.path.join(get_project_root(), "data", "chroma_db")
+
+
+def load_environment():
+    """Load the project's .env into os.environ, once per process"""
+    global _env_loaded
+    if _env_loaded:
+        return
+    with _lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv()
+            _env_loaded = True
+
+
+def embedding_engine():
+    """EMBEDDING_ENGINE: "torch" (SentenceTransformer, default) or "onnx" (ONNX Runtime)"""
+    engine = os.getenv("EMBEDDING_ENGINE", "torch").lower()
+    if engine not in ("torch", "onnx"):
+        raise ValueError(f"Unknown EMBEDDING_ENGINE '{engine}' (expected torch or onnx)")
+    return engine
+
+
+def embedding_model_key():
+    """
+    Name of the embeddings the current engine produces, e.g. for the
+    embedding cache: ONNX (and quantized) vectors are close to, but not
+    identical with, the PyTorch ones.
+    """
+    if embedding_engine() == "onnx":
+        from scripts.onnx_embedding import onnx_variant
+        return f"{EMBEDDING_MODEL_NAME}-onnx-{onnx_variant()}"
+    return EMBEDDING_MODEL_NAME
+
+
+def get_embedding_model():
+    """
+    Return the shared embedding model, loading it on first use: the
+    SentenceTransformer, or its ONNX Runtime equivalent with EMBEDDING_ENGINE=onnx
+    """
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                engine = embedding_engine()
+                print(f"Loading embedding model '{EMBEDDING_MODEL_NAME}' ({engine})...")
+                with timed("model_load"):
+                    if engine == "onnx":
+                        from scripts.onnx_embedding import OnnxEmbeddingModel
+                        _model = OnnxEmbeddingModel(EMBEDDING_MODEL_NAME)
+                    else:
+                        from sentence_transformers import SentenceTransformer
+                        _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _model
+
+
+def get_chroma_client(chroma_path=None):
+    """Return the shared PersistentClient for chroma_path, opening it on first use"""
+    path = os.path.abspath(chroma_path or get_chroma_path())
+    client = _clients.get(path)
+    if client is None:
+        with _lock:
+            client = _clients.get(path)
+            if client is None:
+                import chromadb
+                client = chromadb.PersistentClient(path=path)
+                _clients[path] = client
+    return client
+
+
+def list_collection_names(chroma_path=None):
+    """Return the names of the collections in the store (cached until reopen)"""
+    path = os.path.abspath(chroma_path or get_chroma_path())
+    names = _collection_names.get(path)
+    if names is None:
+        with _lock:
+            names = _collection_names.get(path)
+            if names is None:
+                client = get_chroma_client(path)
+                names = [col.name for col in client.list_collections()]
+                _collection_names[path] = names
+    return list(names)
+
+
+def get_collection(collection_name, chroma_path=None):
+    """
+    Return a cached handle to an existing collection.
+    Raises the ChromaDB error if the collection does not exist.
+    """
+    path = os.path.abspath(chroma_path or get_chroma_path())
+    key = (path, collection_name)
+    collection = _collections.get(key)
+    if collection is None:
+        with _lock:
+            collection = _collections.get(key)
+            if collection is None:
+                collection = get_chroma_client(path).get_collection(name=collection_name)
+                _collections[key] = collection
+    return collection
+
+
+def warmup(chroma_path=None):
+    """
+    Load the embedding model and open the client and collection handles up front,
+    so the first user query does not pay for it.
+    """
+    model = get_embedding_model()
+    model.encode(["warmup"])
+    if os.getenv("RETRIEVAL_BACKEND", "chroma").lower() == "numpy":
+        from scripts.numpy_backend import get_numpy_index
+        get_numpy_index()
+        return
+    try:
+        for name in list_collection_names(chroma_path):
+            if name in COLLECTIONS:
+                get_collection(name, chroma_path)
+    except Exception as e:
+        print(f"ChromaDB warmup failed: {str(e)}")
+
+
+def warmup_in_background(chroma_path=None):
+    """
+    Run warmup() on a daemon thread and return it, so a UI or prompt can come
+    up immediately; a query arriving earlier waits for the model lock instead
+    of loading a second copy.
+    """
+    def run():
+        try:
+            warmup(chroma_path)
+        except Exception as e:
+            print(f"Warmup failed: {str(e)}")
+
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def register_invalidation_hook(hook):
+    """Register hook(collection_name) to be called whenever invalidate() runs"""
+    with _lock:
+        if hook not in _invalidation_hooks:
+            _invalidation_hooks.append(hook)
+
+
+def reopen(collection_name=None, chroma_path=None, reset_client=False):
+    """
+    Drop cached handles so the next use opens them again, e.g. after a query
+    failed on a stale handle. Derived data (indexes, cached answers) is kept.
+
+    Args:
+        collection_name (str): Only drop this collection's handle (default: all)
+        chroma_path (str): Store to reopen (default: data/chroma_db)
+        reset_client (bool): Also drop all clients, e.g. after another process
+            rebuilt the store on disk
+    """
+    path = os.path.abspath(chroma_path or get_chroma_path())
+    with _lock:
+        _collection_names.pop(path, None)
+        for key in list(_collections):
+            if key[0] == path and (collection_name is None or key[1] == collection_name):
+                del _collections[key]
+        if reset_client:
+            # ChromaDB caches its systems per process, so every client goes
+            _clients.clear()
+            _collections.clear()
+            _collection_names.clear()
+            import chromadb
+            chromadb.api.client.SharedSystemClient.clear_system_cache()
+
+
+def invalidate(collection_name=None, chroma_path=None):
+    """
+    The collection's data changed (documents upserted or deleted): reopen its
+    handles and run the invalidation hooks, which drop what was derived from
+    the old data.
+    """
+    reopen(collection_name, chroma_path)
+    with _lock:
+        hooks = list(_invalidation_hooks)
+    for hook in hooks:
+        try:
+            hook(collection_name)
+        except Exception as e:
+            print(f"Invalidation hook failed: {str(e)}")
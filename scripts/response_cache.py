@@ -0,0 +1,176 @@
+# response_cache.py
+# Semantic cache for LLM answers: a cached answer is reused when a new query
+# embeds close enough to a cached one AND retrieved the same documents.
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from scripts.resources import register_invalidation_hook
+
+_lock = threading.Lock()
+_cache = None
+
+
+def fingerprint_ids(doc_ids):
+    """Order-independent fingerprint of the retrieved document IDs"""
+    joined = "\n".join(sorted(str(doc_id) for doc_id in doc_ids))
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()
+
+
+class SemanticResponseCache:
+    """
+    LRU + TTL cache of LLM responses keyed by query embedding similarity
+    and the fingerprint of the retrieved document IDs.
+
+    Args:
+        threshold (float): Minimum cosine similarity to count as the same query
+        max_entries (int): LRU capacity
+        ttl_seconds (float): Entry lifetime, 0 disables expiry
+        persist_path (str): Optional JSON file to persist entries to
+    """
+
+    def __init__(self, threshold=0.95, max_entries=256, ttl_seconds=3600, persist_path=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._disk_mtime = None
+        self._lock = threading.RLock()
+        self._load()
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds and now - entry["created"] > self.ttl_seconds
+
+    def get(self, query_embedding, doc_ids):
+        """Return the cached response for a similar query over the same documents, or None"""
+        fingerprint = fingerprint_ids(doc_ids)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        now = time.time()
+        with self._lock:
+            self._sync_from_disk()
+            best_key, best_score = None, self.threshold
+            for key, entry in list(self._entries.items()):
+                if self._expired(entry, now):
+                    del self._entries[key]
+                    continue
+                if entry["fingerprint"] != fingerprint:
+                    continue
+                score = float(np.dot(query, entry["embedding"]))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key]["response"]
+
+    def put(self, query_embedding, doc_ids, response, collections=()):
+        """Cache a response; collections are the sources it was built from"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            self._sync_from_disk()
+            self._entries[self._next_key] = {
+                "embedding": query,
+                "fingerprint": fingerprint_ids(doc_ids),
+                "collections": sorted(set(collections)),
+                "response": response,
+                "created": time.time(),
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def invalidate(self, collection_name=None):
+        """Drop entries built from collection_name (all entries if None)"""
+        with self._lock:
+            self._sync_from_disk()
+            for key, entry in list(self._entries.items()):
+                if collection_name is None or collection_name in entry["collections"]:
+                    del self._entries[key]
+            self._save()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            self._disk_mtime = os.path.getmtime(self.persist_path)
+        except Exception as e:
+            print(f"Could not load response cache {self.persist_path}: {str(e)}")
+            return
+        self._entries.clear()
+        for entry in stored:
+            entry["embedding"] = np.asarray(entry["embedding"], dtype=np.float32)
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+
+    def _sync_from_disk(self):
+        # another process (e.g. an ingestion run) may have rewritten the file
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        if os.path.getmtime(self.persist_path) != self._disk_mtime:
+            self._load()
+
+    def _save(self):
+        if not self.persist_path:
+            return
+        stored = [dict(entry, embedding=entry["embedding"].tolist()) for entry in self._entries.values()]
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(stored, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+            self._disk_mtime = os.path.getmtime(self.persist_path)
+        except Exception as e:
+            print(f"Could not save response cache {self.persist_path}: {str(e)}")
+
+
+def get_response_cache():
+    """Return the shared response cache configured from the environment"""
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = SemanticResponseCache(
+                    threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95")),
+                    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256")),
+                    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+                    persist_path=os.getenv("RESPONSE_CACHE_PATH") or None,
+                )
+                # answers in this process's cache go stale with the collection
+                register_invalidation_hook(invalidate_response_cache)
+    return _cache
+
+
+def response_cache_enabled():
+    return os.getenv("RESPONSE_CACHE", "1") != "0"
+
+
+def invalidate_response_cache(collection_name=None):
+    """Drop cached answers that depend on collection_name"""
+    get_response_cache().invalidate(collection_name)
+
@@ -1,7 +1,16 @@
 # result_combiner.py
-def combine_and_rank_results(all_results):
-    """Combine and rank results from multiple collections"""
+def combine_and_rank_results(all_results, lexical_results=None, fusion="rrf", rrf_k=60, vector_weight=0.5):
+    """
+    Combine and rank results from multiple collections.
+
+    With lexical_results (BM25 results, see bm25_index.py) the vector and
+    lexical rankings are fused: "rrf" (reciprocal rank fusion) or "weighted"
+    (vector_weight * cosine similarity + the rest * max-normalized BM25 score).
+    Fused results carry a "scores" list (higher is better); documents only
+    found lexically have a distance of None.
+    """
     combined = {
+        "ids": [],
         "documents": [],
         "metadatas": [],
         "distances": []
@@ -10,7 +19,9 @@ def combine_and_rank_results(all_results):
     # Flatten results from all collections
     for result in all_results:
         if "documents" in result and result["documents"]:
-            combined["documents"].extend(result["documents"][0])
+            docs = result["documents"][0]
+            combined["ids"].extend(result["ids"][0] if result.get("ids") else [None] * len(docs))
+            combined["documents"].extend(docs)
             combined["metadatas"].extend(result["metadatas"][0])
             combined["distances"].extend(result["distances"][0])
     
@@ -22,4 +33,74 @@ def combine_and_rank_results(all_results):
         for key in combined:
             combined[key] = [combined[key][i] for i in sorted_indices]
     
-    return combined
\ No newline at end of file
+    if lexical_results is not None:
+        return fuse_lexical_results(combined, lexical_results, fusion, rrf_k, vector_weight)
+    return combined
+
+def fuse_lexical_results(combined, lexical_results, fusion="rrf", rrf_k=60, vector_weight=0.5):
+    """Fuse a ranked vector result (combine_and_rank_results) with BM25 results"""
+    lexical = []
+    for result in lexical_results:
+        if result.get("documents") and result["documents"][0]:
+            lexical.extend(zip(result["ids"][0], result["documents"][0],
+                               result["metadatas"][0], result["scores"][0]))
+    lexical.sort(key=lambda hit: hit[3], reverse=True)
+
+    # key documents by ID, falling back to the text for results without IDs
+    entries = {}
+    for rank, (doc_id, doc, meta, dist) in enumerate(zip(
+            combined["ids"], combined["documents"], combined["metadatas"], combined["distances"])):
+        entries.setdefault(doc_id or doc, {
+            "id": doc_id, "document": doc, "metadata": meta, "distance": dist,
+            "rank": rank, "bm25": None, "lexical_rank": None
+        })
+    for rank, (doc_id, doc, meta, score) in enumerate(lexical):
+        entry = entries.setdefault(doc_id or doc, {
+            "id": doc_id, "document": doc, "metadata": meta, "distance": None,
+            "rank": None, "bm25": None, "lexical_rank": None
+        })
+        if entry["bm25"] is None:
+            entry["bm25"] = score
+            entry["lexical_rank"] = rank
+
+    max_bm25 = max((hit[3] for hit in lexical), default=0.0) or 1.0
+    for entry in entries.values():
+        if fusion == "weighted":
+            similarity = 1.0 - entry["distance"] / 2.0 if entry["distance"] is not None else 0.0
+            lexical_score = entry["bm25"] / max_bm25 if entry["bm25"] is not None else 0.0
+            entry["score"] = vector_weight * similarity + (1.0 - vector_weight) * lexical_score
+        else:
+            entry["score"] = sum(
+                1.0 / (rrf_k + rank + 1) for rank in (entry["rank"], entry["lexical_rank"]) if rank is not None
+            )
+
+    ranked = sorted(entries.values(), key=lambda entry: entry["score"], reverse=True)
+    return {
+        "ids": [entry["id"] for entry in ranked],
+        "documents": [entry["document"] for entry in ranked],
+        "metadatas": [entry["metadata"] for entry in ranked],
+        "distances": [entry["distance"] for entry in ranked],
+        "scores": [entry["score"] for entry in ranked],
+    }
+
+def split_batch_results(batch_result, n_queries):
+    """Split a multi-query ChromaDB result into single-query results"""
+    keys = [key for key in ("ids", "documents", "metadatas", "distances") if batch_result.get(key) is not None]
+    return [{key: [batch_result[key][i]] for key in keys} for i in range(n_queries)]
+
+def combine_and_rank_batch_results(all_batch_results, n_queries, lexical_results=None, **fusion_options):
+    """
+    Combine multi-query results from multiple collections.
+    Returns one combined result per query, each shaped like combine_and_rank_results.
+    lexical_results, if given, holds the BM25 results of each query.
+    """
+    per_query = [[] for _ in range(n_queries)]
+    for batch_result in all_batch_results:
+        for i, result in enumerate(split_batch_results(batch_result, n_queries)):
+            per_query[i].append(result)
+    if lexical_results is None:
+        return [combine_and_rank_results(results) for results in per_query]
+    return [
+        combine_and_rank_results(results, lexical, **fusion_options)
+        for results, lexical in zip(per_query, lexical_results)
+    ]
@@ -0,0 +1,299 @@
+# serve.py
+# HTTP/JSON serving entry point: N pre-forked worker processes accept on one
+# shared listening socket, so CPU work (encoding, ranking) scales with cores
+# instead of sharing one GIL. The parent maps the NumPy index and loads the
+# lexical/canonical tables before forking, so workers share those pages; each
+# worker preloads its own embedding model (EMBEDDING_ENGINE=onnx keeps that
+# small) and shares query embeddings through QUERY_EMBEDDING_CACHE_PATH.
+# Every worker runs a bounded thread pool with a bounded backlog and answers
+# 503 when both are full. Workers write their metrics to METRICS_DIR, so
+# /metrics (and METRICS_PORT, served by the parent) covers all of them.
+# Without os.fork (Windows) it runs one process.
+#
+#   python scripts/serve.py --workers 4 --port 8000
+#   curl -s localhost:8000/query -d '{"query": "weekly packages"}'
+import argparse
+import concurrent.futures
+import http.server
+import json
+import glob
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from scripts.instrumentation import (
+    configure_from_env, export_metrics, increment, render_prometheus, start_metrics_server
+)
+from scripts.query_llm import query_llm
+from scripts.resources import get_project_root, load_environment, warmup
+
+MAX_BODY_BYTES = 64 * 1024
+
+
+class QueryHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "JazzBot"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/healthz":
+            self._send(200, {"status": "ok", "pid": os.getpid(), "pending": self.server.pending})
+        elif path == "/metrics":
+            self._send(200, render_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path.split("?")[0] != "/query":
+            self._send(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self._send(413, {"error": "request body too large"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            query = request["query"].strip()
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self._send(400, {"error": 'expected a JSON body like {"query": "..."}'})
+            return
+        if not query:
+            self._send(400, {"error": "empty query"})
+            return
+
+        start = time.perf_counter()
+        try:
+            answer = query_llm(query)
+        except Exception as e:
+            traceback.print_exc()
+            increment("serve_errors_total", error=type(e).__name__)
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send(200, {"answer": answer, "seconds": round(time.perf_counter() - start, 3), "pid": os.getpid()})
+
+
+class QueryServer(http.server.HTTPServer):
+    """
+    HTTPServer on an already listening socket that handles requests on a
+    pool of `threads` threads. At most `queue_size` more requests wait for a
+    thread; beyond that a request is answered 503 right away.
+    """
+
+    def __init__(self, listen_socket, threads=8, queue_size=16):
+        super().__init__(listen_socket.getsockname()[:2], QueryHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = listen_socket
+        self.max_pending = threads + queue_size
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix="request")
+
+    def process_request(self, request, client_address):
+        with self._pending_lock:
+            overloaded = self.pending >= self.max_pending
+            if not overloaded:
+                self.pending += 1
+        if overloaded:
+            increment("serve_rejected_total")
+            self._reject(request)
+            export_metrics()
+            return
+        self._executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._pending_lock:
+                self.pending -= 1
+            # also publishes what was counted after the request's trace ended (errors)
+            export_metrics()
+
+    def _reject(self, request):
+        body = json.dumps({"error": "server busy, retry later"}).encode("utf-8")
+        try:
+            # read what the client sent so closing does not reset the connection
+            request.settimeout(0.5)
+            request.recv(MAX_BODY_BYTES)
+            request.sendall(
+                b"HTTP/1.0 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+                b"Retry-After: 1\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._executor.shutdown(wait=True)
+
+
+def serve(listen_socket, threads, queue_size, forked=False):
+    """
+    Run one worker on listen_socket until SIGTERM/SIGINT. Forked workers
+    leave METRICS_PORT to the parent.
+    """
+    configure_from_env(metrics_server=not forked)
+    warmup()
+    server = QueryServer(listen_socket, threads, queue_size)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever, which runs in this (main) thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Worker {os.getpid()} ready")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def preload_shared():
+    """Load what forked workers can share copy-on-write: the index files and lookup tables"""
+    from scripts.bm25_index import get_bm25_index
+    from scripts.canonical_packages import get_canonical_mapping
+    from scripts.parallelchroma import use_numpy_backend
+    if use_numpy_backend():
+        from scripts.numpy_backend import get_numpy_index
+        get_numpy_index()
+    get_bm25_index()
+    get_canonical_mapping()
+
+
+def prepare_metrics_dir():
+    """
+    Directory the forked workers write their metrics snapshots to: METRICS_DIR
+    (emptied of a previous run's snapshots) or a new temporary one.
+
+    Returns:
+        str: the temporary directory to remove at exit, or None
+    """
+    directory = os.getenv("METRICS_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+            os.remove(path)
+        return None
+    directory = tempfile.mkdtemp(prefix="jazzbot-metrics-")
+    os.environ["METRICS_DIR"] = directory
+    return directory
+
+
+def run_workers(listen_socket, workers, threads, queue_size):
+    """Fork `workers` processes and restart any that die, until SIGTERM/SIGINT"""
+    children = {}
+    running = True
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                serve(listen_socket, threads, queue_size, forked=True)
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                os._exit(status)
+        children[pid] = slot
+
+    def stop(signum, frame):
+        nonlocal running
+        running = False
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        # one port for the whole server; the workers' snapshots are summed per scrape
+        try:
+            start_metrics_server(int(metrics_port))
+        except OSError as e:
+            print(f"Could not start metrics server on port {metrics_port}: {e}")
+    for slot in range(workers):
+        spawn(slot)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot = children.pop(pid, None)
+        if running and slot is not None:
+            print(f"Worker {pid} exited with status {status}, restarting")
+            time.sleep(1)
+            spawn(slot)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process HTTP/JSON server for the chatbot")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent requests per worker")
+    parser.add_argument("--queue-size", type=int, default=16, help="requests waiting per worker before 503")
+    parser.add_argument("--backend", choices=["numpy", "chroma"], help="retrieval backend (default: numpy)")
+    args = parser.parse_args()
+
+    load_environment()
+    if args.backend:
+        os.environ["RETRIEVAL_BACKEND"] = args.backend
+    # the memory-mapped backend is the one workers can share
+    os.environ.setdefault("RETRIEVAL_BACKEND", "numpy")
+    forking = hasattr(os, "fork") and args.workers > 1
+    metrics_dir = None
+    if forking:
+        os.environ.setdefault(
+            "QUERY_EMBEDDING_CACHE_PATH", os.path.join(get_project_root(), "data", "query_embedding_cache.bin")
+        )
+        # split the cores between the workers' encoder threads
+        threads_per_worker = str(max(1, (os.cpu_count() or 1) // args.workers))
+        os.environ.setdefault("OMP_NUM_THREADS", threads_per_worker)
+        os.environ.setdefault("EMBEDDING_ONNX_THREADS", threads_per_worker)
+        metrics_dir = prepare_metrics_dir()
+
+    preload_shared()
+    listen_socket = socket.create_server((args.host, args.port), backlog=128)
+    print(f"Serving on http://{args.host}:{args.port} ({args.workers if forking else 1} worker(s), "
+          f"backend {os.environ['RETRIEVAL_BACKEND']}; POST /query, GET /healthz, GET /metrics)")
+    try:
+        if forking:
+            run_workers(listen_socket, args.workers, args.threads, args.queue_size)
+        else:
+            serve(listen_socket, args.threads, args.queue_size)
+    finally:
+        listen_socket.close()
+        if metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# web_search_cache.py
+# TTL cache for web search results with request coalescing and
+# stale-while-revalidate, so popular queries do not wait on DuckDuckGo.
+import concurrent.futures
+import json
+import os
+import threading
+import time
+
+from scripts.instrumentation import increment
+
+_lock = threading.Lock()
+_cache = None
+
+
+class WebSearchCache:
+    """
+    Cache of search results keyed by the cleaned query.
+
+    Args:
+        ttl (float): Seconds an entry is served as fresh
+        stale_ttl (float): Seconds an entry may still be served while a
+            background refresh runs (must be >= ttl)
+        max_entries (int): Oldest entries are dropped beyond this
+        persist_path (str): Optional JSON file to persist entries to
+    """
+
+    def __init__(self, ttl=3600, stale_ttl=86400, max_entries=1024, persist_path=None):
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def get_or_fetch(self, key, fetch):
+        """
+        Return cached results for key, calling fetch() on a miss.
+        Concurrent misses for the same key share a single fetch; a stale entry
+        is returned immediately while fetch() refreshes it in the background.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            age = now - entry["fetched"] if entry else None
+            if entry and age <= self.ttl:
+                self.hits += 1
+                increment("web_search_cache_total", result="hit")
+                return entry["results"]
+            if entry and age <= self.stale_ttl:
+                self.stale_hits += 1
+                increment("web_search_cache_total", result="stale")
+                if key not in self._inflight:
+                    future = self._inflight[key] = concurrent.futures.Future()
+                    threading.Thread(target=self._fetch, args=(key, fetch, future), daemon=True).start()
+                return entry["results"]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                future = self._inflight[key] = concurrent.futures.Future()
+            else:
+                self.coalesced += 1
+        increment("web_search_cache_total", result="miss" if owner else "coalesced")
+        if owner:
+            self._fetch(key, fetch, future)
+        return future.result()
+
+    def _fetch(self, key, fetch, future):
+        try:
+            results = fetch()
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            return
+        with self._lock:
+            # an empty result usually means the search failed, do not keep it
+            if results:
+                self._entries[key] = {"results": results, "fetched": time.time()}
+                while len(self._entries) > self.max_entries:
+                    oldest = min(self._entries, key=lambda k: self._entries[k]["fetched"])
+                    del self._entries[oldest]
+            self._inflight.pop(key, None)
+            self._save()
+        future.set_result(results)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._save()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._entries),
+        }
+
+    def _load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except Exception as e:
+            print(f"Could not load web search cache {self.persist_path}: {str(e)}")
+
+    def _save(self):
+        # called with self._lock held
+        if not self.persist_path:
+            return
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            print(f"Could not save web search cache {self.persist_path}: {str(e)}")
+
+
+def get_web_search_cache():
+    """Return the shared web search cache configured from the environment"""
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = WebSearchCache(
+                    ttl=float(os.getenv("WEB_SEARCH_CACHE_TTL", "3600")),
+                    stale_ttl=float(os.getenv("WEB_SEARCH_CACHE_STALE_TTL", "86400")),
+                    persist_path=os.getenv("WEB_SEARCH_CACHE_PATH") or None,
+                )
+    return _cache
+
+
+def web_search_cache_enabled():
+    return os.getenv("WEB_SEARCH_CACHE", "1") != "0"
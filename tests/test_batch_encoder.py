@@ -0,0 +1,74 @@
+import threading
+
+import numpy as np
+import pytest
+
+from scripts.batch_encoder import BatchEncoder
+
+
+class FakeModel:
+    """Embeds a text as [len(text), index in its call]; records the size of every call"""
+
+    def __init__(self, error=None, gate=None):
+        self.calls = []
+        self.error = error
+        self.gate = gate
+        self.entered = threading.Event()
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait()
+        self.calls.append(list(texts))
+        if self.error is not None:
+            raise self.error
+        return np.array([[len(text), i] for i, text in enumerate(texts)], dtype=np.float32)
+
+
+def test_single_text_returns_a_vector():
+    encoder = BatchEncoder(lambda: FakeModel(), max_batch=8, window=0.001)
+    embedding = encoder.encode("abc")
+    assert embedding.shape == (2,)
+    assert embedding[0] == 3
+
+
+def test_concurrent_submits_share_a_batch_and_get_their_own_row():
+    gate = threading.Event()
+    model = FakeModel(gate=gate)
+    encoder = BatchEncoder(lambda: model, max_batch=8, window=0.05)
+    # the first query occupies the model until the gate opens; the rest queue up
+    first = encoder.submit("x")
+    assert model.entered.wait(5)
+    futures = [encoder.submit("y" * n) for n in range(1, 6)]
+    gate.set()
+    assert first.result(timeout=5)[0] == 1
+    for n, future in enumerate(futures, 1):
+        assert future.result(timeout=5)[0] == n
+    assert model.calls == [["x"], ["y" * n for n in range(1, 6)]]
+    assert encoder.stats()["encoded"] == 6
+
+
+def test_encode_keeps_the_input_order():
+    encoder = BatchEncoder(lambda: FakeModel(), max_batch=8, window=0.001)
+    embeddings = encoder.encode(["a", "bbb", "bb"])
+    assert embeddings[:, 0].tolist() == [1, 3, 2]
+
+
+def test_errors_reach_every_caller():
+    gate = threading.Event()
+    encoder = BatchEncoder(lambda: FakeModel(error=RuntimeError("model failed"), gate=gate),
+                           max_batch=8, window=0.05)
+    futures = [encoder.submit(text) for text in ("a", "b", "c")]
+    gate.set()
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model failed"):
+            future.result(timeout=5)
+
+
+def test_full_batches_bypass_the_queue():
+    model = FakeModel()
+    encoder = BatchEncoder(lambda: model, max_batch=2, window=0.001)
+    embeddings = encoder.encode(["a", "b", "c"])
+    assert embeddings.shape == (3, 2)
+    assert model.calls == [["a", "b", "c"]]
+    assert encoder.stats()["batches"] == 0
@@ -0,0 +1,18 @@
+from scripts.benchmark import percentiles
+
+
+def test_nearest_rank_percentiles():
+    stats = percentiles([i / 1000 for i in range(1, 101)])
+    assert stats["count"] == 100
+    assert (stats["p50"], stats["p95"], stats["p99"], stats["max"]) == (50, 95, 99, 100)
+
+
+def test_small_samples_round_up():
+    stats = percentiles([0.001, 0.002, 0.003])
+    # ceil(0.5 * 3) = 2nd value, ceil(0.95 * 3) = 3rd
+    assert stats["p50"] == 2
+    assert stats["p95"] == stats["p99"] == 3
+
+
+def test_empty():
+    assert percentiles([]) == {"count": 0}
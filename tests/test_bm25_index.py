@@ -0,0 +1,51 @@
+import pytest
+
+from scripts.bm25_index import BM25Index, tokenize
+
+JAZZ = [
+    "Jazz Weekly Mega. 7 GB Internet Validity: 7 Days. Price: Rs. 210. Activation Code: *159#",
+    "Jazz Daily Offer. 500 MB Internet Validity: 1 Day. Price: Rs. 30. Activation Code: *117*1#",
+    "Jazz Monthly Premium. 30 GB Internet Validity: 30 Days. Price: Rs. 1000. Activation Code: *117*30#",
+]
+SCRAPED = [
+    "Weekly Mega. On-Net: 1000 mins, Data: 7000 MB, Validity: 7 Days, Price: 210 Rs",
+    "Monthly SMS. SMS: 3000, Validity: 30 Days, Price: 60 Rs",
+]
+
+
+def _index():
+    index = BM25Index()
+    index.add_collection("jazz_packages", JAZZ)
+    index.add_collection("propakistani_packages", SCRAPED)
+    return index
+
+
+def test_tokenize_keeps_codes_and_decimals():
+    assert tokenize("Dial *117*30# for Rs. 99.5") == ["dial", "*117*30#", "for", "rs", "99.5"]
+
+
+def test_exact_activation_code_ranks_first():
+    results = _index().search("activation code *159#", n_results=2)
+    assert results["jazz_packages"]["documents"][0][0] == JAZZ[0]
+    scores = results["jazz_packages"]["scores"][0]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_results_per_collection():
+    index = _index()
+    results = index.search("weekly mega", n_results=1)
+    assert results["jazz_packages"]["documents"][0] == [JAZZ[0]]
+    assert results["propakistani_packages"]["documents"][0] == [SCRAPED[0]]
+    assert set(index.search("weekly mega", collections=["propakistani_packages"])) == {"propakistani_packages"}
+    assert index.search("zzz unknown") == {}
+
+
+def test_save_and_load(tmp_path):
+    index = _index()
+    path = str(tmp_path / "bm25_index.json")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    expected = index.search("monthly 30 days")
+    actual = loaded.search("monthly 30 days")
+    assert actual["jazz_packages"]["ids"] == expected["jazz_packages"]["ids"]
+    assert actual["jazz_packages"]["scores"][0] == pytest.approx(expected["jazz_packages"]["scores"][0])
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import scripts.canonical_packages as canonical_packages
+from scripts.canonical_packages import attributes_compatible, cluster_packages, collapse_duplicates
+
+
+def test_attributes_compatible():
+    assert attributes_compatible({"price_rs": 200.0, "validity_days": 7}, {"price_rs": 201.0})
+    assert not attributes_compatible({"price_rs": 200.0}, {"price_rs": 250.0})
+    assert not attributes_compatible({"validity_days": 7}, {"validity_days": 30})
+    # unknown on one side
+    assert attributes_compatible({"data_mb": 5000.0}, {"price_rs": 30.0})
+
+
+def test_cluster_packages():
+    texts = [
+        "Weekly Mega. Validity: 7 Days. Price: Rs. 210",
+        "Weekly Mega. Data: 7000 MB, Validity: 7 Days, Price: 210 Rs",
+        "Weekly Mega Plus. Validity: 7 Days. Price: Rs. 350",
+        "Monthly Premium. Validity: 30 Days. Price: Rs. 1000",
+    ]
+    embeddings = np.array([
+        [1.0, 0.0, 0.0],
+        [0.9, 0.3, 0.0],   # same name, similarity ~0.95
+        [1.0, 0.05, 0.0],  # nearly identical vector but a different price
+        [0.0, 0.0, 1.0],
+    ])
+    assert cluster_packages(embeddings, texts) == [[0, 1], [2], [3]]
+    assert cluster_packages(np.zeros((0, 3)), []) == []
+
+
+@pytest.fixture
+def mapping(monkeypatch):
+    monkeypatch.setattr(canonical_packages, "_mapping", {"jazz_a": "pkg_1", "scraped_a": "pkg_1", "jazz_b": "pkg_2"})
+    monkeypatch.setattr(canonical_packages, "_mapping_loaded", True)
+    monkeypatch.delenv("DEDUP_RESULTS", raising=False)
+
+
+def test_collapse_duplicates(mapping):
+    combined = {
+        "ids": ["jazz_a", "jazz_b", "scraped_a", None],
+        "documents": ["A", "B", "A again", "web"],
+        "metadatas": [{"source": "jazz_packages"}, {"source": "jazz_packages"},
+                      {"source": "propakistani_packages"}, None],
+        "distances": [0.2, 0.3, 0.4, None],
+    }
+    collapsed = collapse_duplicates(combined)
+    assert collapsed["ids"] == ["jazz_a", "jazz_b", None]
+    assert collapsed["distances"] == [0.2, 0.3, None]
+    assert collapsed["metadatas"][0] == {"source": "jazz_packages", "also_in": ["propakistani_packages"]}
+    # the input is not modified
+    assert combined["metadatas"][0] == {"source": "jazz_packages"}
+
+
+def test_collapse_disabled(mapping, monkeypatch):
+    monkeypatch.setenv("DEDUP_RESULTS", "0")
+    combined = {"ids": ["jazz_a", "scraped_a"], "documents": ["A", "A"], "metadatas": [{}, {}], "distances": [0.1, 0.2]}
+    assert collapse_duplicates(combined) is combined
@@ -0,0 +1,68 @@
+from scripts.context_builder import build_context, compact_package_line, select_hits
+
+
+def _results(distances):
+    return {
+        "documents": [f"Package {i}. Price: {100 + i} Rs, Validity: 7 Days" for i in range(len(distances))],
+        "metadatas": [{"source": "jazz"} for _ in distances],
+        "distances": distances,
+    }
+
+
+def test_cuts_by_distance_and_gap():
+    results = _results([0.4, 0.6, 0.8, 1.5])
+    assert select_hits(results, max_distance=1.3, score_gap=0.3) == [0, 1]
+    assert select_hits(results, max_distance=1.3, score_gap=1.0) == [0, 1, 2]
+    assert select_hits(results, max_distance=2.0, score_gap=2.0) == [0, 1, 2, 3]
+
+
+def test_lexical_only_hits_are_capped():
+    results = _results([0.5, None, None, 0.7, None, None])
+    assert select_hits(results, max_distance=1.3, score_gap=0.3, max_lexical_only=2) == [0, 1, 2, 3]
+    assert select_hits(results, max_distance=1.3, score_gap=0.3, max_lexical_only=0) == [0, 3]
+
+
+def test_only_lexical_hits():
+    results = _results([None, None, None])
+    assert select_hits(results, max_distance=1.3, score_gap=0.3, max_lexical_only=2) == [0, 1]
+
+
+def test_build_context_respects_cutoffs():
+    context, stats = build_context(_results([0.5, 2.0, None, None, None]), token_budget=800,
+                                   max_distance=1.3, score_gap=0.3, max_lexical_only=1)
+    assert stats["hits"] == 5
+    assert stats["kept"] == 2
+    assert "Package 0" in context and "Package 2" in context and "Package 3" not in context
+
+
+def test_validity_singular():
+    line = compact_package_line("Daily Offer. Price: 30 Rs, Validity: 1 Day", {"source": "jazz"})
+    assert line == "- Daily Offer | Rs 30 | 1 day [jazz]"
+    line = compact_package_line("Weekly Offer. Price: 300 Rs, Validity: 7 Days", {"source": "jazz"})
+    assert "| 7 days" in line
+
+
+def test_compact_line_keeps_sms_minutes_and_description():
+    doc = ("Weekly SMS Bundle. 1500 SMS to all networks for a week. Validity: 7 Days. "
+           "Price: Rs. 25. Activation Code: *101#")
+    assert compact_package_line(doc, {"source": "jazz_packages"}) == (
+        "- Weekly SMS Bundle | Rs 25 | 7 days | *101# | 1500 SMS to all networks for a week [jazz_packages]"
+    )
+    doc = ("Monthly Hybrid. On-Net: 3000 mins, Off-Net: 150 mins, SMS: 3000, Data: 10000 MB, "
+           "Validity: 30 Days, Price: 1200 Rs, Subscription: *117*77#, Category: hybrid")
+    line = compact_package_line(doc, {"source": "propakistani_packages"})
+    assert line == ("- Monthly Hybrid | Rs 1200 | 30 days | 10 GB | 3000 on-net mins | 150 off-net mins "
+                    "| 3000 SMS | *117*77# | hybrid [propakistani_packages]")
+
+
+def test_compact_line_skips_missing_fields():
+    doc = "Daily Offer. On-Net: N/A mins, SMS: N/A, Validity: 1 Day, Price: N/A Rs, Category: N/A"
+    assert compact_package_line(doc, {"source": "propakistani_packages"}) == (
+        "- Daily Offer | 1 day [propakistani_packages]"
+    )
+
+
+def test_fields_that_do_not_compact_keep_the_full_text():
+    doc = "Unlimited Offer. Validity: Unlimited. Price: Rs 50"
+    assert compact_package_line(doc, {"source": "ocr_packages"}) == f"- {doc} [ocr_packages]"
+    assert compact_package_line("Call 111 for offers", {"source": "jazz"}) == "- Call 111 for offers [jazz]"
@@ -0,0 +1,71 @@
+import numpy as np
+
+from scripts.embedding_cache import EmbeddingCache, encode_with_cache
+
+
+class FakeModel:
+    dimension = 4
+
+    def __init__(self):
+        self.encoded = []
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False):
+        self.encoded.extend(texts)
+        return np.array([[len(text), 1.0, 0.0, float(i)] for i, text in enumerate(texts)], dtype=np.float32)
+
+
+def test_encodes_only_misses(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "fake")
+    model = FakeModel()
+    embeddings, reused, computed = encode_with_cache(["a", "bb", "a"], cache, lambda: model)
+    assert embeddings.shape == (3, 4)
+    assert (reused, computed) == (1, 2)
+    assert model.encoded == ["a", "bb"]
+
+    embeddings, reused, computed = encode_with_cache(["bb", "ccc"], cache, lambda: model)
+    assert (reused, computed) == (1, 1)
+    assert model.encoded == ["a", "bb", "ccc"]
+    assert embeddings[0][0] == 2
+
+
+def test_empty_input_keeps_the_dimension(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "fake")
+    embeddings, reused, computed = encode_with_cache([], cache, FakeModel)
+    assert embeddings.shape == (0, 4)
+    assert (reused, computed) == (0, 0)
+    other, _, _ = encode_with_cache(["a"], cache, FakeModel)
+    assert np.concatenate([embeddings, other]).shape == (1, 4)
+
+
+def test_save_and_reload(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "fake")
+    encode_with_cache(["a", "bb"], cache, FakeModel)
+    cache.save()
+    reloaded = EmbeddingCache(str(tmp_path), "fake")
+    model = FakeModel()
+    embeddings, reused, computed = encode_with_cache(["bb", "a"], reloaded, lambda: model)
+    assert (reused, computed) == (2, 0)
+    assert model.encoded == []
+    assert embeddings[0][0] == 2 and embeddings[1][0] == 1
+
+
+def test_save_compacts_replaced_and_pruned_rows(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "fake")
+    for i in range(100):
+        cache.put(f"h{i}", np.full(4, i, dtype=np.float32))
+    cache.put("h5", np.full(4, -5, dtype=np.float32))
+    cache.prune({f"h{i}" for i in range(10)})
+    cache.save()
+    assert np.load(cache.matrix_path).shape == (10, 4)
+    assert cache.get("h5")[0] == -5
+
+    reloaded = EmbeddingCache(str(tmp_path), "fake")
+    assert len(reloaded) == 10 and reloaded.dimension == 4
+    assert reloaded.get("h9")[0] == 9 and reloaded.get("h50") is None
+    reloaded.put("new", np.ones(4, dtype=np.float32))
+    reloaded.save()
+    assert np.load(cache.matrix_path).shape == (11, 4)
+    assert EmbeddingCache(str(tmp_path), "fake").get("h5")[0] == -5
@@ -0,0 +1,39 @@
+import json
+
+from scripts import instrumentation
+from scripts.instrumentation import merge_snapshots, render_prometheus
+
+
+def _snapshot(count, counter):
+    return {
+        "stages": {"query": {"buckets": [count] * len(instrumentation.BUCKETS), "sum": 0.1 * count, "count": count}},
+        "values": {},
+        "counters": [["requests_total", [["result", "hit"]], counter]],
+    }
+
+
+def test_merge_snapshots_sums_histograms_and_counters():
+    merged = merge_snapshots([_snapshot(2, 5), _snapshot(3, 1)])
+    assert merged["stages"]["query"]["count"] == 5
+    assert merged["stages"]["query"]["buckets"][0] == 5
+    assert merged["counters"] == [["requests_total", (("result", "hit"),), 6]]
+
+
+def test_render_includes_other_workers(tmp_path, monkeypatch):
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+    (tmp_path / "metrics-999999.json").write_text(json.dumps(_snapshot(4, 7)))
+    (tmp_path / "metrics-999998.json").write_text("{truncated")
+    text = render_prometheus()
+    assert 'jazzbot_requests_total{result="hit"} 7' in text
+    assert 'jazzbot_stage_duration_seconds_count{stage="query"}' in text
+
+
+def test_export_writes_own_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+    monkeypatch.delenv("METRICS_FILE", raising=False)
+    instrumentation.increment("exported_total")
+    instrumentation.export_metrics()
+    files = list(tmp_path.glob("metrics-*.json"))
+    assert len(files) == 1
+    counters = json.loads(files[0].read_text())["counters"]
+    assert any(name == "exported_total" for name, _, _ in counters)
@@ -0,0 +1,116 @@
+import http.server
+import json
+import threading
+
+import pytest
+
+from scripts.llm_client import LLMClient, LLMError
+from scripts.mock_llm_server import DEFAULT_ANSWER, serve_in_background
+
+
+class ScriptedHandler(http.server.BaseHTTPRequestHandler):
+    """Answers each POST with the next (status, headers, body) of the server's script"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests += 1
+        status, headers, body = self.server.script.pop(0)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if "Content-Length" not in headers:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+
+@pytest.fixture
+def scripted():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ScriptedHandler)
+    server.daemon_threads = True
+    server.script = []
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def _completion(content):
+    return json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+
+
+def test_complete_and_stream_against_mock_server():
+    server, base_url = serve_in_background()
+    try:
+        client = LLMClient(base_url, max_retries=0)
+        assert client.complete("hi") == DEFAULT_ANSWER
+        assert "".join(client.stream("hi")) == DEFAULT_ANSWER
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_retries_429_then_succeeds(scripted):
+    server, base_url = scripted
+    server.script = [(429, {"Retry-After": "0"}, b"{}"), (503, {}, b"{}"), (200, {}, _completion("ok"))]
+    client = LLMClient(base_url, max_retries=3, backoff=0.001)
+    assert client.complete("hi") == "ok"
+    assert server.requests == 3
+    assert client.retries == 2
+
+
+def test_gives_up_after_max_retries(scripted):
+    server, base_url = scripted
+    server.script = [(500, {}, b"boom")] * 3
+    client = LLMClient(base_url, max_retries=2, backoff=0.001)
+    with pytest.raises(LLMError, match="boom"):
+        client.complete("hi")
+    assert server.requests == 3
+
+
+def test_client_errors_are_not_retried(scripted):
+    server, base_url = scripted
+    server.script = [(400, {}, b"bad request")]
+    with pytest.raises(LLMError):
+        LLMClient(base_url, max_retries=3, backoff=0.001).complete("hi")
+    assert server.requests == 1
+
+
+def test_retry_after_is_capped():
+    client = LLMClient("http://127.0.0.1:9/v1", max_retry_after=2.0)
+    assert client._retry_delay(0, "3600") == 2.0
+    assert client._retry_delay(0, "1") == 1.0
+
+
+@pytest.mark.parametrize("body", [b"not json", b'{"choices": []}', b'{"error": "x"}'])
+def test_malformed_completion_raises_llm_error(scripted, body):
+    server, base_url = scripted
+    server.script = [(200, {}, body)]
+    with pytest.raises(LLMError):
+        LLMClient(base_url, max_retries=0).complete("hi")
+
+
+def test_malformed_stream_event_raises_llm_error(scripted):
+    server, base_url = scripted
+    body = b'data: {"choices": [{"delta": {"content": "Hel"}}]}\n\ndata: {broken\n\n'
+    server.script = [(200, {"Content-Type": "text/event-stream"}, body)]
+    tokens = []
+    with pytest.raises(LLMError):
+        for token in LLMClient(base_url, max_retries=0).stream("hi"):
+            tokens.append(token)
+    assert tokens == ["Hel"]
+
+
+def test_stream_cut_off_raises_llm_error(scripted):
+    server, base_url = scripted
+    body = b'data: {"choices": [{"delta": {"content": "Hel"}}]}\n\n'
+    # announces more bytes than it sends, then closes the connection
+    server.script = [(200, {"Content-Type": "text/event-stream", "Content-Length": "1000", "Connection": "close"},
+                      body)]
+    with pytest.raises(LLMError):
+        list(LLMClient(base_url, max_retries=0).stream("hi"))
@@ -0,0 +1,82 @@
+import json
+import os
+
+import numpy as np
+
+from scripts.numpy_backend import NumpyIndex
+
+
+def _write_source(data_dir, prefix, texts, embeddings):
+    np.save(os.path.join(data_dir, f"{prefix}_embeddings.npy"), np.asarray(embeddings, dtype=np.float32))
+    with open(os.path.join(data_dir, f"{prefix}_texts.json"), "w", encoding="utf-8") as f:
+        json.dump(texts, f)
+
+
+def _data_dir(tmp_path, seed=0):
+    rng = np.random.default_rng(seed)
+    jazz = [f"Jazz Offer {i}. Validity: 7 Days. Price: Rs. {50 * (i + 1)}" for i in range(20)]
+    scraped = [f"Scraped Offer {i}. Data: {i + 1} GB, Validity: 30 Days" for i in range(15)]
+    # no price stated: never filtered out by a price constraint
+    scraped[3] = "Scraped Offer 3. Data: 4 GB"
+    _write_source(tmp_path, "jazz_package", jazz, rng.normal(size=(20, 8)))
+    _write_source(tmp_path, "propakistani_package", scraped, rng.normal(size=(15, 8)))
+    return str(tmp_path)
+
+
+def _brute_force(index, query, name, k):
+    start, end = index.offsets[name]
+    matrix = np.array(index.matrix[start:end], dtype=np.float32)
+    scores = matrix @ (query / np.linalg.norm(query))
+    return [index.ids[start + i] for i in np.argsort(-scores)[:k]]
+
+
+def test_top_k_matches_brute_force(tmp_path):
+    index = NumpyIndex(data_dir=_data_dir(tmp_path))
+    queries = np.random.default_rng(1).normal(size=(3, 8)).astype(np.float32)
+    results = index.query(queries, ["jazz_packages", "propakistani_packages", "ocr_packages"], n_results=5)
+    assert set(results) == {"jazz_packages", "propakistani_packages"}
+    for name, result in results.items():
+        for row, query in enumerate(queries):
+            assert result["ids"][row] == _brute_force(index, query, name, 5)
+            assert result["distances"][row] == sorted(result["distances"][row])
+
+
+def test_constraints_filter_inside_the_search(tmp_path):
+    index = NumpyIndex(data_dir=_data_dir(tmp_path))
+    query = np.ones(8, dtype=np.float32)
+    results = index.query(query, ["jazz_packages", "propakistani_packages"], n_results=50,
+                          constraints={"price_rs": {"max": 200}})
+    # Rs. 50 .. Rs. 200
+    assert len(results["jazz_packages"]["ids"][0]) == 4
+    # scraped texts state no price
+    assert len(results["propakistani_packages"]["ids"][0]) == 15
+
+    results = index.query(query, ["propakistani_packages"], n_results=50, constraints={"data_mb": {"min": 13000}})
+    documents = results["propakistani_packages"]["documents"][0]
+    assert sorted(documents) == sorted(f"Scraped Offer {i}. Data: {i + 1} GB, Validity: 30 Days" for i in (12, 13, 14))
+
+
+def test_rebuilds_when_embeddings_change(tmp_path):
+    data_dir = _data_dir(tmp_path)
+    old = NumpyIndex(data_dir=data_dir)
+    old_matrix = np.array(old.matrix)
+
+    rng = np.random.default_rng(2)
+    emb_path = os.path.join(data_dir, "jazz_package_embeddings.npy")
+    np.save(emb_path, rng.normal(size=(20, 8)).astype(np.float32))
+    future = os.path.getmtime(os.path.join(data_dir, "numpy_index_float32.npy")) + 10
+    os.utime(emb_path, (future, future))
+
+    new = NumpyIndex(data_dir=data_dir)
+    assert not np.allclose(new.matrix[:20], old_matrix[:20])
+    query = rng.normal(size=8).astype(np.float32)
+    assert new.query(query, ["jazz_packages"], n_results=3)["jazz_packages"]["ids"][0] == \
+        _brute_force(new, query, "jazz_packages", 3)
+    # the index file was replaced, not rewritten: the old mapping still reads its own rows
+    assert np.array_equal(np.array(old.matrix), old_matrix)
+    assert not [name for name in os.listdir(data_dir) if name.endswith(".tmp.npy")]
+
+
+def test_no_embeddings(tmp_path):
+    index = NumpyIndex(data_dir=str(tmp_path))
+    assert index.query(np.ones(8), ["jazz_packages"]) == {}
@@ -0,0 +1,83 @@
+from scripts.package_attributes import (
+    attribute_metadata,
+    chroma_where,
+    matches_constraints,
+    parse_constraints,
+    text_attributes,
+)
+
+
+def test_parse_price_bounds():
+    assert parse_constraints("packages under Rs 200") == {"price_rs": {"max": 200}}
+    assert parse_constraints("above 500 rupees") == {"price_rs": {"min": 500}}
+    assert parse_constraints("between Rs 100 and 50") == {"price_rs": {"min": 50, "max": 100}}
+    assert parse_constraints("a bundle for Rs. 1,500") == {"price_rs": {"max": 1500}}
+
+
+def test_parse_validity_and_data():
+    assert parse_constraints("weekly packages") == {"validity_days": {"eq": 7}}
+    assert parse_constraints("30 days offer") == {"validity_days": {"eq": 30}}
+    assert parse_constraints("at least 5 GB") == {"data_mb": {"min": 5000}}
+    assert parse_constraints("500 MB bundle") == {"data_mb": {"min": 500}}
+
+
+def test_parse_no_constraints():
+    assert parse_constraints("how do I check my balance") == {}
+
+
+def test_text_attributes_decimal_gb_and_missing_price():
+    attributes = text_attributes("Weekly Max. Data: 5 GB, Validity: 7 Days, Price: 0 Rs")
+    assert attributes["data_mb"] == 5000
+    assert attributes["validity_days"] == 7
+    assert "price_rs" not in attributes
+
+
+def test_matches_constraints_bounds():
+    attributes = {"price_rs": 150.0, "validity_days": 7}
+    assert matches_constraints(attributes, {"price_rs": {"max": 200}})
+    assert not matches_constraints(attributes, {"price_rs": {"min": 200}})
+    assert not matches_constraints(attributes, {"validity_days": {"eq": 30}})
+    assert matches_constraints(attributes, {"price_rs": {"min": 100, "max": 150}, "validity_days": {"eq": 7}})
+
+
+def test_missing_attribute_passes():
+    # OCR'd packages often state no validity
+    assert matches_constraints({"price_rs": 100.0}, {"validity_days": {"eq": 7}})
+    assert matches_constraints({}, parse_constraints("weekly packages under Rs 300"))
+
+
+def test_chroma_where_lets_missing_attributes_through():
+    assert chroma_where({}) is None
+    assert chroma_where({"price_rs": {"max": 200}}) == {
+        "$or": [{"price_rs": {"$lte": 200}}, {"has_price_rs": {"$eq": False}}]
+    }
+    where = chroma_where({"price_rs": {"min": 50, "max": 100}, "validity_days": {"eq": 7}})
+    assert where["$and"][0]["$or"][0] == {"$and": [{"price_rs": {"$gte": 50}}, {"price_rs": {"$lte": 100}}]}
+    assert where["$and"][1]["$or"][1] == {"has_validity_days": {"$eq": False}}
+
+
+def test_attribute_metadata_flags():
+    metadata = attribute_metadata("Daily Offer. Price: 50 Rs, Validity: 1 Day")
+    assert metadata["has_price_rs"] and metadata["has_validity_days"]
+    assert metadata["has_data_mb"] is False and "data_mb" not in metadata
+
+
+def test_amounts_with_units_are_not_prices():
+    assert parse_constraints("under 30 days") == {"validity_days": {"max": 30}}
+    assert parse_constraints("more than 1000 mins under Rs 500") == {"price_rs": {"max": 500}}
+
+
+def test_parse_validity_bounds():
+    assert parse_constraints("packages within 2 weeks") == {"validity_days": {"max": 14}}
+    assert parse_constraints("at least 7 days validity") == {"validity_days": {"min": 7}}
+    assert parse_constraints("more than 1 month") == {"validity_days": {"min": 30}}
+    assert parse_constraints("more than 3 days but under 10 days") == {
+        "validity_days": {"min": 3, "max": 10}
+    }
+
+
+def test_hourly_packages_have_no_validity_filter():
+    assert parse_constraints("hourly packages") == {}
+    assert parse_constraints("3 hours internet under Rs 20") == {"price_rs": {"max": 20}}
+    assert parse_constraints("under 6 hours") == {}
+    assert parse_constraints("48 hours offer") == {"validity_days": {"eq": 2}}
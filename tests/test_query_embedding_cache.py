@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import scripts.query_embedding_cache as query_embedding_cache
+from scripts.query_embedding_cache import (
+    QueryEmbeddingCache,
+    SharedEmbeddingStore,
+    encode_queries,
+    normalize_query,
+)
+
+
+class CountingModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        self.calls.append(list(texts))
+        return np.array([[len(text), 1.0, 0.0] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = QueryEmbeddingCache(max_entries=2)
+    monkeypatch.setattr(query_embedding_cache, "_cache", cache)
+    monkeypatch.delenv("QUERY_EMBEDDING_CACHE", raising=False)
+    return cache
+
+
+def test_normalize_query():
+    assert normalize_query("What are the  Weekly packages?") == "weekly packages"
+
+
+def test_only_misses_are_encoded_once(cache):
+    model = CountingModel()
+    embeddings = encode_queries(["weekly packages", "Weekly packages?", "daily offers"], lambda: model)
+    assert model.calls == [["weekly packages", "daily offers"]]
+    assert np.array_equal(embeddings[0], embeddings[1])
+    encode_queries(["what are the weekly packages"], lambda: model)
+    assert len(model.calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_lru_bound(cache):
+    model = CountingModel()
+    for query in ("a1", "b2", "c3"):
+        encode_queries([query], lambda: model)
+    assert cache.stats()["entries"] == 2
+    # the oldest was evicted
+    encode_queries(["a1"], lambda: model)
+    assert model.calls[-1] == ["a1"]
+
+
+needs_flock = pytest.mark.skipif(query_embedding_cache.fcntl is None, reason="needs file locking")
+
+
+@needs_flock
+def test_shared_store_between_processes(tmp_path):
+    path = str(tmp_path / "query_embedding_cache.bin")
+    writer = SharedEmbeddingStore(path, slots=8, dimension=3)
+    reader = SharedEmbeddingStore(path, slots=8, dimension=3)
+    key = QueryEmbeddingCache().key("weekly packages")
+    assert reader.get(key) is None
+    writer.put(key, [1.0, 2.0, 3.0])
+    assert reader.get(key).tolist() == [1.0, 2.0, 3.0]
+    # a wrong dimension is ignored
+    writer.put(key, [1.0, 2.0])
+    assert reader.get(key).tolist() == [1.0, 2.0, 3.0]
+    with pytest.raises(ValueError):
+        SharedEmbeddingStore(path, slots=16, dimension=3)
+
+
+@needs_flock
+def test_shared_hits_fill_the_local_cache(tmp_path):
+    shared = SharedEmbeddingStore(str(tmp_path / "cache.bin"), slots=8, dimension=3)
+    first, second = QueryEmbeddingCache(shared=shared), QueryEmbeddingCache(shared=shared)
+    key = first.key("daily offers")
+    first.put(key, [0.5, 0.5, 0.0])
+    assert second.get(key).tolist() == [0.5, 0.5, 0.0]
+    assert second.get(key) is not None
+    assert second.stats()["shared_hits"] == 1 and second.stats()["hits"] == 1
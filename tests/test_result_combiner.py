@@ -0,0 +1,72 @@
+import pytest
+
+from scripts.result_combiner import combine_and_rank_results, fuse_lexical_results
+
+
+def _vector(ids, distances):
+    return {
+        "ids": [ids],
+        "documents": [[f"doc {i}" for i in ids]],
+        "metadatas": [[{"source": "jazz"} for _ in ids]],
+        "distances": [distances],
+    }
+
+
+def _lexical(ids, scores):
+    return {
+        "ids": [ids],
+        "documents": [[f"doc {i}" for i in ids]],
+        "metadatas": [[{"source": "jazz"} for _ in ids]],
+        "scores": [scores],
+    }
+
+
+def test_collections_are_merged_by_distance():
+    combined = combine_and_rank_results([_vector(["a", "b"], [0.5, 0.9]), _vector(["c"], [0.7])])
+    assert combined["ids"] == ["a", "c", "b"]
+    assert combined["distances"] == [0.5, 0.7, 0.9]
+    assert "scores" not in combined
+
+
+def test_rrf_ranks_documents_found_by_both_first():
+    fused = combine_and_rank_results(
+        [_vector(["a", "b", "c"], [0.3, 0.5, 0.7])], [_lexical(["c", "d"], [8.0, 4.0])]
+    )
+    assert fused["ids"][:2] == ["c", "a"]
+    # second place in either ranking scores the same
+    assert sorted(fused["ids"][2:]) == ["b", "d"]
+    assert fused["scores"][0] == pytest.approx(1 / 63 + 1 / 61)
+    assert fused["scores"] == sorted(fused["scores"], reverse=True)
+
+
+def test_lexical_only_hits_have_no_distance():
+    fused = combine_and_rank_results([_vector(["a"], [0.4])], [_lexical(["b"], [3.0])])
+    distances = dict(zip(fused["ids"], fused["distances"]))
+    assert distances == {"a": 0.4, "b": None}
+
+
+def test_documents_are_deduplicated_by_id():
+    fused = combine_and_rank_results(
+        [_vector(["a", "b"], [0.2, 0.4]), _vector(["a"], [0.3])],
+        [_lexical(["a", "b"], [5.0, 1.0]), _lexical(["a"], [2.0])],
+    )
+    assert sorted(fused["ids"]) == ["a", "b"]
+    # the best vector distance of a document is kept
+    assert dict(zip(fused["ids"], fused["distances"]))["a"] == 0.2
+
+
+def test_weighted_fusion():
+    combined = combine_and_rank_results([_vector(["a", "b"], [0.0, 1.0])])
+    fused = fuse_lexical_results(combined, [_lexical(["b"], [2.0])], fusion="weighted", vector_weight=0.5)
+    scores = dict(zip(fused["ids"], fused["scores"]))
+    # 0.5 * (1 - d/2) + 0.5 * bm25 / max_bm25
+    assert scores["a"] == pytest.approx(0.5)
+    assert scores["b"] == pytest.approx(0.75)
+    assert fused["ids"] == ["b", "a"]
+
+
+def test_without_lexical_hits_the_vector_order_is_kept():
+    combined = combine_and_rank_results([_vector(["a", "b"], [0.1, 0.2])])
+    fused = fuse_lexical_results(combined, [])
+    assert fused["ids"] == ["a", "b"]
+    assert fused["distances"] == [0.1, 0.2]
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+# the scraper needs the browser stack; these tests run where it can
+pytest.importorskip("dotenv")
+pytest.importorskip("agentql")
+pytest.importorskip("playwright")
+
+from scripts.propakistani_jazz_scraper import (  # noqa: E402
+    compute_delta,
+    fetch_package_details,
+    parse_detail_page,
+    row_content_hash,
+    scrape_propakistani_jazz,
+    serve_fixtures,
+    should_block,
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "propakistani")
+
+
+@pytest.fixture
+def fixture_server():
+    server, base_url = serve_fixtures(FIXTURES)
+    yield base_url
+    server.shutdown()
+
+
+def _row(key, *cells):
+    return {"row_key": f"Weekly:{key}", "row_hash": row_content_hash(key, list(cells))}
+
+
+def test_row_content_hash():
+    assert row_content_hash("101", ["Weekly Super", " Rs.250 "]) == row_content_hash("101", ["Weekly Super", "Rs.250"])
+    assert row_content_hash("101", ["Weekly Super", "Rs.250"]) != row_content_hash("101", ["Weekly Super", "Rs.260"])
+    assert row_content_hash("101", ["Weekly Super"]) != row_content_hash("102", ["Weekly Super"])
+
+
+def test_compute_delta():
+    previous = [_row("1", "Daily", "Rs.20"), _row("2", "Weekly", "Rs.250"), _row("3", "Monthly", "Rs.900")]
+    current = [_row("1", "Daily", "Rs.20"), _row("2", "Weekly", "Rs.260"), _row("4", "Hourly", "Rs.5")]
+    delta = compute_delta(previous, current)
+    assert [p["row_key"] for p in delta["added"]] == ["Weekly:4"]
+    assert [p["row_key"] for p in delta["changed"]] == ["Weekly:2"]
+    assert [p["row_key"] for p in delta["removed"]] == ["Weekly:3"]
+    assert delta["unchanged"] == 1
+    assert compute_delta([], current)["added"] == current
+
+
+def test_should_block():
+    assert should_block("image", "http://127.0.0.1/hero.png")
+    assert should_block("font", "http://127.0.0.1/font.woff2")
+    assert should_block("script", "https://securepubads.g.doubleclick.net/tag/js/gpt.js")
+    assert not should_block("document", "http://127.0.0.1/weekly-super.html")
+    assert not should_block("script", "http://127.0.0.1/app.js")
+
+
+def test_parse_detail_page_prefers_mechanics():
+    details = parse_detail_page({
+        "mechanics": "Mechanics\nDial *345# to subscribe",
+        "descriptions": ["", "too short", "A description that is long enough to be kept as the package text."],
+        "terms": "Tax inclusive.",
+        "content": "<p>Old code *999#</p>",
+    })
+    assert details == {
+        "subscription_code": "*345#",
+        "description": "A description that is long enough to be kept as the package text.",
+        "terms_conditions": "Tax inclusive.",
+    }
+    assert parse_detail_page({"descriptions": []}) == {"subscription_code": "Not found"}
+
+
+def test_fetch_package_details_from_fixtures(fixture_server, capfd):
+    packages = [
+        {"package_name": "Weekly Super Plus", "package_url": f"{fixture_server}/weekly-super.html"},
+        {"package_name": "Weekly SMS Bundle", "package_url": f"{fixture_server}/weekly-sms.html"},
+        {"package_name": "No Page", "package_url": None},
+    ]
+    asyncio.run(fetch_package_details(packages, workers=2, min_interval=0, timeout_ms=10000))
+
+    super_plus, sms, no_page = packages
+    assert super_plus["subscription_code"] == "SUB *3450#"
+    assert super_plus["description"].startswith("Jazz Weekly Super Plus gives 30 GB")
+    assert super_plus["terms_conditions"].startswith("Prices are inclusive of tax.")
+    assert super_plus["details_fetched"] is True
+    assert sms["subscription_code"] == "Not found" and "description" not in sms
+    assert "details_fetched" not in no_page
+    # the image never reached the fixture server
+    assert "hero.png" not in capfd.readouterr().err
+
+
+def test_scrape_listing_from_fixtures(fixture_server, tmp_path):
+    output_path = str(tmp_path / "packages.json")
+    packages = scrape_propakistani_jazz(
+        f"{fixture_server}/index.html", workers=1, min_interval=0, output_path=output_path, use_agentql=False
+    )
+    assert [p["package_name"] for p in packages] == ["Weekly Super Plus", "Weekly SMS Bundle"]
+    super_plus = packages[0]
+    assert super_plus["category"] == "Weekly"
+    assert super_plus["row_key"] == "Weekly:101"
+    assert (super_plus["onnet_mins"], super_plus["sms"], super_plus["validity"], super_plus["price_rs"]) == (
+        "1000", "1000", "7 Days", "250"
+    )
+    assert super_plus["subscription_code"] == "SUB *3450#"
+    with open(output_path, encoding="utf-8") as f:
+        assert json.load(f) == packages
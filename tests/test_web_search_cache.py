@@ -0,0 +1,94 @@
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from scripts.web_search_cache import WebSearchCache
+
+
+class GatedFetch:
+    """fetch() that blocks until the gate opens, then returns result (or raises error)"""
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.entered.set()
+        assert self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _wait_for(condition):
+    deadline = time.time() + 5
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def _concurrent_misses(cache, fetch, n):
+    """Start n get_or_fetch calls for one key while the first one's fetch is blocked"""
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=n)
+    futures = [pool.submit(cache.get_or_fetch, "jazz weekly", fetch)]
+    assert fetch.entered.wait(5)
+    futures += [pool.submit(cache.get_or_fetch, "jazz weekly", fetch) for _ in range(n - 1)]
+    _wait_for(lambda: cache.coalesced == n - 1)
+    fetch.gate.set()
+    return pool, futures
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache = WebSearchCache()
+    fetch = GatedFetch(result=[{"title": "Weekly"}])
+    pool, futures = _concurrent_misses(cache, fetch, 5)
+    with pool:
+        assert [future.result(timeout=5) for future in futures] == [[{"title": "Weekly"}]] * 5
+    assert fetch.calls == 1
+    assert cache.stats()["misses"] == 1 and cache.stats()["coalesced"] == 4
+    # and the result is cached
+    assert cache.get_or_fetch("jazz weekly", fetch) == [{"title": "Weekly"}]
+    assert fetch.calls == 1 and cache.hits == 1
+
+
+def test_stale_entry_is_served_while_it_refreshes():
+    cache = WebSearchCache(ttl=0.01, stale_ttl=60)
+    assert cache.get_or_fetch("jazz weekly", lambda: ["old"]) == ["old"]
+    time.sleep(0.02)
+
+    refresh = GatedFetch(result=["new"])
+    # returned right away, the refresh is still blocked
+    assert cache.get_or_fetch("jazz weekly", refresh) == ["old"]
+    assert refresh.entered.wait(5)
+    assert cache.get_or_fetch("jazz weekly", refresh) == ["old"]
+    assert cache.stale_hits == 2
+    refresh.gate.set()
+    _wait_for(lambda: cache._entries["jazz weekly"]["results"] == ["new"])
+    assert refresh.calls == 1
+    assert cache.get_or_fetch("jazz weekly", refresh) == ["new"]
+
+
+def test_fetch_error_reaches_every_waiter_and_is_not_cached():
+    cache = WebSearchCache()
+    fetch = GatedFetch(error=RuntimeError("search failed"))
+    pool, futures = _concurrent_misses(cache, fetch, 4)
+    with pool:
+        for future in futures:
+            with pytest.raises(RuntimeError, match="search failed"):
+                future.result(timeout=5)
+    assert fetch.calls == 1
+    assert cache.get_or_fetch("jazz weekly", lambda: ["retried"]) == ["retried"]
+    assert cache.stats()["misses"] == 2
+
+
+def test_empty_results_are_not_cached():
+    cache = WebSearchCache()
+    assert cache.get_or_fetch("jazz weekly", lambda: []) == []
+    assert cache.get_or_fetch("jazz weekly", lambda: ["found"]) == ["found"]
+    assert cache.stats()["entries"] == 1